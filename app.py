@@ -1,23 +1,48 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, make_response, g, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, send_file, abort
 from config import Config
-from models import db, Car, Employee, Document, CarFile, EmployeeFile, DocumentFile, User, AuditLog, CompanySettings, MaintenanceRecord, Equipment, FuelRecord, EquipmentMaintenance, SalarySettings, EmployeeSalary, AttendanceRecord, OvertimeRecord, AdvancePayment, PayrollRecord
+from models import db, Car, Employee, Document, CarFile, EmployeeFile, DocumentFile, User, AuditLog, CompanySettings, MaintenanceRecord, Equipment, FuelRecord, EquipmentMaintenance, SalarySettings, EmployeeSalary, AttendanceRecord, AdvancePayment, PayrollRecord
 from utils import save_file, log_activity, allowed_file
+from pagination import paginate_request
+from search import apply_search, ensure_search_index, rebuild_search_index
+from database import init_database
+from query_plans import check_query_plans
+from dashboard_metrics import get_metrics, recompute_metrics
+from notifications import notification_feed, scan_document_expiry
+from file_store import file_store, send_upload
+from stock_ledger import post_voucher, stock_balances, take_stock_snapshot, snapshot_day
+from bootstrap import bootstrap_app, run_migrations, current_schema_version
+from instrumentation import instrumentation
+from settings_cache import settings_cache, get_company_settings, get_salary_settings
+from audit import audit_writer
+from pdf_service import pdf_service, pdf_response, PdfServiceBusy, PdfRenderError
+from backup import run_backup, restore_backup, export_backup_zip, list_backups, delete_backup as remove_backup
+from exports import export_response, format_date, EXPORT_BATCH_SIZE
+from imports import import_file, report_path, IMPORT_SPECS, ImportFileError
+from payroll import run_weekly_payroll, upsert_attendance_sheet, insert_overtime_sheet
+from fuel_analytics import (refresh_fuel_efficiency, refresh_fuel_baselines, fleet_efficiency, equipment_efficiency, equipment_segments, reading_analytics,
+                            meter_unit, UNIT_LABELS, DISTANCE_LABELS)
+from maintenance_forecast import refresh_maintenance_forecast, upcoming_maintenance, upcoming_maintenance_count, FORECAST_DASHBOARD_LIMIT
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
 from datetime import datetime, date, timedelta
-import pandas as pd
-import pdfkit
-import zipfile
-import shutil
-import io
+import tempfile
+import hmac
 import os
+import click
 from apscheduler.schedulers.background import BackgroundScheduler
 from werkzeug.utils import secure_filename
-from openpyxl.styles import Font, Alignment
+from werkzeug.security import safe_join
+from sqlalchemy.orm import joinedload, selectinload
 
 app = Flask(__name__)
 app.config.from_object(Config)
-db.init_app(app)
+init_database(app)
+instrumentation.init_app(app)
+settings_cache.init_app(app)
+audit_writer.init_app(app)
+pdf_service.init_app(app)
+notification_feed.init_app(app)
+file_store.init_app(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -29,48 +54,90 @@ login_manager.login_message_category = "warning"
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-@app.before_request
-def create_tables_once():
-    if not hasattr(g, 'tables_created'):
-        db.create_all()
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'cars'), exist_ok=True)
-        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'employees'), exist_ok=True)
-        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'documents'), exist_ok=True)
-        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'logos'), exist_ok=True)
-        if not CompanySettings.query.first():
-            settings = CompanySettings()
-            db.session.add(settings)
-            db.session.commit()
-        g.tables_created = True
+@app.cli.command('migrate')
+def migrate_command():
+    """تنفيذ ترحيلات قاعدة البيانات التي لم تُنفذ بعد."""
+    for version, name, duration_ms in run_migrations():
+        print(f"[Migrate] {version} - {name}: {duration_ms} ms")
+    print(f"[Migrate] إصدار المخطط الحالي: {current_schema_version()}")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """فحص خطط تنفيذ الاستعلامات المتكررة، والخروج برمز 1 إذا قرأ أي منها جدولاً كاملاً."""
+    if db.engine.dialect.name != 'sqlite':
+        print("[Query Plans] الفحص متاح لقاعدة SQLite فقط")
+        return
+    failed = []
+    for name, (status, plans, scans) in check_query_plans(app).items():
+        ok = status == 200 and not scans
+        print(f"[Query Plans] {'ok' if ok else 'FAIL'} {name}: الحالة {status}، {len(plans)} استعلام")
+        for statement, plan in plans:
+            if any(detail in scans for detail in plan):
+                print(f"[Query Plans]     {' '.join(statement.split())[:150]}: {' | '.join(plan)}")
+        if not ok:
+            failed.append(name)
+    if failed:
+        print(f"[Query Plans] قراءة جدول كامل في: {', '.join(failed)}")
+        raise SystemExit(1)
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(list(IMPORT_SPECS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_data_command(kind, path):
+    """استيراد موظفين أو سيارات أو معدات أو مواد من ملف xlsx/csv."""
+    with open(path, 'rb') as f:
+        try:
+            result = import_file(kind, f, path, get_company_name())
+        except ImportFileError as e:
+            print(f"[Import Error] {e}")
+            raise SystemExit(1)
+    print(f"[Import] {result['imported']} من {result['total']} صف، {result['failed']} مرفوض")
+    for line_number, message in result['errors']:
+        print(f"[Import] الصف {line_number}: {message}")
+    if result['report']:
+        print(f"[Import] تقرير الأخطاء: {report_path(result['report'])}")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """إعادة بناء فهرس البحث النصي للسيارات والموظفين والوثائق والمعدات."""
+    ensure_search_index()
+    for model_name, count in rebuild_search_index().items():
+        print(f"[Search] {model_name}: {count}")
+
+@app.cli.command('refresh-fuel-efficiency')
+def refresh_fuel_efficiency_command():
+    """إعادة حساب ملخص استهلاك الوقود لكل المعدات من سجلات الوقود."""
+    print(f"[Fuel] {refresh_fuel_efficiency()} معدة، {refresh_fuel_baselines()} خط أساس")
+
+@app.cli.command('refresh-maintenance-forecast')
+def refresh_maintenance_forecast_command():
+    """إعادة بناء جدول الصيانة المتوقعة لكل المعدات."""
+    print(f"[Forecast] {refresh_maintenance_forecast()} معدة مجدولة")
 
 # الصفحة الرئيسية - لوحة التحكم
 @app.route('/')
 @login_required
 def index():
-    # مؤشرات الأداء
-    total_equipment_count = Equipment.query.count()
-    active_equipment_count = Equipment.query.filter_by(status='active').count()
+    # مؤشرات الأداء (محدثة مسبقاً في جدول dashboard_metric)
+    metrics = get_metrics()
+    # أقرب مواعيد الصيانة المتوقعة (جدول maintenance_forecast مرتب بفهرس تاريخ الاستحقاق)
+    forecast_days = app.config['MAINTENANCE_FORECAST_DAYS']
     # إنتاج اليوم (ستتم إضافته في المرحلة الثانية)
     today_production = 0
-    # معدات تحتاج صيانة
-    maintenance_alerts = Equipment.query.filter(
-        Equipment.next_maintenance_km != None,
-        Equipment.current_km >= Equipment.next_maintenance_km
-    ).all()
-    maintenance_alerts_count = len(maintenance_alerts)
     # مبيعات اليوم (ستتم إضافته في المرحلة الثانية)
     today_sales = 0
-    settings = CompanySettings.query.first()
     current_time = datetime.now()
     return render_template('index.html', 
-                         total_equipment_count=total_equipment_count,
-                         active_equipment_count=active_equipment_count,
+                         total_equipment_count=metrics['total_equipment'],
+                         active_equipment_count=metrics['active_equipment'],
                          today_production=today_production,
-                         maintenance_alerts=maintenance_alerts,
-                         maintenance_alerts_count=maintenance_alerts_count,
+                         maintenance_alerts_count=metrics['overdue_maintenance'],
+                         expiring_documents_count=metrics['expiring_documents'],
+                         low_stock_count=metrics['low_stock_items'],
+                         forecast_days=forecast_days,
+                         upcoming_maintenance=upcoming_maintenance(forecast_days, FORECAST_DASHBOARD_LIMIT),
+                         upcoming_maintenance_count=upcoming_maintenance_count(forecast_days),
                          today_sales=today_sales,
-                         settings=settings,
                          current_time=current_time)
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -112,12 +179,9 @@ def init_admin():
         return "يوجد مستخدمون مسبقاً."
 
 def get_document_folders():
-    base_path = os.path.join(app.config['UPLOAD_FOLDER'], 'documents')
+    # المجلد تصنيف في سجل الوثيقة (الملفات نفسها في مخزن الملفات وليست في مجلدات)
     folders = ['عام']
-    if os.path.exists(base_path):
-        for item in os.listdir(base_path):
-            if os.path.isdir(os.path.join(base_path, item)):
-                folders.append(item)
+    folders += [folder for folder, in db.session.query(Document.folder).distinct() if folder]
     return sorted(set(folders))
 
 # --- إدارة السيارات ---
@@ -125,21 +189,21 @@ def get_document_folders():
 @login_required
 def car_list():
     query = request.args.get('q', '').strip()
+    cars = Car.query
+    sort_columns = {
+        'id': Car.id,
+        'unique_id': Car.unique_id,
+        'brand': Car.brand,
+        'chassis_number': Car.chassis_number
+    }
+    default_sort = 'id'
     if query:
-        cars = Car.query.filter(
-            db.or_(
-                Car.chassis_number.ilike(f'%{query}%'),
-                Car.brand.ilike(f'%{query}%'),
-                Car.model.ilike(f'%{query}%'),
-                Car.plate_number.ilike(f'%{query}%'),
-                Car.color.ilike(f'%{query}%'),
-                Car.notes.ilike(f'%{query}%')
-            )
-        ).all()
-    else:
-        cars = Car.query.all()
-    settings = CompanySettings.query.first()
-    return render_template('car/list.html', cars=cars, search_query=query, settings=settings)
+        cars, rank = apply_search(cars, Car, query)
+        if rank is not None:
+            sort_columns['rank'] = rank
+            default_sort = 'rank'
+    page = paginate_request(cars, sort_columns, default_sort)
+    return render_template('car/list.html', cars=page.items, page=page, search_query=query)
 
 @app.route('/cars/add', methods=['GET', 'POST'])
 @login_required
@@ -172,24 +236,22 @@ def add_car():
         db.session.commit()
         files = request.files.getlist('files')
         for file in files:
-            filename, filepath = save_file(file, os.path.join(app.config['UPLOAD_FOLDER'], 'cars'), car.unique_id)
+            filename, filepath, content_hash = save_file(file)
             if filename:
                 file_type = 'image' if filename.lower().endswith(('png','jpg','jpeg')) else 'pdf'
-                car_file = CarFile(filename=filename, filepath=filepath, file_type=file_type, car_id=car.id)
+                car_file = CarFile(filename=filename, filepath=filepath, content_hash=content_hash, file_type=file_type, car_id=car.id)
                 db.session.add(car_file)
         db.session.commit()
         log_activity(current_user, 'create', 'Car', car.id, f"أضاف سيارة: {brand} {model}")
         flash('تم إضافة السيارة بنجاح!')
         return redirect(url_for('car_list'))
-    settings = CompanySettings.query.first()
-    return render_template('car/add.html', settings=settings)
+    return render_template('car/add.html')
 
 @app.route('/cars/<int:car_id>')
 @login_required
 def car_detail(car_id):
-    car = Car.query.get_or_404(car_id)
-    settings = CompanySettings.query.first()
-    return render_template('car/detail.html', car=car, settings=settings)
+    car = Car.query.options(selectinload(Car.files), selectinload(Car.maintenance_records)).get_or_404(car_id)
+    return render_template('car/detail.html', car=car)
 
 @app.route('/cars/<int:car_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -198,7 +260,6 @@ def edit_car(car_id):
         flash('ليس لديك صلاحية تعديل السيارات.', 'danger')
         return redirect(url_for('car_list'))
     car = Car.query.get_or_404(car_id)
-    settings = CompanySettings.query.first()
     if request.method == 'POST':
         car.chassis_number = request.form['chassis_number']
         car.brand = request.form['brand']
@@ -211,16 +272,16 @@ def edit_car(car_id):
         car.notes = request.form.get('notes')
         files = request.files.getlist('files')
         for file in files:
-            filename, filepath = save_file(file, os.path.join(app.config['UPLOAD_FOLDER'], 'cars'), car.unique_id)
+            filename, filepath, content_hash = save_file(file)
             if filename:
                 file_type = 'image' if filename.lower().endswith(('png','jpg','jpeg')) else 'pdf'
-                car_file = CarFile(filename=filename, filepath=filepath, file_type=file_type, car_id=car.id)
+                car_file = CarFile(filename=filename, filepath=filepath, content_hash=content_hash, file_type=file_type, car_id=car.id)
                 db.session.add(car_file)
         db.session.commit()
         log_activity(current_user, 'update', 'Car', car.id, f"عدل سيارة: {car.brand} {car.model}")
         flash('تم تعديل السيارة بنجاح!', 'success')
         return redirect(url_for('car_detail', car_id=car.id))
-    return render_template('car/edit.html', car=car, settings=settings)
+    return render_template('car/edit.html', car=car)
 
 @app.route('/cars/<int:car_id>/delete', methods=['POST'])
 @login_required
@@ -231,7 +292,8 @@ def delete_car(car_id):
     car = Car.query.get_or_404(car_id)
     car_title = f"{car.brand} {car.model}"
     for file in car.files:
-        if os.path.exists(file.filepath):
+        # ملفات المخزن تُحذف عندما لا يبقى لها أي سجل (file_store.collect_garbage)
+        if not file.content_hash and os.path.exists(file.filepath):
             os.remove(file.filepath)
     db.session.delete(car)
     db.session.commit()
@@ -242,18 +304,9 @@ def delete_car(car_id):
 @app.route('/cars/<int:car_id>/pdf')
 @login_required
 def car_pdf(car_id):
-    car = Car.query.get_or_404(car_id)
-    settings = CompanySettings.query.first()
-    html = render_template('car/pdf.html', car=car, settings=settings)
-    pdf = pdfkit.from_string(html, False, options={
-        'encoding': 'UTF-8',
-        'enable-local-file-access': '',
-        'quiet': ''
-    })
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=car_{car.unique_id}.pdf'
-    return response
+    car = Car.query.options(selectinload(Car.files)).get_or_404(car_id)
+    html = render_template('car/pdf.html', car=car)
+    return pdf_response(html, f'car_{car.unique_id}.pdf')
 
 # --- إدارة سجلات الصيانة للسيارات ---
 @app.route('/cars/<int:car_id>/maintenance/add', methods=['GET', 'POST'])
@@ -281,8 +334,7 @@ def add_maintenance(car_id):
         log_activity(current_user, 'create', 'MaintenanceRecord', record.id, f"أضاف صيانة: {maintenance_type} للسيارة {car.brand} {car.model}")
         flash('تم إضافة سجل الصيانة بنجاح!', 'success')
         return redirect(url_for('car_detail', car_id=car_id))
-    settings = CompanySettings.query.first()
-    return render_template('car/maintenance_add.html', car=car, settings=settings)
+    return render_template('car/maintenance_add.html', car=car)
 
 @app.route('/cars/<int:car_id>/maintenance/<int:record_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -302,8 +354,7 @@ def edit_maintenance(car_id, record_id):
         log_activity(current_user, 'update', 'MaintenanceRecord', record.id, f"عدل صيانة: {record.maintenance_type} للسيارة {car.brand} {car.model}")
         flash('تم تعديل سجل الصيانة بنجاح!', 'success')
         return redirect(url_for('car_detail', car_id=car_id))
-    settings = CompanySettings.query.first()
-    return render_template('car/maintenance_edit.html', car=car, record=record, settings=settings)
+    return render_template('car/maintenance_edit.html', car=car, record=record)
 
 @app.route('/cars/<int:car_id>/maintenance/<int:record_id>/delete', methods=['POST'])
 @login_required
@@ -324,22 +375,21 @@ def delete_maintenance(car_id, record_id):
 @login_required
 def employee_list():
     query = request.args.get('q', '').strip()
+    employees = Employee.query
+    sort_columns = {
+        'id': Employee.id,
+        'unique_id': Employee.unique_id,
+        'full_name': Employee.full_name,
+        'national_id': Employee.national_id
+    }
+    default_sort = 'id'
     if query:
-        employees = Employee.query.filter(
-            db.or_(
-                Employee.full_name.ilike(f'%{query}%'),
-                Employee.national_id.ilike(f'%{query}%'),
-                Employee.department.ilike(f'%{query}%'),
-                Employee.position.ilike(f'%{query}%'),
-                Employee.phone.ilike(f'%{query}%'),
-                Employee.email.ilike(f'%{query}%'),
-                Employee.notes.ilike(f'%{query}%')
-            )
-        ).all()
-    else:
-        employees = Employee.query.all()
-    settings = CompanySettings.query.first()
-    return render_template('employee/list.html', employees=employees, search_query=query, settings=settings)
+        employees, rank = apply_search(employees, Employee, query)
+        if rank is not None:
+            sort_columns['rank'] = rank
+            default_sort = 'rank'
+    page = paginate_request(employees, sort_columns, default_sort)
+    return render_template('employee/list.html', employees=page.items, page=page, search_query=query)
 
 @app.route('/employees/add', methods=['GET', 'POST'])
 @login_required
@@ -384,24 +434,22 @@ def add_employee():
         db.session.commit()
         files = request.files.getlist('files')
         for file in files:
-            filename, filepath = save_file(file, os.path.join(app.config['UPLOAD_FOLDER'], 'employees'), emp.unique_id)
+            filename, filepath, content_hash = save_file(file)
             if filename:
                 file_type = 'image' if filename.lower().endswith(('png','jpg','jpeg')) else 'pdf'
-                emp_file = EmployeeFile(filename=filename, filepath=filepath, file_type=file_type, employee_id=emp.id)
+                emp_file = EmployeeFile(filename=filename, filepath=filepath, content_hash=content_hash, file_type=file_type, employee_id=emp.id)
                 db.session.add(emp_file)
         db.session.commit()
         log_activity(current_user, 'create', 'Employee', emp.id, f"أضاف موظف: {full_name}")
         flash('تم إضافة الموظف بنجاح!')
         return redirect(url_for('employee_list'))
-    settings = CompanySettings.query.first()
-    return render_template('employee/add.html', settings=settings)
+    return render_template('employee/add.html')
 
 @app.route('/employees/<int:employee_id>')
 @login_required
 def employee_detail(employee_id):
-    employee = Employee.query.get_or_404(employee_id)
-    settings = CompanySettings.query.first()
-    return render_template('employee/detail.html', employee=employee, settings=settings)
+    employee = Employee.query.options(selectinload(Employee.files)).get_or_404(employee_id)
+    return render_template('employee/detail.html', employee=employee)
 
 @app.route('/employees/<int:employee_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -410,7 +458,6 @@ def edit_employee(employee_id):
         flash('ليس لديك صلاحية تعديل الموظفين.', 'danger')
         return redirect(url_for('employee_list'))
     employee = Employee.query.get_or_404(employee_id)
-    settings = CompanySettings.query.first()
     if request.method == 'POST':
         employee.full_name = request.form['full_name']
         employee.national_id = request.form['national_id']
@@ -425,16 +472,16 @@ def edit_employee(employee_id):
         employee.notes = request.form.get('notes')
         files = request.files.getlist('files')
         for file in files:
-            filename, filepath = save_file(file, os.path.join(app.config['UPLOAD_FOLDER'], 'employees'), employee.unique_id)
+            filename, filepath, content_hash = save_file(file)
             if filename:
                 file_type = 'image' if filename.lower().endswith(('png','jpg','jpeg')) else 'pdf'
-                emp_file = EmployeeFile(filename=filename, filepath=filepath, file_type=file_type, employee_id=employee.id)
+                emp_file = EmployeeFile(filename=filename, filepath=filepath, content_hash=content_hash, file_type=file_type, employee_id=employee.id)
                 db.session.add(emp_file)
         db.session.commit()
         log_activity(current_user, 'update', 'Employee', employee.id, f"عدل موظف: {employee.full_name}")
         flash('تم تعديل الموظف بنجاح!', 'success')
         return redirect(url_for('employee_detail', employee_id=employee.id))
-    return render_template('employee/edit.html', employee=employee, settings=settings)
+    return render_template('employee/edit.html', employee=employee)
 
 @app.route('/employees/<int:employee_id>/delete', methods=['POST'])
 @login_required
@@ -445,7 +492,8 @@ def delete_employee(employee_id):
     employee = Employee.query.get_or_404(employee_id)
     emp_name = employee.full_name
     for file in employee.files:
-        if os.path.exists(file.filepath):
+        # ملفات المخزن تُحذف عندما لا يبقى لها أي سجل (file_store.collect_garbage)
+        if not file.content_hash and os.path.exists(file.filepath):
             os.remove(file.filepath)
     db.session.delete(employee)
     db.session.commit()
@@ -456,18 +504,9 @@ def delete_employee(employee_id):
 @app.route('/employees/<int:employee_id>/pdf')
 @login_required
 def employee_pdf(employee_id):
-    employee = Employee.query.get_or_404(employee_id)
-    settings = CompanySettings.query.first()
-    html = render_template('employee/pdf.html', employee=employee, settings=settings)
-    pdf = pdfkit.from_string(html, False, options={
-        'encoding': 'UTF-8',
-        'enable-local-file-access': '',
-        'quiet': ''
-    })
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=employee_{employee.unique_id}.pdf'
-    return response
+    employee = Employee.query.options(selectinload(Employee.files)).get_or_404(employee_id)
+    html = render_template('employee/pdf.html', employee=employee)
+    return pdf_response(html, f'employee_{employee.unique_id}.pdf')
 
 # --- إدارة الوثائق ---
 @app.route('/documents')
@@ -478,21 +517,21 @@ def document_list():
     documents = Document.query
     if folder_filter:
         documents = documents.filter(Document.folder == folder_filter)
+    sort_columns = {
+        'id': Document.id,
+        'unique_id': Document.unique_id,
+        'title': Document.title,
+        'created_at': Document.created_at
+    }
+    default_sort = 'id'
     if query:
-        documents = documents.filter(
-            db.or_(
-                Document.title.ilike(f'%{query}%'),
-                Document.doc_type.ilike(f'%{query}%'),
-                Document.source.ilike(f'%{query}%'),
-                Document.folder.ilike(f'%{query}%'),
-                Document.notes.ilike(f'%{query}%'),
-                Document.unique_id.ilike(f'%{query}%')
-            )
-        )
-    documents = documents.all()
+        documents, rank = apply_search(documents, Document, query)
+        if rank is not None:
+            sort_columns['rank'] = rank
+            default_sort = 'rank'
+    page = paginate_request(documents, sort_columns, default_sort)
     folders = get_document_folders()
-    settings = CompanySettings.query.first()
-    return render_template('document/list.html', documents=documents, search_query=query, folders=folders, settings=settings)
+    return render_template('document/list.html', documents=page.items, page=page, search_query=query, folders=folders)
 
 @app.route('/documents/add', methods=['GET', 'POST'])
 @login_required
@@ -501,7 +540,6 @@ def add_document():
         flash('ليس لديك صلاحية لإضافة وثائق.', 'danger')
         return redirect(url_for('document_list'))
     folders = get_document_folders()
-    settings = CompanySettings.query.first()
     if request.method == 'POST':
         title = request.form['title']
         doc_type = request.form.get('doc_type')
@@ -537,26 +575,24 @@ def add_document():
         )
         db.session.add(doc)
         db.session.commit()
-        folder_path = os.path.join(app.config['UPLOAD_FOLDER'], 'documents', folder)
         files = request.files.getlist('files')
         for file in files:
-            filename, filepath = save_file(file, folder_path, doc.unique_id)
+            filename, filepath, content_hash = save_file(file)
             if filename:
                 file_type = 'image' if filename.lower().endswith(('png','jpg','jpeg')) else 'pdf'
-                doc_file = DocumentFile(filename=filename, filepath=filepath, file_type=file_type, document_id=doc.id)
+                doc_file = DocumentFile(filename=filename, filepath=filepath, content_hash=content_hash, file_type=file_type, document_id=doc.id)
                 db.session.add(doc_file)
         db.session.commit()
         log_activity(current_user, 'create', 'Document', doc.id, f"أضاف وثيقة: {title}")
         flash('تم إضافة الوثيقة بنجاح!')
         return redirect(url_for('document_list'))
-    return render_template('document/add.html', folders=folders, settings=settings)
+    return render_template('document/add.html', folders=folders)
 
 @app.route('/documents/<int:document_id>')
 @login_required
 def document_detail(document_id):
-    document = Document.query.get_or_404(document_id)
-    settings = CompanySettings.query.first()
-    return render_template('document/detail.html', document=document, settings=settings)
+    document = Document.query.options(selectinload(Document.files)).get_or_404(document_id)
+    return render_template('document/detail.html', document=document)
 
 @app.route('/documents/<int:document_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -566,7 +602,6 @@ def edit_document(document_id):
         return redirect(url_for('document_list'))
     document = Document.query.get_or_404(document_id)
     folders = get_document_folders()
-    settings = CompanySettings.query.first()
     if request.method == 'POST':
         document.title = request.form['title']
         document.doc_type = request.form.get('doc_type')
@@ -580,19 +615,18 @@ def edit_document(document_id):
         new_folder = request.form.get('new_folder')
         if new_folder:
             document.folder = new_folder
-        folder_path = os.path.join(app.config['UPLOAD_FOLDER'], 'documents', document.folder)
         files = request.files.getlist('files')
         for file in files:
-            filename, filepath = save_file(file, folder_path, document.unique_id)
+            filename, filepath, content_hash = save_file(file)
             if filename:
                 file_type = 'image' if filename.lower().endswith(('png','jpg','jpeg')) else 'pdf'
-                doc_file = DocumentFile(filename=filename, filepath=filepath, file_type=file_type, document_id=document.id)
+                doc_file = DocumentFile(filename=filename, filepath=filepath, content_hash=content_hash, file_type=file_type, document_id=document.id)
                 db.session.add(doc_file)
         db.session.commit()
         log_activity(current_user, 'update', 'Document', document.id, f"عدل وثيقة: {document.title}")
         flash('تم تعديل الوثيقة بنجاح!', 'success')
         return redirect(url_for('document_detail', document_id=document.id))
-    return render_template('document/edit.html', document=document, folders=folders, settings=settings)
+    return render_template('document/edit.html', document=document, folders=folders)
 
 @app.route('/documents/<int:document_id>/delete', methods=['POST'])
 @login_required
@@ -603,7 +637,8 @@ def delete_document(document_id):
     document = Document.query.get_or_404(document_id)
     doc_title = document.title
     for file in document.files:
-        if os.path.exists(file.filepath):
+        # ملفات المخزن تُحذف عندما لا يبقى لها أي سجل (file_store.collect_garbage)
+        if not file.content_hash and os.path.exists(file.filepath):
             os.remove(file.filepath)
     db.session.delete(document)
     db.session.commit()
@@ -614,73 +649,190 @@ def delete_document(document_id):
 @app.route('/documents/<int:document_id>/pdf')
 @login_required
 def document_pdf(document_id):
-    document = Document.query.get_or_404(document_id)
-    settings = CompanySettings.query.first()
-    html = render_template('document/pdf.html', document=document, settings=settings)
-    pdf = pdfkit.from_string(html, False, options={
-        'encoding': 'UTF-8',
-        'enable-local-file-access': '',
-        'quiet': ''
-    })
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=document_{document.unique_id}.pdf'
-    return response
+    document = Document.query.options(selectinload(Document.files)).get_or_404(document_id)
+    html = render_template('document/pdf.html', document=document)
+    return pdf_response(html, f'document_{document.unique_id}.pdf')
+
+# --- أخطاء خدمة PDF ---
+@app.errorhandler(PdfServiceBusy)
+@app.errorhandler(PdfRenderError)
+def pdf_error(e):
+    if isinstance(e, PdfRenderError):
+        print(f"[PDF Error] {str(e)}")
+        flash('تعذر إنشاء ملف PDF، يرجى المحاولة مرة أخرى.', 'danger')
+    else:
+        flash(str(e), 'warning')
+    return redirect(request.referrer or url_for('index'))
+
+@app.route('/pdf/stats')
+@login_required
+def pdf_stats():
+    if not current_user.is_admin():
+        flash('ليس لديك صلاحية.', 'danger')
+        return redirect(url_for('index'))
+    return jsonify(pdf_service.stats())
+
+# --- قياس الأداء ---
+def _metrics_token_valid():
+    token = app.config.get('METRICS_TOKEN')
+    header = request.headers.get('Authorization', '')
+    return bool(token) and header.startswith('Bearer ') and hmac.compare_digest(header[7:], token)
+
+@app.route('/metrics')
+def metrics():
+    # للمدير، أو لـ Prometheus برمز METRICS_TOKEN
+    if not _metrics_token_valid():
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        if not current_user.is_admin():
+            abort(403)
+    gauges = {
+        f'pdf_{name}': (f'PDF service {name.replace("_", " ")}.', value)
+        for name, value in pdf_service.stats().items() if isinstance(value, (int, float))
+    }
+    gauges['schema_version'] = ('Applied database schema version.', current_schema_version())
+    return app.response_class(instrumentation.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow')
+@login_required
+def slow_requests():
+    if not current_user.is_admin():
+        flash('ليس لديك صلاحية.', 'danger')
+        return redirect(url_for('index'))
+    return jsonify(instrumentation.slow_requests())
 
 # --- خدمة الملفات ---
 @app.route('/uploads/<path:filename>')
 @login_required
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # الشعار والملفات القديمة التي لم تُنقل إلى المخزن
+    path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_upload(path, os.path.basename(path))
+
+@app.route('/files/<content_hash>/<path:filename>')
+@login_required
+def stored_file(content_hash, filename):
+    path = file_store.existing_path(content_hash)
+    if path is None:
+        abort(404)
+    return send_upload(path, filename, content_hash)
 
 # --- الإشعارات ---
 @app.route('/notifications')
 @login_required
 def notifications():
-    today = date.today()
-    next_week = today + timedelta(days=7)
-    expiring_docs = Document.query.filter(
-        Document.expiry_date.between(today, next_week),
-        Document.status != 'expired'
-    ).all()
-    expired_docs = Document.query.filter(
-        Document.expiry_date < today,
-        Document.status != 'expired'
-    ).all()
-    for doc in expired_docs:
-        doc.status = 'expired'
-    db.session.commit()
-    settings = CompanySettings.query.first()
+    # القائمة تحدثها مهمة scan_document_expiry المجدولة
+    items = notification_feed.items()
+    last_seen_id = current_user.last_seen_notification_id or 0
+    latest_id = notification_feed.latest_id()
+    if latest_id > last_seen_id:
+        current_user.last_seen_notification_id = latest_id
+        db.session.commit()
     return render_template('notifications.html',
-                         expiring_docs=expiring_docs,
-                         expired_docs=expired_docs,
-                         settings=settings)
+                         expiring_docs=[item for item in items if item['kind'] == 'expiring'],
+                         expired_docs=[item for item in items if item['kind'] == 'expired'],
+                         last_seen_id=last_seen_id)
 
 # --- النسخ الاحتياطي ---
+def backup_database_path():
+    # مسار ملف قاعدة البيانات الفعلي (instance/archive2.db) كما يحدده الإعداد
+    with app.app_context():
+        url = db.engine.url
+    return url.database if url.get_backend_name() == 'sqlite' else None
+
 def backup_system():
-    backup_dir = os.path.join(os.getcwd(), 'backups')
-    os.makedirs(backup_dir, exist_ok=True)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_filename = f"backup_{timestamp}.zip"
-    backup_path = os.path.join(backup_dir, backup_filename)
     try:
-        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            db_path = 'archive.db'
-            if os.path.exists(db_path):
-                zipf.write(db_path, arcname='archive.db')
-            uploads_path = app.config['UPLOAD_FOLDER']
-            if os.path.exists(uploads_path):
-                for root, dirs, files in os.walk(uploads_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, os.getcwd())
-                        zipf.write(file_path, arcname=arcname)
-        print(f"[Backup] تم إنشاء نسخة احتياطية: {backup_filename}")
+        manifest = run_backup(backup_database_path(), app.config['UPLOAD_FOLDER'], app.config['BACKUP_FOLDER'])
+        print(f"[Backup] تم إنشاء نسخة احتياطية: {manifest['name']} "
+              f"({manifest['added_files']} ملف جديد، {manifest['added_bytes'] / (1024*1024):.2f} MB، {manifest['duration_seconds']} ث)")
     except Exception as e:
         print(f"[Backup Error] {str(e)}")
 
+@app.cli.command('backup')
+def backup_command():
+    """إنشاء نسخة احتياطية تزايدية الآن."""
+    backup_system()
+
+@app.cli.command('restore-backup')
+@click.argument('name')
+@click.argument('target_dir')
+def restore_backup_command(name, target_dir):
+    """استعادة نسخة احتياطية (ملف manifest) إلى مجلد."""
+    manifest = restore_backup(app.config['BACKUP_FOLDER'], name, target_dir)
+    print(f"[Backup] تمت استعادة {manifest['name']} إلى {target_dir}")
+
+def check_dashboard_metrics():
+    # إعادة حساب مؤشرات لوحة التحكم من الصفر وتصحيح أي انحراف
+    try:
+        with app.app_context():
+            for metric, (stored, actual) in recompute_metrics().items():
+                print(f"[Metrics] تصحيح {metric}: {stored} -> {actual}")
+    except Exception as e:
+        print(f"[Metrics Error] {str(e)}")
+
+def fuel_baselines_job():
+    # وسيط الاستهلاك لكل نوع وللأسطول (خط الأساس في صفحة المعدة)
+    try:
+        with app.app_context():
+            refresh_fuel_baselines()
+    except Exception as e:
+        print(f"[Fuel Error] {str(e)}")
+
+def maintenance_forecast_job():
+    try:
+        with app.app_context():
+            count = refresh_maintenance_forecast()
+        print(f"[Forecast] جدول الصيانة المتوقعة: {count} معدة")
+    except Exception as e:
+        print(f"[Forecast Error] {str(e)}")
+
+def document_expiry_job():
+    try:
+        with app.app_context():
+            result = scan_document_expiry()
+        if result['expired'] or result['added'] or result['removed']:
+            print(f"[Notifications] منتهية: {result['expired']}، تنبيهات جديدة: {result['added']}، محذوفة: {result['removed']}")
+    except Exception as e:
+        print(f"[Notifications Error] {str(e)}")
+
+def stock_snapshot_job():
+    # لقطة رصيد نهاية الأمس بتوقيت UTC (أو نهاية الشهر السابق في أول كل شهر إذا كان الإعداد monthly)
+    day = snapshot_day()
+    if app.config['STOCK_SNAPSHOT_INTERVAL'] == 'monthly' and (day + timedelta(days=1)).day != 1:
+        return
+    try:
+        with app.app_context():
+            count = take_stock_snapshot(day)
+        print(f"[Stock] لقطة رصيد {day}: {count} سطر")
+    except Exception as e:
+        print(f"[Stock Error] {str(e)}")
+
+def upload_gc_job():
+    # حذف محتوى المخزن الذي لم يعد له أي سجل ملف
+    try:
+        with app.app_context():
+            removed = file_store.collect_garbage(scan_disk=True)
+        if removed:
+            print(f"[Uploads] حذف {removed} ملف غير مستخدم")
+    except Exception as e:
+        print(f"[Uploads Error] {str(e)}")
+
+@app.cli.command('gc-uploads')
+def gc_uploads_command():
+    """حذف ملفات المخزن التي لم يعد لها أي سجل."""
+    upload_gc_job()
+
 scheduler = BackgroundScheduler()
+scheduler.add_job(func=stock_snapshot_job, trigger="cron", hour=0, minute=30)
+scheduler.add_job(func=maintenance_forecast_job, trigger="cron", hour=0, minute=45)
+scheduler.add_job(func=fuel_baselines_job, trigger="cron", minute=10)
+scheduler.add_job(func=document_expiry_job, trigger="interval", minutes=app.config['NOTIFICATION_SCAN_MINUTES'])
 scheduler.add_job(func=backup_system, trigger="cron", hour=2, minute=0)
+scheduler.add_job(func=check_dashboard_metrics, trigger="cron", minute=0)
+scheduler.add_job(func=pdf_service.prune_cache, trigger="cron", hour=3, minute=0)
+scheduler.add_job(func=upload_gc_job, trigger="cron", hour=3, minute=30)
 scheduler.start()
 
 @app.route('/backups')
@@ -689,22 +841,8 @@ def backup_list():
     if not current_user.is_admin():
         flash('ليس لديك صلاحية الوصول لهذه الصفحة.', 'danger')
         return redirect(url_for('index'))
-    backup_dir = os.path.join(os.getcwd(), 'backups')
-    backups = []
-    if os.path.exists(backup_dir):
-        for filename in os.listdir(backup_dir):
-            if filename.endswith('.zip'):
-                filepath = os.path.join(backup_dir, filename)
-                size = os.path.getsize(filepath)
-                created = os.path.getctime(filepath)
-                backups.append({
-                    'filename': filename,
-                    'size': f"{size / (1024*1024):.2f} MB",
-                    'created': datetime.fromtimestamp(created).strftime('%Y-%m-%d %H:%M:%S')
-                })
-    backups.sort(key=lambda x: x['created'], reverse=True)
-    settings = CompanySettings.query.first()
-    return render_template('backup/list.html', backups=backups, settings=settings)
+    backups = list_backups(app.config['BACKUP_FOLDER'])
+    return render_template('backup/list.html', backups=backups)
 
 @app.route('/backups/trigger')
 @login_required
@@ -722,7 +860,18 @@ def download_backup(filename):
     if not current_user.is_admin():
         flash('ليس لديك صلاحية.', 'danger')
         return redirect(url_for('index'))
-    return send_from_directory('backups', filename, as_attachment=True)
+    if filename.endswith('.zip'):
+        return send_from_directory(app.config['BACKUP_FOLDER'], filename, as_attachment=True)
+    # النسخة التزايدية تُجمع في ملف zip مؤقت للتحميل
+    archive = tempfile.TemporaryFile()
+    try:
+        export_backup_zip(app.config['BACKUP_FOLDER'], filename, archive)
+    except FileNotFoundError:
+        archive.close()
+        flash('الملف غير موجود.', 'warning')
+        return redirect(url_for('backup_list'))
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True, download_name=filename.replace('.json', '.zip'))
 
 @app.route('/backups/delete/<filename>')
 @login_required
@@ -730,10 +879,17 @@ def delete_backup(filename):
     if not current_user.is_admin():
         flash('ليس لديك صلاحية.', 'danger')
         return redirect(url_for('index'))
-    filepath = os.path.join('backups', filename)
-    if os.path.exists(filepath):
+    filename = secure_filename(filename)
+    filepath = os.path.join(app.config['BACKUP_FOLDER'], filename)
+    if filename.endswith('.zip') and os.path.exists(filepath):
         os.remove(filepath)
         flash('تم حذف النسخة الاحتياطية.', 'success')
+    elif filename.endswith('.json'):
+        try:
+            remove_backup(app.config['BACKUP_FOLDER'], filename)
+            flash('تم حذف النسخة الاحتياطية.', 'success')
+        except FileNotFoundError:
+            flash('الملف غير موجود.', 'warning')
     else:
         flash('الملف غير موجود.', 'warning')
     return redirect(url_for('backup_list'))
@@ -746,8 +902,7 @@ def user_list():
         flash('ليس لديك صلاحية عرض المستخدمين.', 'danger')
         return redirect(url_for('index'))
     users = User.query.all()
-    settings = CompanySettings.query.first()
-    return render_template('user/list.html', users=users, settings=settings)
+    return render_template('user/list.html', users=users)
 
 @app.route('/users/add', methods=['GET', 'POST'])
 @login_required
@@ -773,8 +928,7 @@ def add_user():
         log_activity(current_user, 'create', 'User', new_user.id, f"أضاف مستخدم: {username}")
         flash(f'تم إنشاء المستخدم {username} بنجاح!', 'success')
         return redirect(url_for('user_list'))
-    settings = CompanySettings.query.first()
-    return render_template('user/add.html', settings=settings)
+    return render_template('user/add.html')
 
 # --- سجل النشاط ---
 @app.route('/audit')
@@ -783,9 +937,9 @@ def audit_log():
     if not current_user.is_admin():
         flash('ليس لديك صلاحية عرض سجل النشاط.', 'danger')
         return redirect(url_for('index'))
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).all()
-    settings = CompanySettings.query.first()
-    return render_template('audit/list.html', logs=logs, settings=settings)
+    audit_writer.flush()
+    page = paginate_request(AuditLog.query, {'timestamp': AuditLog.timestamp}, 'timestamp', default_order='desc')
+    return render_template('audit/list.html', logs=page.items, page=page)
 
 # --- إعدادات الشركة ---
 @app.route('/settings/company', methods=['GET', 'POST'])
@@ -799,6 +953,7 @@ def company_settings():
         settings = CompanySettings()
         db.session.add(settings)
         db.session.commit()
+        settings_cache.invalidate()
     if request.method == 'POST':
         company_name = request.form['company_name']
         settings.company_name = company_name
@@ -817,142 +972,136 @@ def company_settings():
                 file.save(filepath)
                 settings.logo_filename = unique_filename
         db.session.commit()
+        settings_cache.invalidate()
         flash('تم تحديث إعدادات الشركة بنجاح.', 'success')
         return redirect(url_for('company_settings'))
     return render_template('settings/company.html', settings=settings)
 
 # --- تصدير Excel ---
+def get_company_name():
+    settings = get_company_settings()
+    return settings.company_name if settings else "شركة الأرشيف"
+
 @app.route('/cars/export')
 @login_required
 def export_cars():
-    cars = Car.query.all()
-    data = [{
-        'الرقم المرجعي': car.unique_id,
-        'رقم الشاسيه': car.chassis_number,
-        'الماركة': car.brand,
-        'الموديل': car.model,
-        'النوع': car.car_type,
-        'اللون': car.color,
-        'السنة': car.year,
-        'رقم اللوحة': car.plate_number,
-        'الحالة': car.status,
-        'تاريخ الإدخال': car.created_at.strftime('%Y-%m-%d'),
-        'ملاحظات': car.notes
-    } for car in cars]
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='السيارات')
-        workbook = writer.book
-        worksheet = writer.sheets['السيارات']
-        settings = CompanySettings.query.first()
-        company_name = settings.company_name if settings else "شركة الأرشيف"
-        worksheet['A1'] = company_name
-        worksheet['A1'].font = Font(size=16, bold=True, color="0070C0")
-        worksheet.merge_cells('A1:L1')
-        worksheet['A1'].alignment = Alignment(horizontal="center")
-    output.seek(0)
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name='cars_export.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    headers = ['الرقم المرجعي', 'رقم الشاسيه', 'الماركة', 'الموديل', 'النوع', 'اللون', 'السنة', 'رقم اللوحة', 'الحالة', 'تاريخ الإدخال', 'ملاحظات']
+    rows = ([
+        car.unique_id,
+        car.chassis_number,
+        car.brand,
+        car.model,
+        car.car_type,
+        car.color,
+        car.year,
+        car.plate_number,
+        car.status,
+        format_date(car.created_at),
+        car.notes
+    ] for car in Car.query.order_by(Car.id).yield_per(EXPORT_BATCH_SIZE))
+    return export_response(rows, headers, 'السيارات', 'cars_export', get_company_name())
 
 @app.route('/employees/export')
 @login_required
 def export_employees():
-    employees = Employee.query.all()
-    data = [{
-        'الرقم المرجعي': emp.unique_id,
-        'الاسم الكامل': emp.full_name,
-        'الرقم الوطني': emp.national_id,
-        'تاريخ الميلاد': emp.birth_date.strftime('%Y-%m-%d') if emp.birth_date else '',
-        'الجنس': emp.gender,
-        'الهاتف': emp.phone,
-        'البريد الإلكتروني': emp.email,
-        'القسم': emp.department,
-        'الوظيفة': emp.position,
-        'تاريخ التعيين': emp.hire_date.strftime('%Y-%m-%d') if emp.hire_date else '',
-        'الحالة': emp.status,
-        'تاريخ الإدخال': emp.created_at.strftime('%Y-%m-%d'),
-        'ملاحظات': emp.notes
-    } for emp in employees]
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='الموظفون')
-        workbook = writer.book
-        worksheet = writer.sheets['الموظفون']
-        settings = CompanySettings.query.first()
-        company_name = settings.company_name if settings else "شركة الأرشيف"
-        worksheet['A1'] = company_name
-        worksheet['A1'].font = Font(size=16, bold=True, color="0070C0")
-        worksheet.merge_cells('A1:M1')
-        worksheet['A1'].alignment = Alignment(horizontal="center")
-    output.seek(0)
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name='employees_export.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    headers = ['الرقم المرجعي', 'الاسم الكامل', 'الرقم الوطني', 'تاريخ الميلاد', 'الجنس', 'الهاتف', 'البريد الإلكتروني', 'القسم', 'الوظيفة', 'تاريخ التعيين', 'الحالة', 'تاريخ الإدخال', 'ملاحظات']
+    rows = ([
+        emp.unique_id,
+        emp.full_name,
+        emp.national_id,
+        format_date(emp.birth_date),
+        emp.gender,
+        emp.phone,
+        emp.email,
+        emp.department,
+        emp.position,
+        format_date(emp.hire_date),
+        emp.status,
+        format_date(emp.created_at),
+        emp.notes
+    ] for emp in Employee.query.order_by(Employee.id).yield_per(EXPORT_BATCH_SIZE))
+    return export_response(rows, headers, 'الموظفون', 'employees_export', get_company_name())
 
 @app.route('/documents/export')
 @login_required
 def export_documents():
-    documents = Document.query.all()
-    data = [{
-        'الرقم المرجعي': doc.unique_id,
-        'العنوان': doc.title,
-        'النوع': doc.doc_type,
-        'الجهة المصدرة': doc.source,
-        'تاريخ الإصدار': doc.issue_date.strftime('%Y-%m-%d') if doc.issue_date else '',
-        'تاريخ الاستلام': doc.receive_date.strftime('%Y-%m-%d'),
-        'المجلد': doc.folder,
-        'الحالة': doc.status,
-        'تاريخ الإدخال': doc.created_at.strftime('%Y-%m-%d'),
-        'ملاحظات': doc.notes
-    } for doc in documents]
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='الوثائق')
-        workbook = writer.book
-        worksheet = writer.sheets['الوثائق']
-        settings = CompanySettings.query.first()
-        company_name = settings.company_name if settings else "شركة الأرشيف"
-        worksheet['A1'] = company_name
-        worksheet['A1'].font = Font(size=16, bold=True, color="0070C0")
-        worksheet.merge_cells('A1:K1')
-        worksheet['A1'].alignment = Alignment(horizontal="center")
-    output.seek(0)
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name='documents_export.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    headers = ['الرقم المرجعي', 'العنوان', 'النوع', 'الجهة المصدرة', 'تاريخ الإصدار', 'تاريخ الاستلام', 'المجلد', 'الحالة', 'تاريخ الإدخال', 'ملاحظات']
+    rows = ([
+        doc.unique_id,
+        doc.title,
+        doc.doc_type,
+        doc.source,
+        format_date(doc.issue_date),
+        format_date(doc.receive_date),
+        doc.folder,
+        doc.status,
+        format_date(doc.created_at),
+        doc.notes
+    ] for doc in Document.query.order_by(Document.id).yield_per(EXPORT_BATCH_SIZE))
+    return export_response(rows, headers, 'الوثائق', 'documents_export', get_company_name())
+
+# --- الاستيراد الجماعي ---
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    if not current_user.can_edit():
+        flash('ليس لديك صلاحية الاستيراد.', 'danger')
+        return redirect(url_for('index'))
+    kind = request.values.get('kind', 'employees')
+    if kind not in IMPORT_SPECS:
+        kind = 'employees'
+    # المواد يضيفها المسؤول فقط كما في إضافة مادة
+    if kind == 'materials' and not current_user.is_admin():
+        flash('ليس لديك صلاحية استيراد المواد.', 'danger')
+        return redirect(url_for('import_data'))
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('يرجى اختيار ملف.', 'warning')
+            return redirect(url_for('import_data', kind=kind))
+        try:
+            result = import_file(kind, file.stream, file.filename, get_company_name())
+        except ImportFileError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('import_data', kind=kind))
+        log_activity(current_user, 'import', IMPORT_SPECS[kind]['table'], None,
+                     f"استيراد {IMPORT_SPECS[kind]['label']}: {result['imported']} من {result['total']} صف")
+        if result['imported']:
+            flash(f"تم استيراد {result['imported']} من {result['total']} صف.", 'success')
+        if result['failed']:
+            flash(f"تم رفض {result['failed']} صف، راجع تقرير الأخطاء.", 'warning')
+    return render_template('import/upload.html', specs=IMPORT_SPECS, kind=kind, result=result)
+
+@app.route('/import/report/<token>')
+@login_required
+def import_report(token):
+    path = report_path(token)
+    if path is None:
+        flash('تقرير الأخطاء غير موجود أو انتهت صلاحيته.', 'warning')
+        return redirect(url_for('import_data'))
+    return send_file(path, as_attachment=True, download_name='import_errors.xlsx')
 
 # --- إدارة المعدات ---
 @app.route('/equipment')
 @login_required
 def equipment_list():
     query = request.args.get('q', '').strip()
+    equipment = Equipment.query
+    sort_columns = {
+        'id': Equipment.id,
+        'unique_id': Equipment.unique_id,
+        'equipment_type': Equipment.equipment_type,
+        'chassis_number': Equipment.chassis_number
+    }
+    default_sort = 'id'
     if query:
-        equipment = Equipment.query.filter(
-            db.or_(
-                Equipment.equipment_type.ilike(f'%{query}%'),
-                Equipment.brand.ilike(f'%{query}%'),
-                Equipment.model.ilike(f'%{query}%'),
-                Equipment.chassis_number.ilike(f'%{query}%'),
-                Equipment.status.ilike(f'%{query}%')
-            )
-        ).all()
-    else:
-        equipment = Equipment.query.all()
-    settings = CompanySettings.query.first()
-    return render_template('equipment/list.html', equipment=equipment, search_query=query, settings=settings)
+        equipment, rank = apply_search(equipment, Equipment, query)
+        if rank is not None:
+            sort_columns['rank'] = rank
+            default_sort = 'rank'
+    page = paginate_request(equipment, sort_columns, default_sort)
+    return render_template('equipment/list.html', equipment=page.items, page=page, search_query=query)
 
 @app.route('/equipment/add', methods=['GET', 'POST'])
 @login_required
@@ -993,18 +1142,24 @@ def add_equipment():
         )
         db.session.add(equipment)
         db.session.commit()
+        refresh_maintenance_forecast([equipment.id])
         log_activity(current_user, 'create', 'Equipment', equipment.id, f"أضاف معدة: {brand} {model}")
         flash('تم إضافة المعدة بنجاح!', 'success')
         return redirect(url_for('equipment_list'))
-    settings = CompanySettings.query.first()
-    return render_template('equipment/add.html', settings=settings)
+    return render_template('equipment/add.html')
 
 @app.route('/equipment/<int:equipment_id>')
 @login_required
 def equipment_detail(equipment_id):
-    equipment = Equipment.query.get_or_404(equipment_id)
-    settings = CompanySettings.query.first()
-    return render_template('equipment/detail.html', equipment=equipment, settings=settings)
+    equipment = Equipment.query.options(
+        selectinload(Equipment.fuel_records), selectinload(Equipment.maintenance_records)
+    ).get_or_404(equipment_id)
+    # تحليل كل تعبئة من السجلات المحملة، والملخص المحفوظ مع خط أساس النوع
+    return render_template('equipment/detail.html', equipment=equipment,
+                           efficiency=equipment_efficiency(equipment),
+                           fuel_analytics=reading_analytics(equipment.fuel_records, equipment.equipment_type),
+                           unit_label=UNIT_LABELS[meter_unit(equipment.equipment_type)],
+                           distance_label=DISTANCE_LABELS[meter_unit(equipment.equipment_type)])
 
 @app.route('/equipment/<int:equipment_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -1013,7 +1168,6 @@ def edit_equipment(equipment_id):
         flash('ليس لديك صلاحية تعديل المعدات.', 'danger')
         return redirect(url_for('equipment_list'))
     equipment = Equipment.query.get_or_404(equipment_id)
-    settings = CompanySettings.query.first()
     if request.method == 'POST':
         equipment.equipment_type = request.form['equipment_type']
         equipment.brand = request.form['brand']
@@ -1028,10 +1182,11 @@ def edit_equipment(equipment_id):
         equipment.purchase_date = datetime.strptime(request.form['purchase_date'], '%Y-%m-%d').date() if request.form.get('purchase_date') else None
         equipment.notes = request.form.get('notes')
         db.session.commit()
+        refresh_maintenance_forecast([equipment.id])
         log_activity(current_user, 'update', 'Equipment', equipment.id, f"عدل معدة: {equipment.brand} {equipment.model}")
         flash('تم تعديل المعدة بنجاح!', 'success')
         return redirect(url_for('equipment_detail', equipment_id=equipment.id))
-    return render_template('equipment/edit.html', equipment=equipment, settings=settings)
+    return render_template('equipment/edit.html', equipment=equipment)
 
 @app.route('/equipment/<int:equipment_id>/delete', methods=['POST'])
 @login_required
@@ -1077,11 +1232,63 @@ def add_fuel_record(equipment_id):
         equipment.current_km = int(current_km)
         db.session.add(fuel_record)
         db.session.commit()
+        refresh_maintenance_forecast([equipment_id])
         log_activity(current_user, 'create', 'FuelRecord', fuel_record.id, f"أضاف وقود للمعدة: {equipment.brand} {equipment.model}")
         flash('تم إضافة سجل الوقود بنجاح!', 'success')
         return redirect(url_for('equipment_detail', equipment_id=equipment_id))
-    settings = CompanySettings.query.first()
-    return render_template('equipment/fuel_add.html', equipment=equipment, settings=settings)
+    return render_template('equipment/fuel_add.html', equipment=equipment)
+
+# --- تحليل استهلاك الوقود ---
+def _number(value, digits=2):
+    # NaN (مسافة صفرية أو معدة بلا خط أساس) تُصدر خلية فارغة
+    return None if value is None or value != value else round(float(value), digits)
+
+FLAG_LABELS = {'high': 'استهلاك مرتفع', 'low': 'استهلاك منخفض', '': ''}
+
+@app.route('/equipment/fuel-efficiency/export')
+@login_required
+def export_fleet_fuel_efficiency():
+    headers = ['الرقم المرجعي', 'النوع', 'الماركة', 'الموديل', 'الوحدة', 'عدد التعبئات', 'المسافة', 'الوقود (لتر)', 'الكلفة',
+               'الاستهلاك', 'الكلفة لكل كم/ساعة', 'متوسط آخر التعبئات', 'خط أساس النوع', 'خط أساس الأسطول', 'الانحراف %', 'التنبيه']
+    rows = ([
+        row.unique_id,
+        row.equipment_type,
+        row.brand,
+        row.model,
+        UNIT_LABELS[row.unit],
+        row.readings,
+        _number(row.distance),
+        _number(row.liters),
+        _number(row.cost),
+        _number(row.consumption),
+        _number(row.cost_per_unit),
+        _number(row.rolling_consumption),
+        _number(row.type_baseline),
+        _number(row.fleet_baseline),
+        _number(row.deviation * 100, 1),
+        FLAG_LABELS[row.flag]
+    ] for row in fleet_efficiency().itertuples(index=False))
+    return export_response(rows, headers, 'استهلاك الوقود', 'fuel_efficiency_export', get_company_name())
+
+@app.route('/equipment/<int:equipment_id>/fuel/export')
+@login_required
+def export_equipment_fuel(equipment_id):
+    equipment = Equipment.query.get_or_404(equipment_id)
+    unit = meter_unit(equipment.equipment_type)
+    headers = ['التاريخ', 'قراءة العداد', f'المسافة ({DISTANCE_LABELS[unit]})', 'الكمية (لتر)', 'الكلفة',
+               f'الاستهلاك ({UNIT_LABELS[unit]})', 'الكلفة لكل وحدة', 'متوسط آخر التعبئات', 'التنبيه']
+    rows = ([
+        format_date(row.date),
+        row.current_km,
+        _number(row.distance) or None,
+        row.quantity,
+        row.total_cost,
+        _number(row.consumption),
+        _number(row.cost_per_unit),
+        _number(row.rolling_consumption),
+        FLAG_LABELS[row.outlier]
+    ] for row in equipment_segments(equipment.id, equipment.equipment_type).itertuples(index=False))
+    return export_response(rows, headers, 'سجل الوقود', f'fuel_{equipment.unique_id}', get_company_name())
 
 # --- إدارة صيانة المعدات ---
 @app.route('/equipment/<int:equipment_id>/maintenance/add', methods=['GET', 'POST'])
@@ -1117,11 +1324,11 @@ def add_equipment_maintenance(equipment_id):
             equipment.next_maintenance_km = int(next_maintenance_km)
         db.session.add(maintenance)
         db.session.commit()
+        refresh_maintenance_forecast([equipment_id])
         log_activity(current_user, 'create', 'EquipmentMaintenance', maintenance.id, f"أضاف صيانة للمعدة: {equipment.brand} {equipment.model}")
         flash('تم إضافة سجل الصيانة بنجاح!', 'success')
         return redirect(url_for('equipment_detail', equipment_id=equipment_id))
-    settings = CompanySettings.query.first()
-    return render_template('equipment/maintenance_add.html', equipment=equipment, settings=settings)
+    return render_template('equipment/maintenance_add.html', equipment=equipment)
 
 # --- تنبيهات الصيانة ---
 @app.route('/equipment/maintenance-alerts')
@@ -1131,8 +1338,9 @@ def maintenance_alerts():
         Equipment.next_maintenance_km != None,
         Equipment.current_km >= Equipment.next_maintenance_km
     ).all()
-    settings = CompanySettings.query.first()
-    return render_template('equipment/maintenance_alerts.html', alerts=alerts, settings=settings)
+    days = request.args.get('days', app.config['MAINTENANCE_FORECAST_DAYS'], type=int)
+    return render_template('equipment/maintenance_alerts.html', alerts=alerts, days=days,
+                           schedule=upcoming_maintenance(days), today=date.today())
 
 # --- إدارة الرواتب ---
 # --- إدارة إعدادات الرواتب ---
@@ -1142,29 +1350,30 @@ def salary_settings():
     if not current_user.is_admin():
         flash('ليس لديك صلاحية الوصول لهذه الصفحة.', 'danger')
         return redirect(url_for('index'))
-    settings = SalarySettings.query.first()
-    if not settings:
-        settings = SalarySettings()
-        db.session.add(settings)
+    salary_settings = SalarySettings.query.first()
+    if not salary_settings:
+        salary_settings = SalarySettings()
+        db.session.add(salary_settings)
         db.session.commit()
+        settings_cache.invalidate()
     if request.method == 'POST':
-        settings.daily_rate = float(request.form['daily_rate'])
-        settings.hourly_rate = float(request.form['hourly_rate'])
-        settings.overtime_daily_rate = float(request.form['overtime_daily_rate'])
-        settings.overtime_hourly_rate = float(request.form['overtime_hourly_rate'])
+        salary_settings.daily_rate = float(request.form['daily_rate'])
+        salary_settings.hourly_rate = float(request.form['hourly_rate'])
+        salary_settings.overtime_daily_rate = float(request.form['overtime_daily_rate'])
+        salary_settings.overtime_hourly_rate = float(request.form['overtime_hourly_rate'])
         db.session.commit()
+        settings_cache.invalidate()
         flash('تم تحديث إعدادات الرواتب بنجاح!', 'success')
         return redirect(url_for('salary_settings'))
-    settings = CompanySettings.query.first()
-    return render_template('salary/settings.html', salary_settings=settings, settings=settings)
+    return render_template('salary/settings.html', salary_settings=salary_settings)
 
 # --- إدارة رواتب الموظفين ---
 @app.route('/salary/employees')
 @login_required
 def salary_employees_list():
-    employees = Employee.query.all()
-    settings = CompanySettings.query.first()
-    return render_template('salary/employees_list.html', employees=employees, settings=settings)
+    employees = Employee.query.options(joinedload(Employee.salary_info))
+    page = paginate_request(employees, {'id': Employee.id, 'full_name': Employee.full_name}, 'id')
+    return render_template('salary/employees_list.html', employees=page.items, page=page)
 
 @app.route('/salary/employee/<int:employee_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -1185,8 +1394,7 @@ def edit_employee_salary(employee_id):
         db.session.commit()
         flash('تم تحديث معلومات الراتب بنجاح!', 'success')
         return redirect(url_for('salary_employees_list'))
-    settings = CompanySettings.query.first()
-    return render_template('salary/employee_salary_edit.html', employee=employee, salary_info=salary_info, settings=settings)
+    return render_template('salary/employee_salary_edit.html', employee=employee, salary_info=salary_info)
 
 # --- تسجيل الحضور والغياب الجماعي ---
 @app.route('/salary/attendance/bulk', methods=['GET', 'POST'])
@@ -1199,32 +1407,18 @@ def bulk_attendance():
     if request.method == 'POST':
         date_str = request.form['date']
         attendance_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        week_number = attendance_date.isocalendar()[1]
-        year = attendance_date.year
+        rows = []
         for employee in employees:
             status = request.form.get(f'status_{employee.id}')
             notes = request.form.get(f'notes_{employee.id}')
             if status:  # فقط إذا تم اختيار حالة
-                existing = AttendanceRecord.query.filter_by(employee_id=employee.id, date=attendance_date).first()
-                if existing:
-                    existing.status = status
-                    existing.notes = notes
-                else:
-                    attendance = AttendanceRecord(
-                        employee_id=employee.id,
-                        date=attendance_date,
-                        status=status,
-                        week_number=week_number,
-                        year=year,
-                        notes=notes
-                    )
-                    db.session.add(attendance)
+                rows.append({'employee_id': employee.id, 'status': status, 'notes': notes})
+        inserted, updated = upsert_attendance_sheet(attendance_date, rows)
         db.session.commit()
         log_activity(current_user, 'create', 'AttendanceRecord', None, f"سجل حضور/غياب جماعي بتاريخ {attendance_date}")
-        flash('تم تسجيل الحضور/الغياب الجماعي بنجاح!', 'success')
+        flash(f'تم تسجيل الحضور/الغياب الجماعي بنجاح! (جديد: {inserted}، محدث: {updated})', 'success')
         return redirect(url_for('bulk_attendance'))
-    settings = CompanySettings.query.first()
-    return render_template('salary/bulk_attendance.html', employees=employees, settings=settings)
+    return render_template('salary/bulk_attendance.html', employees=employees)
 
 # --- تسجيل الساعات والأيام الإضافية الجماعية ---
 @app.route('/salary/overtime/bulk', methods=['GET', 'POST'])
@@ -1237,29 +1431,19 @@ def bulk_overtime():
     if request.method == 'POST':
         date_str = request.form['date']
         overtime_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        week_number = overtime_date.isocalendar()[1]
-        year = overtime_date.year
+        rows = []
         for employee in employees:
             overtime_type = request.form.get(f'overtime_type_{employee.id}')
             quantity = request.form.get(f'quantity_{employee.id}')
             notes = request.form.get(f'notes_{employee.id}')
             if overtime_type and quantity and float(quantity) > 0:
-                overtime = OvertimeRecord(
-                    employee_id=employee.id,
-                    date=overtime_date,
-                    overtime_type=overtime_type,
-                    quantity=float(quantity),
-                    week_number=week_number,
-                    year=year,
-                    notes=notes
-                )
-                db.session.add(overtime)
+                rows.append({'employee_id': employee.id, 'overtime_type': overtime_type, 'quantity': float(quantity), 'notes': notes})
+        inserted = insert_overtime_sheet(overtime_date, rows)
         db.session.commit()
         log_activity(current_user, 'create', 'OvertimeRecord', None, f"سجل ساعات إضافية جماعية بتاريخ {overtime_date}")
-        flash('تم تسجيل الساعات الإضافية الجماعية بنجاح!', 'success')
+        flash(f'تم تسجيل الساعات الإضافية الجماعية بنجاح! (عدد السجلات: {inserted})', 'success')
         return redirect(url_for('bulk_overtime'))
-    settings = CompanySettings.query.first()
-    return render_template('salary/bulk_overtime.html', employees=employees, settings=settings)
+    return render_template('salary/bulk_overtime.html', employees=employees)
 
 # --- تسجيل السلف الجماعية ---
 @app.route('/salary/advance/bulk', methods=['GET', 'POST'])
@@ -1288,8 +1472,7 @@ def bulk_advance():
         log_activity(current_user, 'create', 'AdvancePayment', None, f"سجل سلف جماعية بتاريخ {payment_date}")
         flash('تم تسجيل السلف الجماعية بنجاح!', 'success')
         return redirect(url_for('bulk_advance'))
-    settings = CompanySettings.query.first()
-    return render_template('salary/bulk_advance.html', employees=employees, settings=settings)
+    return render_template('salary/bulk_advance.html', employees=employees)
 
 # --- حساب الرواتب الأسبوعية ---
 @app.route('/salary/payroll/calculate', methods=['GET', 'POST'])
@@ -1298,7 +1481,7 @@ def calculate_payroll():
     if not current_user.is_admin():
         flash('ليس لديك صلاحية حساب الرواتب.', 'danger')
         return redirect(url_for('index'))
-    salary_settings = SalarySettings.query.first()
+    salary_settings = get_salary_settings()
     if not salary_settings:
         flash('يرجى تعيين إعدادات الرواتب أولاً.', 'warning')
         return redirect(url_for('salary_settings'))
@@ -1307,90 +1490,16 @@ def calculate_payroll():
         year = int(request.form['year'])
         employee_id = request.form.get('employee_id')
         if employee_id:
-            employees = [Employee.query.get_or_404(int(employee_id))]
-        else:
-            employees = Employee.query.filter_by(status='active').all()
-        for employee in employees:
-            attendances = AttendanceRecord.query.filter_by(
-                employee_id=employee.id,
-                week_number=week_number,
-                year=year
-            ).all()
-            overtime_records = OvertimeRecord.query.filter_by(
-                employee_id=employee.id,
-                week_number=week_number,
-                year=year
-            ).all()
-            advances = AdvancePayment.query.filter_by(
-                employee_id=employee.id,
-                is_paid=False
-            ).all()
-            total_days = 6
-            present_days = len([a for a in attendances if a.status == 'present'])
-            absent_days = len([a for a in attendances if a.status == 'absent'])
-            half_days = len([a for a in attendances if a.status == 'half_day'])
-            overtime_days = sum([r.quantity for r in overtime_records if r.overtime_type == 'daily'])
-            overtime_hours = sum([r.quantity for r in overtime_records if r.overtime_type == 'hourly'])
-            salary_info = EmployeeSalary.query.filter_by(employee_id=employee.id).first()
-            if not salary_info:
-                flash(f'لم يتم تعيين معلومات الراتب للموظف: {employee.full_name}', 'warning')
-                continue
-            if salary_info.daily_wage:
-                basic_salary = present_days * salary_info.daily_wage
-                if half_days > 0:
-                    basic_salary += half_days * (salary_info.daily_wage / 2)
-            elif salary_info.base_salary:
-                daily_rate = salary_info.base_salary / 26
-                basic_salary = present_days * daily_rate
-                if half_days > 0:
-                    basic_salary += half_days * (daily_rate / 2)
-            else:
-                basic_salary = 0
-            overtime_amount = (overtime_days * salary_settings.overtime_daily_rate) + (overtime_hours * salary_settings.overtime_hourly_rate)
-            deductions = absent_days * (salary_info.daily_wage if salary_info.daily_wage else salary_info.base_salary / 26)
-            advances_deduction = sum([a.amount for a in advances])
-            net_salary = basic_salary + overtime_amount - deductions - advances_deduction
-            existing = PayrollRecord.query.filter_by(
-                employee_id=employee.id,
-                week_number=week_number,
-                year=year
-            ).first()
-            if existing:
-                existing.present_days = present_days
-                existing.absent_days = absent_days
-                existing.half_days = half_days
-                existing.overtime_days = overtime_days
-                existing.overtime_hours = overtime_hours
-                existing.basic_salary = basic_salary
-                existing.overtime_amount = overtime_amount
-                existing.deductions = deductions
-                existing.advances_deduction = advances_deduction
-                existing.net_salary = net_salary
-            else:
-                payroll = PayrollRecord(
-                    employee_id=employee.id,
-                    week_number=week_number,
-                    year=year,
-                    present_days=present_days,
-                    absent_days=absent_days,
-                    half_days=half_days,
-                    overtime_days=overtime_days,
-                    overtime_hours=overtime_hours,
-                    basic_salary=basic_salary,
-                    overtime_amount=overtime_amount,
-                    deductions=deductions,
-                    advances_deduction=advances_deduction,
-                    net_salary=net_salary,
-                    paid=False
-                )
-                db.session.add(payroll)
+            employee_id = Employee.query.get_or_404(int(employee_id)).id
+        inserted, updated, skipped = run_weekly_payroll(week_number, year, salary_settings, employee_id)
+        for full_name in skipped:
+            flash(f'لم يتم تعيين معلومات الراتب للموظف: {full_name}', 'warning')
         db.session.commit()
         flash('تم حساب الرواتب بنجاح!', 'success')
         return redirect(url_for('payroll_list', week_number=week_number, year=year))
     weeks = db.session.query(AttendanceRecord.week_number, AttendanceRecord.year).distinct().order_by(AttendanceRecord.year.desc(), AttendanceRecord.week_number.desc()).all()
     employees = Employee.query.filter_by(status='active').all()
-    settings = CompanySettings.query.first()
-    return render_template('salary/payroll_calculate.html', weeks=weeks, employees=employees, settings=settings)
+    return render_template('salary/payroll_calculate.html', weeks=weeks, employees=employees)
 
 # --- قائمة الرواتب ---
 @app.route('/salary/payroll')
@@ -1398,20 +1507,21 @@ def calculate_payroll():
 def payroll_list():
     week_number = request.args.get('week_number', type=int)
     year = request.args.get('year', type=int)
+    payroll_records = PayrollRecord.query.options(joinedload(PayrollRecord.employee, innerjoin=True))
     if week_number and year:
-        payroll_records = PayrollRecord.query.filter_by(week_number=week_number, year=year).all()
-    else:
-        payroll_records = PayrollRecord.query.order_by(PayrollRecord.year.desc(), PayrollRecord.week_number.desc()).all()
-    settings = CompanySettings.query.first()
-    return render_template('salary/payroll_list.html', payroll_records=payroll_records, settings=settings)
+        payroll_records = payroll_records.filter_by(week_number=week_number, year=year)
+    page = paginate_request(payroll_records, {
+        'week': (PayrollRecord.year, PayrollRecord.week_number),
+        'id': PayrollRecord.id
+    }, 'week', default_order='desc')
+    return render_template('salary/payroll_list.html', payroll_records=page.items, page=page)
 
 # --- تفاصيل راتب موظف ---
 @app.route('/salary/payroll/<int:record_id>')
 @login_required
 def payroll_detail(record_id):
-    record = PayrollRecord.query.get_or_404(record_id)
-    settings = CompanySettings.query.first()
-    return render_template('salary/payroll_detail.html', record=record, settings=settings)
+    record = PayrollRecord.query.options(joinedload(PayrollRecord.employee, innerjoin=True)).get_or_404(record_id)
+    return render_template('salary/payroll_detail.html', record=record)
 
 # --- دفع الراتب ---
 @app.route('/salary/payroll/<int:record_id>/pay', methods=['POST'])
@@ -1441,53 +1551,35 @@ def pay_payroll(record_id):
 def export_payroll():
     week_number = request.args.get('week_number', type=int)
     year = request.args.get('year', type=int)
+    records = db.session.query(PayrollRecord, Employee.full_name).join(Employee, PayrollRecord.employee_id == Employee.id)
     if week_number and year:
-        records = PayrollRecord.query.filter_by(week_number=week_number, year=year).all()
-    else:
-        records = PayrollRecord.query.all()
-    data = [{
-        'اسم الموظف': record.employee.full_name,
-        'الأسبوع': f"{record.week_number}-{record.year}",
-        'أيام الحضور': record.present_days,
-        'أيام الغياب': record.absent_days,
-        'نصف أيام': record.half_days,
-        'أيام إضافية': record.overtime_days,
-        'ساعات إضافية': record.overtime_hours,
-        'الراتب الأساسي': record.basic_salary,
-        'بدل الساعات الإضافية': record.overtime_amount,
-        'خصم الغياب': record.deductions,
-        'حسم السلف': record.advances_deduction,
-        'صافي الراتب': record.net_salary,
-        'مدفوع': 'نعم' if record.paid else 'لا',
-        'تاريخ الدفع': record.paid_date.strftime('%Y-%m-%d') if record.paid_date else '-'
-    } for record in records]
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='رواتب الموظفين')
-        workbook = writer.book
-        worksheet = writer.sheets['رواتب الموظفين']
-        settings = CompanySettings.query.first()
-        company_name = settings.company_name if settings else "شركة الأرشيف"
-        worksheet['A1'] = company_name
-        worksheet['A1'].font = Font(size=16, bold=True, color="0070C0")
-        worksheet.merge_cells('A1:O1')
-        worksheet['A1'].alignment = Alignment(horizontal="center")
-    output.seek(0)
-    filename = f'payroll_export_{week_number or "all"}_{year or "all"}.xlsx'
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+        records = records.filter(PayrollRecord.week_number == week_number, PayrollRecord.year == year)
+    headers = ['اسم الموظف', 'الأسبوع', 'أيام الحضور', 'أيام الغياب', 'نصف أيام', 'أيام إضافية', 'ساعات إضافية', 'الراتب الأساسي', 'بدل الساعات الإضافية', 'خصم الغياب', 'حسم السلف', 'صافي الراتب', 'مدفوع', 'تاريخ الدفع']
+    rows = ([
+        full_name,
+        f"{record.week_number}-{record.year}",
+        record.present_days,
+        record.absent_days,
+        record.half_days,
+        record.overtime_days,
+        record.overtime_hours,
+        record.basic_salary,
+        record.overtime_amount,
+        record.deductions,
+        record.advances_deduction,
+        record.net_salary,
+        'نعم' if record.paid else 'لا',
+        record.paid_date.strftime('%Y-%m-%d') if record.paid_date else '-'
+    ] for record, full_name in records.order_by(PayrollRecord.id).yield_per(EXPORT_BATCH_SIZE))
+    filename = f'payroll_export_{week_number or "all"}_{year or "all"}'
+    return export_response(rows, headers, 'رواتب الموظفين', filename, get_company_name())
+
 # --- إدارة المستودعات ---
 @app.route('/warehouses')
 @login_required
 def warehouse_list():
     warehouses = Warehouse.query.all()
-    settings = CompanySettings.query.first()
-    return render_template('warehouse/list.html', warehouses=warehouses, settings=settings)
+    return render_template('warehouse/list.html', warehouses=warehouses)
 
 @app.route('/warehouses/add', methods=['GET', 'POST'])
 @login_required
@@ -1508,8 +1600,7 @@ def add_warehouse():
         log_activity(current_user, 'create', 'Warehouse', warehouse.id, f"أضاف مستودع: {name}")
         flash('تم إضافة المستودع بنجاح!', 'success')
         return redirect(url_for('warehouse_list'))
-    settings = CompanySettings.query.first()
-    return render_template('warehouse/add.html', settings=settings)
+    return render_template('warehouse/add.html')
 
 @app.route('/warehouses/<int:warehouse_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -1526,8 +1617,7 @@ def edit_warehouse(warehouse_id):
         log_activity(current_user, 'update', 'Warehouse', warehouse.id, f"عدل مستودع: {warehouse.name}")
         flash('تم تعديل المستودع بنجاح!', 'success')
         return redirect(url_for('warehouse_list'))
-    settings = CompanySettings.query.first()
-    return render_template('warehouse/edit.html', warehouse=warehouse, settings=settings)
+    return render_template('warehouse/edit.html', warehouse=warehouse)
 
 @app.route('/warehouses/<int:warehouse_id>/delete', methods=['POST'])
 @login_required
@@ -1551,8 +1641,7 @@ def delete_warehouse(warehouse_id):
 @login_required
 def material_list():
     materials = Material.query.all()
-    settings = CompanySettings.query.first()
-    return render_template('material/list.html', materials=materials, settings=settings)
+    return render_template('material/list.html', materials=materials)
 
 @app.route('/materials/add', methods=['GET', 'POST'])
 @login_required
@@ -1581,8 +1670,7 @@ def add_material():
         log_activity(current_user, 'create', 'Material', material.id, f"أضاف مادة: {name}")
         flash('تم إضافة المادة بنجاح!', 'success')
         return redirect(url_for('material_list'))
-    settings = CompanySettings.query.first()
-    return render_template('material/add.html', settings=settings)
+    return render_template('material/add.html')
 
 @app.route('/materials/<int:material_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -1601,8 +1689,7 @@ def edit_material(material_id):
         log_activity(current_user, 'update', 'Material', material.id, f"عدل مادة: {material.name}")
         flash('تم تعديل المادة بنجاح!', 'success')
         return redirect(url_for('material_list'))
-    settings = CompanySettings.query.first()
-    return render_template('material/edit.html', material=material, settings=settings)
+    return render_template('material/edit.html', material=material)
 
 @app.route('/materials/<int:material_id>/delete', methods=['POST'])
 @login_required
@@ -1631,118 +1718,91 @@ def add_stock_transaction():
     warehouses = Warehouse.query.filter_by(is_active=True).all()
     materials = Material.query.all()
     if request.method == 'POST':
-        warehouse_id = int(request.form['warehouse_id'])
-        material_id = int(request.form['material_id'])
-        transaction_type = request.form['transaction_type']
-        quantity = float(request.form['quantity'])
+        # قسيمة متعددة الأسطر: كل سطر (مستودع، مادة، نوع، كمية) والمرجع والملاحظات للقسيمة كلها
         reference = request.form.get('reference')
         notes = request.form.get('notes')
-        # الحصول على رصيد المادة في هذا المستودع
-        stock_item = StockItem.query.filter_by(warehouse_id=warehouse_id, material_id=material_id).first()
-        if not stock_item:
-            stock_item = StockItem(warehouse_id=warehouse_id, material_id=material_id, quantity=0)
-            db.session.add(stock_item)
-        # تعديل الرصيد
-        if transaction_type == 'in':
-            stock_item.quantity += quantity
-        elif transaction_type == 'out':
-            if stock_item.quantity < quantity:
-                flash('الكمية المطلوبة غير متوفرة في المخزن!', 'danger')
-                return redirect(url_for('add_stock_transaction'))
-            stock_item.quantity -= quantity
-        stock_item.last_updated = datetime.utcnow()
-        # تسجيل الحركة
-        transaction = StockTransaction(
-            warehouse_id=warehouse_id,
-            material_id=material_id,
-            transaction_type=transaction_type,
-            quantity=quantity,
-            balance_after=stock_item.quantity,
-            reference=reference,
-            notes=notes,
-            created_by_id=current_user.id
-        )
-        db.session.add(transaction)
-        db.session.commit()
-        action = "إضافة" if transaction_type == 'in' else "صرف"
-        log_activity(current_user, 'create', 'StockTransaction', transaction.id, f"{action} {quantity} {stock_item.material.unit} من {stock_item.material.name} في {stock_item.warehouse.name}")
-        flash(f'تم {action} الكمية بنجاح!', 'success')
+        lines = []
+        try:
+            for warehouse_id, material_id, transaction_type, quantity in zip(
+                    request.form.getlist('warehouse_id'), request.form.getlist('material_id'),
+                    request.form.getlist('transaction_type'), request.form.getlist('quantity')):
+                if not (warehouse_id and material_id and quantity):
+                    continue
+                lines.append({'warehouse_id': int(warehouse_id), 'material_id': int(material_id),
+                              'transaction_type': transaction_type, 'quantity': float(quantity),
+                              'reference': reference, 'notes': notes})
+        except ValueError:
+            flash('بيانات القسيمة غير صحيحة.', 'danger')
+            return redirect(url_for('add_stock_transaction'))
+        if not lines:
+            flash('أدخل سطراً واحداً على الأقل.', 'warning')
+            return redirect(url_for('add_stock_transaction'))
+        ok, results = post_voucher(lines, created_by_id=current_user.id)
+        if not ok:
+            for number, result in enumerate(results, start=1):
+                if result['error']:
+                    flash(f"السطر {number}: {result['error']}", 'danger')
+            return render_template('inventory/transaction.html', warehouses=warehouses, materials=materials,
+                                   lines=lines, reference=reference, notes=notes)
+        material_names = {material.id: f'{material.name} ({material.unit})' for material in materials}
+        details = '، '.join(f"{'إضافة' if line['transaction_type'] == 'in' else 'صرف'} {line['quantity']:g} {material_names.get(line['material_id'], '')}"
+                           for line in lines)
+        log_activity(current_user, 'create', 'StockTransaction', None, f"قسيمة {reference or ''}: {details}")
+        flash(f'تم تنفيذ القسيمة ({len(lines)} سطر) بنجاح!', 'success')
         return redirect(url_for('stock_balance'))
-    settings = CompanySettings.query.first()
-    return render_template('inventory/transaction.html', warehouses=warehouses, materials=materials, settings=settings)
+    return render_template('inventory/transaction.html', warehouses=warehouses, materials=materials)
 
 # --- رصيد المخزون ---
 @app.route('/inventory/balance')
 @login_required
 def stock_balance():
-    # جلب جميع أرصدة المخزون مع أسماء المستودعات والمواد
-    balances = db.session.query(
-        StockItem.id,
-        Warehouse.name.label('warehouse_name'),
-        Material.name.label('material_name'),
-        Material.unit,
-        Material.min_stock_level,
-        StockItem.quantity
-    ).join(Warehouse, StockItem.warehouse_id == Warehouse.id)\
-     .join(Material, StockItem.material_id == Material.id)\
-     .all()
+    # الرصيد الحالي، أو الرصيد في نهاية يوم معين (?as_of=YYYY-MM-DD) من أقرب لقطة + الحركات بعدها
+    as_of = request.args.get('as_of', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date())
+    balances = stock_balances(as_of)
     # تصنيف المواد التي تحت الحد الأدنى
-    low_stock_items = [b for b in balances if b.quantity <= b.min_stock_level]
-    settings = CompanySettings.query.first()
-    return render_template('inventory/balance.html', balances=balances, low_stock_items=low_stock_items, settings=settings)
+    low_stock_items = [b for b in balances if b['quantity'] <= b['min_stock_level']] if as_of is None else []
+    return render_template('inventory/balance.html', balances=balances, low_stock_items=low_stock_items, as_of=as_of)
 
 # --- حركة مادة معينة ---
 @app.route('/inventory/material/<int:material_id>')
 @login_required
 def material_history(material_id):
     material = Material.query.get_or_404(material_id)
-    transactions = StockTransaction.query.filter_by(material_id=material_id)\
-        .order_by(StockTransaction.created_at.desc()).all()
-    settings = CompanySettings.query.first()
-    return render_template('inventory/material_history.html', material=material, transactions=transactions, settings=settings)
+    transactions = StockTransaction.query.filter_by(material_id=material_id).options(
+        joinedload(StockTransaction.warehouse, innerjoin=True), joinedload(StockTransaction.created_by)
+    )
+    page = paginate_request(transactions, {'created_at': StockTransaction.created_at}, 'created_at', default_order='desc')
+    return render_template('inventory/material_history.html', material=material, transactions=page.items, page=page)
 
 # --- تصدير رصيد المخزون إلى Excel ---
 @app.route('/inventory/export/balance')
 @login_required
 def export_stock_balance():
-    balances = db.session.query(
-        Warehouse.name.label('warehouse_name'),
-        Material.name.label('material_name'),
-        Material.unit,
-        StockItem.quantity
-    ).join(Warehouse, StockItem.warehouse_id == Warehouse.id)\
-     .join(Material, StockItem.material_id == Material.id)\
-     .all()
-    data = [{
-        'المستودع': b.warehouse_name,
-        'المادة': b.material_name,
-        'الوحدة': b.unit,
-        'الكمية': b.quantity
-    } for b in balances]
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='رصيد المخزون')
-        workbook = writer.book
-        worksheet = writer.sheets['رصيد المخزون']
-        settings = CompanySettings.query.first()
-        company_name = settings.company_name if settings else "شركة الأرشيف"
-        worksheet['A1'] = company_name
-        worksheet['A1'].font = Font(size=16, bold=True, color="0070C0")
-        worksheet.merge_cells('A1:D1')
-        worksheet['A1'].alignment = Alignment(horizontal="center")
-    output.seek(0)
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name='stock_balance.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    as_of = request.args.get('as_of', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date())
+    headers = ['المستودع', 'المادة', 'الوحدة', 'الكمية']
+    rows = ([b['warehouse_name'], b['material_name'], b['unit'], b['quantity']] for b in stock_balances(as_of))
+    if as_of:
+        return export_response(rows, headers, f"رصيد المخزون في {as_of.strftime('%Y-%m-%d')}",
+                               f"stock_balance_{as_of.strftime('%Y%m%d')}", get_company_name())
+    return export_response(rows, headers, 'رصيد المخزون', 'stock_balance', get_company_name())
+
 # --- Context Processor ---
 @app.context_processor
 def inject_current_year():
     return {'current_year': datetime.now().year}
 
+@app.context_processor
+def inject_notifications():
+    # شارة الإشعارات من القائمة المحفوظة في الذاكرة
+    if current_user.is_authenticated and current_user.can_edit():
+        return {'unread_notifications': notification_feed.unread_count(current_user.last_seen_notification_id)}
+    return {'unread_notifications': 0}
+
+@app.context_processor
+def inject_settings():
+    # إعدادات الشركة من الذاكرة المؤقتة لكل القوالب، دون استعلام في كل طلب
+    return {'settings': get_company_settings()}
+
 import atexit
 atexit.register(lambda: scheduler.shutdown())
 # --- نموذج المستودع ---
@@ -1763,7 +1823,7 @@ class Warehouse(db.Model):
 # --- نموذج المادة (المنتج) ---
 class Material(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     unit = db.Column(db.String(20), nullable=False)  # وحدة القياس: طن، متر مكعب، لتر، قطعة...
     min_stock_level = db.Column(db.Float, default=0)  # الحد الأدنى للتنبيه
     category = db.Column(db.String(50))  # مواد خام، قطع غيار، وقود...
@@ -1807,7 +1867,30 @@ class StockTransaction(db.Model):
     # العلاقات
     created_by = db.relationship('User', backref='stock_transactions')
 
+    # حركة مادة معينة مرتبة بالتاريخ، والحركات بعد آخر لقطة رصيد
+    __table_args__ = (
+        db.Index('ix_stock_transaction_material_date', 'material_id', 'created_at'),
+        db.Index('ix_stock_transaction_created', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<StockTransaction {self.transaction_type} {self.quantity} of {self.material.name}>'
+
+# --- نموذج لقطة رصيد المخزون (الرصيد في نهاية يوم معين، انظر stock_ledger.py) ---
+class StockSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), nullable=False)
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'), nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    cutoff_at = db.Column(db.DateTime, nullable=False)  # الرصيد من الحركات قبل هذه اللحظة (UTC)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('snapshot_date', 'warehouse_id', 'material_id', name='uq_stock_snapshot'),)
+
+# التهيئة مرة واحدة عند التشغيل (بعد تعريف كل النماذج)، وليس مع كل طلب
+if app.config.get('BOOTSTRAP_ON_STARTUP', True):
+    bootstrap_app(app)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
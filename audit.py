@@ -0,0 +1,177 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from models import db, AuditLog
+
+# كاتب سجل النشاط على دفعات: الأحداث توضع في طابور داخل العملية ويكتبها خيط في الخلفية
+# دفعة واحدة عند بلوغ عدد معين أو مرور مدة معينة، فلا ينتظر الطلب commit خاصاً بسجل النشاط.
+# flush يضع علامة (threading.Event) في آخر الطابور ويضبطها الخيط بعد كتابة ما قبلها، فينتظر الطلب
+# الأحداث الموجودة لحظة الاستدعاء فقط وليس ما يصل بعدها تحت الضغط.
+# لا يضيع حدث إذا تعذرت كتابة دفعة: إعادة المحاولة بتأخير متزايد، ثم كتابة كل حدث وحده، وما بقي يُحفظ
+# في ملف (سطر JSON لكل حدث) يُعاد إدخاله عند التشغيل التالي.
+# عند إيقاف التطبيق بشكل طبيعي يُفرغ الطابور قبل الخروج.
+
+class AuditWriter:
+    def __init__(self):
+        self.app = None
+        self.batch_size = 100
+        self.flush_interval = 1.0
+        self.retries = 3
+        self.retry_delay = 0.2
+        self.spill_path = None
+        self._spill_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', self.flush_interval)
+        self.retries = app.config.get('AUDIT_RETRIES', self.retries)
+        self.retry_delay = app.config.get('AUDIT_RETRY_DELAY', self.retry_delay)
+        self.spill_path = app.config.get('AUDIT_SPILL_PATH') or os.path.join(app.instance_path, 'audit_spill.jsonl')
+        self._queue = queue.Queue(maxsize=app.config.get('AUDIT_QUEUE_SIZE', 0))
+        if app.config.get('AUDIT_ASYNC', True):
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopping.is_set()
+
+    def log(self, event):
+        # event: أعمدة AuditLog، ويُحدد timestamp وقت وقوع الحدث لا وقت كتابته
+        event.setdefault('timestamp', datetime.utcnow())
+        if self.running:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                pass
+        # الوضع المتزامن: بدون خيط خلفي، أو بعد الإيقاف، أو عند امتلاء الطابور
+        self._write_reliably([event])
+
+    def _write(self, events):
+        if self.app is None:
+            db.session.execute(AuditLog.__table__.insert(), events)
+            db.session.commit()
+            return
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(AuditLog.__table__.insert(), events)
+
+    def _write_reliably(self, events):
+        error = None
+        for attempt in range(self.retries):
+            try:
+                self._write(events)
+                return
+            except Exception as e:
+                error = e
+                time.sleep(self.retry_delay * 2 ** attempt)
+        # حدث واحد قد يكون سبب فشل الدفعة: البقية تُكتب
+        unwritten = []
+        for event in events:
+            try:
+                self._write([event])
+            except Exception as e:
+                error = e
+                unwritten.append(event)
+        if unwritten:
+            print(f"[Audit Error] تعذر حفظ {len(unwritten)} حدث، حُفظت في {self.spill_path}: {str(error)}")
+            self._spill(unwritten)
+
+    def _spill(self, events):
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False, default=datetime.isoformat) + '\n')
+        except Exception as e:
+            print(f"[Audit Error] تعذر حفظ {len(events)} حدث في الملف: {str(e)}")
+
+    def recover_spill(self):
+        # إدخال الأحداث المحفوظة في الملف؛ يعيد عددها
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return 0
+        with self._spill_lock:
+            with open(self.spill_path, encoding='utf-8') as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            for event in events:
+                if event.get('timestamp'):
+                    event['timestamp'] = datetime.fromisoformat(event['timestamp'])
+            if events:
+                try:
+                    self._write(events)
+                except Exception as e:
+                    # يبقى الملف للمحاولة في التشغيل التالي
+                    print(f"[Audit Error] تعذر إدخال الأحداث المحفوظة في {self.spill_path}: {str(e)}")
+                    return 0
+            os.remove(self.spill_path)
+        return len(events)
+
+    def _drain(self, limit=None):
+        events = []
+        while limit is None or len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _next_batch(self):
+        # علامة flush تنهي الدفعة حتى تُكتب الأحداث التي قبلها فوراً
+        try:
+            items = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(items) < self.batch_size and not isinstance(items[-1], threading.Event):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _process(self, items):
+        # كتابة الأحداث ثم ضبط علامات flush التي بينها
+        events = [item for item in items if not isinstance(item, threading.Event)]
+        if events:
+            self._write_reliably(events)
+        for item in items:
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            self._process(self._next_batch() if not self._stopping.is_set() else self._drain(self.batch_size))
+
+    def flush(self):
+        # كتابة الأحداث الموجودة في الطابور الآن (مثلاً قبل عرض صفحة سجل النشاط)
+        if self.running:
+            marker = threading.Event()
+            self._queue.put(marker)
+            while not marker.wait(self.flush_interval):
+                if not self.running:
+                    break
+            else:
+                return
+        # بدون خيط خلفي (أو توقف أثناء الانتظار): الكتابة هنا مباشرة
+        self._process(self._drain())
+
+    def shutdown(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+audit_writer = AuditWriter()
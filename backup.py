@@ -0,0 +1,222 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+from instrumentation import timed
+
+# النسخ الاحتياطي التزايدي:
+# - قاعدة البيانات تُنسخ بـ sqlite3.Connection.backup فتكون لقطة متسقة حتى أثناء الكتابة.
+# - الملفات تُخزن مرة واحدة حسب محتواها (sha256) في backups/objects، فلا يُنسخ إلا الجديد أو المعدل.
+# - الصور وملفات PDF تُخزن كما هي بدون إعادة ضغط، وبقية الملفات (مثل قاعدة البيانات) تُضغط بـ gzip.
+# - لكل تشغيل ملف manifest في backups/manifests يكفي وحده لاستعادة تلك النسخة كاملة.
+
+STORED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'pdf', 'zip', 'gz', 'xlsx', 'docx'}
+DATABASE_ENTRY = 'database.db'
+CHUNK_SIZE = 1024 * 1024
+
+def _objects_dir(backup_dir):
+    return os.path.join(backup_dir, 'objects')
+
+def _manifests_dir(backup_dir):
+    return os.path.join(backup_dir, 'manifests')
+
+def _should_compress(path):
+    return path.rsplit('.', 1)[-1].lower() not in STORED_EXTENSIONS
+
+def _object_path(backup_dir, digest, compressed):
+    return os.path.join(_objects_dir(backup_dir), digest[:2], digest + ('.gz' if compressed else ''))
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _store_object(backup_dir, path, digest, compressed):
+    # يعيد عدد البايتات المضافة (0 إذا كان المحتوى مخزناً من قبل)
+    target = _object_path(backup_dir, digest, compressed)
+    if os.path.exists(target):
+        return 0
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out, open(path, 'rb') as src:
+            if compressed:
+                with gzip.GzipFile(fileobj=out, mode='wb', mtime=0) as gz:
+                    shutil.copyfileobj(src, gz, CHUNK_SIZE)
+            else:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return os.path.getsize(target)
+
+def snapshot_database(db_path, dest_path):
+    # لقطة متسقة عبر واجهة النسخ في SQLite (لا تتأثر بالكتابة الجارية)
+    source = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    target = sqlite3.connect(dest_path)
+    try:
+        with target:
+            source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def load_manifest(backup_dir, name):
+    if os.path.basename(name) != name or not name.endswith('.json'):
+        raise FileNotFoundError(name)
+    with open(os.path.join(_manifests_dir(backup_dir), name), encoding='utf-8') as f:
+        return json.load(f)
+
+def _latest_manifest(backup_dir):
+    names = sorted(n for n in os.listdir(_manifests_dir(backup_dir)) if n.endswith('.json'))
+    return load_manifest(backup_dir, names[-1]) if names else None
+
+@timed('backup')
+def run_backup(db_path, uploads_path, backup_dir):
+    started = time.perf_counter()
+    os.makedirs(_objects_dir(backup_dir), exist_ok=True)
+    os.makedirs(_manifests_dir(backup_dir), exist_ok=True)
+    previous = _latest_manifest(backup_dir)
+    # الملف الذي لم يتغير حجمه ولا وقت تعديله منذ النسخة السابقة لا يُعاد قراءته
+    known = {entry['path']: entry for entry in previous['files']} if previous else {}
+    name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    manifest = {'name': name, 'created': datetime.now().isoformat(timespec='seconds'), 'database': None, 'files': []}
+    added_bytes, added_files = 0, 0
+
+    if db_path and os.path.exists(db_path):
+        fd, snapshot_path = tempfile.mkstemp(dir=backup_dir, suffix='.db.tmp')
+        os.close(fd)
+        try:
+            snapshot_database(db_path, snapshot_path)
+            digest = _hash_file(snapshot_path)
+            added = _store_object(backup_dir, snapshot_path, digest, True)
+            added_bytes += added
+            manifest['database'] = {
+                'path': DATABASE_ENTRY, 'source': os.path.basename(db_path), 'sha256': digest,
+                'size': os.path.getsize(snapshot_path), 'compressed': True
+            }
+        finally:
+            os.remove(snapshot_path)
+
+    if uploads_path and os.path.exists(uploads_path):
+        for root, dirs, files in os.walk(uploads_path):
+            dirs.sort()
+            for filename in sorted(files):
+                file_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(file_path, uploads_path).replace(os.sep, '/')
+                stat = os.stat(file_path)
+                compressed = _should_compress(filename)
+                entry = known.get(rel_path)
+                if not (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                        and os.path.exists(_object_path(backup_dir, entry['sha256'], entry['compressed']))):
+                    digest = _hash_file(file_path)
+                    added = _store_object(backup_dir, file_path, digest, compressed)
+                    if added:
+                        added_bytes += added
+                        added_files += 1
+                    entry = {'path': rel_path, 'sha256': digest, 'size': stat.st_size,
+                             'mtime_ns': stat.st_mtime_ns, 'compressed': compressed}
+                manifest['files'].append(entry)
+
+    manifest['total_bytes'] = sum(entry['size'] for entry in manifest['files']) + (manifest['database'] or {}).get('size', 0)
+    manifest['added_bytes'] = added_bytes
+    manifest['added_files'] = added_files
+    manifest['duration_seconds'] = round(time.perf_counter() - started, 3)
+    tmp_path = os.path.join(_manifests_dir(backup_dir), name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(_manifests_dir(backup_dir), name))
+    return manifest
+
+def _open_object(backup_dir, entry):
+    path = _object_path(backup_dir, entry['sha256'], entry['compressed'])
+    return gzip.open(path, 'rb') if entry['compressed'] else open(path, 'rb')
+
+def _manifest_entries(manifest, uploads_prefix='uploads'):
+    # (اسم الملف في النسخة المستعادة، البيان)
+    if manifest['database']:
+        yield manifest['database']['source'], manifest['database']
+    for entry in manifest['files']:
+        yield f"{uploads_prefix}/{entry['path']}", entry
+
+def restore_backup(backup_dir, name, target_dir):
+    # يكتب قاعدة البيانات ومجلد uploads كما كانا وقت النسخة في target_dir
+    manifest = load_manifest(backup_dir, name)
+    for rel_path, entry in _manifest_entries(manifest):
+        destination = os.path.join(target_dir, *rel_path.split('/'))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with _open_object(backup_dir, entry) as src, open(destination, 'wb') as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+    return manifest
+
+def export_backup_zip(backup_dir, name, fileobj):
+    # أرشيف zip للتحميل بدون ضغط (المحتوى مضغوط أصلاً أو صور/PDF)
+    manifest = load_manifest(backup_dir, name)
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+        for rel_path, entry in _manifest_entries(manifest):
+            with _open_object(backup_dir, entry) as src, zipf.open(rel_path, 'w', force_zip64=True) as out:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+    return manifest
+
+def list_backups(backup_dir):
+    backups = []
+    manifests_dir = _manifests_dir(backup_dir)
+    if os.path.exists(manifests_dir):
+        for filename in os.listdir(manifests_dir):
+            if filename.endswith('.json'):
+                manifest = load_manifest(backup_dir, filename)
+                backups.append({
+                    'filename': filename,
+                    'size': manifest['total_bytes'],
+                    'added': manifest['added_bytes'],
+                    'files': len(manifest['files']),
+                    'created': manifest['created'].replace('T', ' ')
+                })
+    # النسخ القديمة بصيغة zip الكاملة
+    if os.path.exists(backup_dir):
+        for filename in os.listdir(backup_dir):
+            if filename.endswith('.zip'):
+                filepath = os.path.join(backup_dir, filename)
+                size = os.path.getsize(filepath)
+                backups.append({
+                    'filename': filename,
+                    'size': size,
+                    'added': size,
+                    'files': None,
+                    'created': datetime.fromtimestamp(os.path.getctime(filepath)).strftime('%Y-%m-%d %H:%M:%S')
+                })
+    backups.sort(key=lambda x: x['created'], reverse=True)
+    return backups
+
+def collect_garbage(backup_dir):
+    # حذف المحتوى الذي لم يعد أي manifest يشير إليه
+    referenced = set()
+    manifests_dir = _manifests_dir(backup_dir)
+    for filename in os.listdir(manifests_dir):
+        if filename.endswith('.json'):
+            manifest = load_manifest(backup_dir, filename)
+            for _, entry in _manifest_entries(manifest):
+                referenced.add(os.path.basename(_object_path(backup_dir, entry['sha256'], entry['compressed'])))
+    freed = 0
+    for root, dirs, files in os.walk(_objects_dir(backup_dir)):
+        for filename in files:
+            if filename not in referenced and not filename.endswith('.tmp'):
+                path = os.path.join(root, filename)
+                freed += os.path.getsize(path)
+                os.remove(path)
+    return freed
+
+def delete_backup(backup_dir, name):
+    load_manifest(backup_dir, name)
+    os.remove(os.path.join(_manifests_dir(backup_dir), name))
+    return collect_garbage(backup_dir)
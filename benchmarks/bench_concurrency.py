@@ -0,0 +1,103 @@
+# قياس الإنتاجية (قراءة/كتابة في الثانية) مع N عميل متوازٍ لكل إعداد لقاعدة البيانات:
+# SQLite بالإعدادات الافتراضية، SQLite بإعدادات database.py (WAL ...)، وقاعدة خادم إن حُددت.
+# كل عميل عملية مستقلة (مثل عمليات gunicorn) تنفذ 80% قراءة و20% كتابة لمدة محددة.
+# الاستخدام: python benchmarks/bench_concurrency.py [1 4 8 16]
+#            BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_concurrency.py
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from config import Config
+from models import db, Car, AuditLog
+from database import configure_sqlite_engine, engine_options, database_profile
+
+DURATION = float(os.environ.get('BENCH_DURATION', 5))
+CARS = 5000
+WRITE_RATIO = 0.2
+
+def config_for(uri):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config['SQLALCHEMY_DATABASE_URI'] = uri
+    return config
+
+def make_engine(profile, uri):
+    if profile == 'sqlite-default':
+        return create_engine(uri)
+    config = config_for(uri)
+    engine = create_engine(uri, **engine_options(config))
+    if engine.dialect.name == 'sqlite':
+        configure_sqlite_engine(engine, config)
+    return engine
+
+def seed(engine):
+    db.metadata.drop_all(engine, tables=[Car.__table__, AuditLog.__table__])
+    db.metadata.create_all(engine, tables=[Car.__table__, AuditLog.__table__])
+    with engine.begin() as connection:
+        connection.execute(Car.__table__.insert(), [
+            {'unique_id': f'CAR-B-{i:06d}', 'chassis_number': f'CH{i:010d}', 'brand': 'تويوتا', 'model': 'هايلكس',
+             'status': 'active' if i % 5 else 'maintenance', 'created_at': datetime.utcnow()}
+            for i in range(1, CARS + 1)
+        ])
+
+def client(args):
+    profile, uri, seed_value = args
+    engine = make_engine(profile, uri)
+    rng = random.Random(seed_value)
+    cars = Car.__table__
+    reads = writes = errors = 0
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < WRITE_RATIO:
+                # كتابة: تعديل سجل وحدث في سجل النشاط في معاملة واحدة
+                car_id = rng.randint(1, CARS)
+                with engine.begin() as connection:
+                    connection.execute(cars.update().where(cars.c.id == car_id).values(notes=f'bench {seed_value}'))
+                    connection.execute(AuditLog.__table__.insert(), {
+                        'username': 'bench', 'action': 'update', 'entity_type': 'Car', 'entity_id': car_id,
+                        'timestamp': datetime.utcnow()
+                    })
+                writes += 1
+            else:
+                with engine.connect() as connection:
+                    connection.execute(select(cars).where(cars.c.id == rng.randint(1, CARS))).first()
+                    connection.execute(select(cars.c.status, func.count()).group_by(cars.c.status)).all()
+                reads += 1
+        except OperationalError:
+            # database is locked وما شابه
+            errors += 1
+    engine.dispose()
+    return reads, writes, errors
+
+def run(profile, uri, clients):
+    engine = make_engine(profile, uri)
+    seed(engine)
+    settings = database_profile(engine) if profile != 'sqlite-default' else {}
+    engine.dispose()
+    with Pool(clients) as pool:
+        results = pool.map(client, [(profile, uri, i) for i in range(clients)])
+    reads, writes, errors = (sum(values) for values in zip(*results))
+    print(f'{profile:<15} | {clients:>3} عميل | قراءة {reads / DURATION:9.0f}/s | كتابة {writes / DURATION:8.0f}/s | أخطاء {errors:5d}')
+    return settings
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 4, 8, 16]
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ('sqlite-default', 'sqlite-wal'):
+            uri = f'sqlite:///{os.path.join(tmp, profile + ".db")}'
+            for clients in counts:
+                settings = run(profile, uri, clients)
+            if settings:
+                print(f'  {settings}')
+    server_uri = os.environ.get('BENCH_DATABASE_URL')
+    if server_uri:
+        for clients in counts:
+            run('server', server_uri, clients)
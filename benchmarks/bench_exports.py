@@ -0,0 +1,91 @@
+# قياس ذروة الذاكرة والزمن وزمن أول جزء يصل للعميل لتصدير السيارات: الطريقة القديمة
+# (قائمة + DataFrame + ExcelWriter) مقابل طبقة التصدير المتدفق في exports.py
+# الاستخدام: python benchmarks/bench_exports.py [1000 10000 100000 1000000]
+import os
+import sys
+import io
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from flask import Flask
+from models import db, Car
+from exports import iter_xlsx, iter_csv, format_date, EXPORT_BATCH_SIZE
+
+HEADERS = ['الرقم المرجعي', 'رقم الشاسيه', 'الماركة', 'الموديل', 'النوع', 'اللون', 'السنة', 'رقم اللوحة', 'الحالة', 'تاريخ الإدخال', 'ملاحظات']
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+def seed(count):
+    batch = []
+    for i in range(1, count + 1):
+        batch.append({'unique_id': f'CAR-B-{i:07d}', 'chassis_number': f'CH{i:010d}', 'brand': 'تويوتا', 'model': 'هايلكس',
+                      'car_type': 'بيك أب', 'color': 'أبيض', 'year': 2020, 'plate_number': f'{i:07d}', 'status': 'active',
+                      'notes': 'ملاحظات تجريبية للسيارة'})
+        if len(batch) == 10000:
+            db.session.bulk_insert_mappings(Car, batch)
+            batch = []
+    db.session.bulk_insert_mappings(Car, batch)
+    db.session.commit()
+
+def rows():
+    return ([car.unique_id, car.chassis_number, car.brand, car.model, car.car_type, car.color, car.year,
+             car.plate_number, car.status, format_date(car.created_at), car.notes]
+            for car in Car.query.order_by(Car.id).yield_per(EXPORT_BATCH_SIZE))
+
+def legacy_export():
+    data = [dict(zip(HEADERS, row)) for row in ([car.unique_id, car.chassis_number, car.brand, car.model, car.car_type, car.color,
+                                                  car.year, car.plate_number, car.status, car.created_at.strftime('%Y-%m-%d'), car.notes]
+                                                 for car in Car.query.all())]
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        pd.DataFrame(data).to_excel(writer, index=False, sheet_name='السيارات')
+    # الملف كله يُبنى قبل إرسال أي جزء
+    return len(output.getvalue()), None
+
+def streamed(body):
+    size, first_chunk_at = 0, None
+    for chunk in body:
+        if first_chunk_at is None:
+            first_chunk_at = time.perf_counter()
+        size += len(chunk)
+    return size, first_chunk_at
+
+def measure(func):
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    size, first_chunk_at = func()
+    end = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return end - start, (first_chunk_at or end) - start, peak / (1024 * 1024), size
+
+def run(count, with_legacy):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            seed(count)
+            results = {}
+            if with_legacy:
+                results['القديم xlsx'] = measure(legacy_export)
+            results['المتدفق xlsx'] = measure(lambda: streamed(iter_xlsx(rows(), HEADERS, 'السيارات', 'شركة الأرشيف')))
+            results['المتدفق csv'] = measure(lambda: streamed(iter_csv(rows(), HEADERS, 'شركة الأرشيف')))
+            db.engine.dispose()
+    for name, (elapsed, first_chunk, peak, size) in results.items():
+        print(f'{count:>8} صف | {name:<12} | {elapsed:8.2f}s | أول جزء {first_chunk:7.2f}s | '
+              f'ذروة الذاكرة {peak:8.1f} MB | الحجم {size / (1024 * 1024):7.1f} MB')
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000, 1000000]
+    for count in counts:
+        # الطريقة القديمة تستهلك ذاكرة كبيرة، لذلك تُقاس حتى 100,000 صف فقط
+        run(count, with_legacy=count <= 100000)
@@ -0,0 +1,77 @@
+# قياس زمن وذروة ذاكرة الاستيراد الجماعي (imports.py) لملف موظفين بـ N صف بصيغتي xlsx و csv،
+# مع نسبة صغيرة من الصفوف الخاطئة (حقل مطلوب فارغ، رقم وطني مكرر، تاريخ غير صحيح).
+# الاستخدام: python benchmarks/bench_import.py [--memory] [1000 10000 50000]
+# (--memory يقيس ذروة الذاكرة بـ tracemalloc الذي يبطئ التنفيذ عدة مرات، فلا يُقاس الزمن والذاكرة معاً)
+import os
+import sys
+import csv
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP = tempfile.mkdtemp()
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(TMP, "import.db")}'
+config.Config.UPLOAD_FOLDER = os.path.join(TMP, 'uploads')
+config.Config.BACKUP_FOLDER = os.path.join(TMP, 'backups')
+
+from openpyxl import Workbook
+from app import app, Employee
+from imports import import_file
+
+HEADERS = ['الاسم الكامل', 'الرقم الوطني', 'تاريخ الميلاد', 'الجنس', 'الهاتف', 'القسم', 'الوظيفة', 'تاريخ التعيين', 'ملاحظات']
+
+def make_rows(count, offset):
+    for i in range(count):
+        national_id = f'{offset + i:011d}'
+        if i % 500 == 1:
+            national_id = f'{offset + i - 1:011d}'  # مكرر
+        yield [
+            '' if i % 1000 == 7 else f'موظف تجريبي {i}', national_id,
+            'خطأ' if i % 1000 == 9 else '1990-01-01', 'ذكر', f'09{i:08d}', 'الإنتاج', 'عامل', '2024-05-01', 'ملاحظات'
+        ]
+
+def write_csv(path, count, offset):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        writer.writerows(make_rows(count, offset))
+
+def write_xlsx(path, count, offset):
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('الموظفون')
+    worksheet.append(HEADERS)
+    for row in make_rows(count, offset):
+        worksheet.append(row)
+    workbook.save(path)
+
+def measure(path, memory):
+    with app.app_context():
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            result = import_file('employees', f, path)
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return result, elapsed, peak
+
+if __name__ == '__main__':
+    memory = '--memory' in sys.argv
+    sizes = [int(arg) for arg in sys.argv[1:] if arg != '--memory'] or [1000, 10000, 50000]
+    offset = 0
+    for size in sizes:
+        for fmt, writer in (('csv', write_csv), ('xlsx', write_xlsx)):
+            path = os.path.join(TMP, f'employees_{size}.{fmt}')
+            writer(path, size, offset)
+            offset += size
+            result, elapsed, peak = measure(path, memory)
+            usage = f'ذروة الذاكرة {peak / 1024 / 1024:6.1f} MB' if memory else f'{size / elapsed:,.0f} صف/ث'
+            print(f'{size:>7} صف {fmt:>4}: {elapsed:6.2f} ث، {usage}، {result["imported"]} مستورد، {result["failed"]} مرفوض')
+    with app.app_context():
+        print(f'إجمالي الموظفين: {Employee.query.count()}')
@@ -0,0 +1,129 @@
+# مقارنة أداء حساب الرواتب: الحلقة القديمة لكل موظف مقابل المحرك المجمع في payroll.py
+# الاستخدام: python benchmarks/bench_payroll.py [100 1000 10000]
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, Employee, EmployeeSalary, SalarySettings, AttendanceRecord, OvertimeRecord, AdvancePayment, PayrollRecord
+from payroll import run_weekly_payroll, PAYROLL_COLUMNS
+
+WEEK_START = date(2025, 9, 8)
+WEEK_NUMBER, YEAR = WEEK_START.isocalendar()[1], WEEK_START.year
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+def seed(count):
+    rnd = random.Random(count)
+    employees = [{'unique_id': f'EMP-B-{i:06d}', 'national_id': f'N{i:09d}', 'full_name': f'موظف {i}', 'status': 'active'} for i in range(1, count + 1)]
+    db.session.bulk_insert_mappings(Employee, employees)
+    salaries, attendance, overtime, advances = [], [], [], []
+    for employee_id in range(1, count + 1):
+        if employee_id % 50 != 0:  # بعض الموظفين بدون معلومات راتب
+            if employee_id % 3 == 0:
+                salaries.append({'employee_id': employee_id, 'base_salary': rnd.choice([0, 2600.0, 3120.0]), 'daily_wage': None})
+            else:
+                salaries.append({'employee_id': employee_id, 'base_salary': 0.0, 'daily_wage': rnd.choice([90.0, 110.0, 125.5])})
+        for day in range(6):
+            attendance.append({'employee_id': employee_id, 'date': WEEK_START + timedelta(days=day), 'week_number': WEEK_NUMBER, 'year': YEAR,
+                               'status': rnd.choice(['present', 'present', 'present', 'absent', 'half_day'])})
+        for _ in range(rnd.randint(0, 2)):
+            overtime.append({'employee_id': employee_id, 'date': WEEK_START, 'week_number': WEEK_NUMBER, 'year': YEAR,
+                             'overtime_type': rnd.choice(['daily', 'hourly']), 'quantity': rnd.choice([0.5, 1.0, 2.5, 3.0])})
+        for _ in range(rnd.randint(0, 2)):
+            advances.append({'employee_id': employee_id, 'amount': rnd.choice([50.0, 75.5, 100.0]), 'payment_date': WEEK_START, 'is_paid': False})
+    db.session.bulk_insert_mappings(EmployeeSalary, salaries)
+    db.session.bulk_insert_mappings(AttendanceRecord, attendance)
+    db.session.bulk_insert_mappings(OvertimeRecord, overtime)
+    db.session.bulk_insert_mappings(AdvancePayment, advances)
+    db.session.add(SalarySettings())
+    db.session.commit()
+
+def legacy_payroll(week_number, year, salary_settings):
+    # نسخة مطابقة للحلقة القديمة في calculate_payroll (مرجع للمقارنة فقط)
+    for employee in Employee.query.filter_by(status='active').all():
+        attendances = AttendanceRecord.query.filter_by(employee_id=employee.id, week_number=week_number, year=year).all()
+        overtime_records = OvertimeRecord.query.filter_by(employee_id=employee.id, week_number=week_number, year=year).all()
+        advances = AdvancePayment.query.filter_by(employee_id=employee.id, is_paid=False).all()
+        present_days = len([a for a in attendances if a.status == 'present'])
+        absent_days = len([a for a in attendances if a.status == 'absent'])
+        half_days = len([a for a in attendances if a.status == 'half_day'])
+        overtime_days = sum([r.quantity for r in overtime_records if r.overtime_type == 'daily'])
+        overtime_hours = sum([r.quantity for r in overtime_records if r.overtime_type == 'hourly'])
+        salary_info = EmployeeSalary.query.filter_by(employee_id=employee.id).first()
+        if not salary_info:
+            continue
+        if salary_info.daily_wage:
+            basic_salary = present_days * salary_info.daily_wage
+            if half_days > 0:
+                basic_salary += half_days * (salary_info.daily_wage / 2)
+        elif salary_info.base_salary:
+            daily_rate = salary_info.base_salary / 26
+            basic_salary = present_days * daily_rate
+            if half_days > 0:
+                basic_salary += half_days * (daily_rate / 2)
+        else:
+            basic_salary = 0
+        overtime_amount = (overtime_days * salary_settings.overtime_daily_rate) + (overtime_hours * salary_settings.overtime_hourly_rate)
+        deductions = absent_days * (salary_info.daily_wage if salary_info.daily_wage else salary_info.base_salary / 26)
+        advances_deduction = sum([a.amount for a in advances])
+        net_salary = basic_salary + overtime_amount - deductions - advances_deduction
+        existing = PayrollRecord.query.filter_by(employee_id=employee.id, week_number=week_number, year=year).first()
+        values = dict(present_days=present_days, absent_days=absent_days, half_days=half_days, overtime_days=overtime_days,
+                      overtime_hours=overtime_hours, basic_salary=basic_salary, overtime_amount=overtime_amount,
+                      deductions=deductions, advances_deduction=advances_deduction, net_salary=net_salary)
+        if existing:
+            for key, value in values.items():
+                setattr(existing, key, value)
+        else:
+            db.session.add(PayrollRecord(employee_id=employee.id, week_number=week_number, year=year, paid=False, **values))
+    db.session.commit()
+
+def snapshot():
+    rows = db.session.query(PayrollRecord.employee_id, *[getattr(PayrollRecord, c) for c in PAYROLL_COLUMNS]).order_by(PayrollRecord.employee_id).all()
+    return [tuple(row) for row in rows]
+
+def run(count, with_legacy):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            seed(count)
+            salary_settings = SalarySettings.query.first()
+            legacy_time = legacy_rows = None
+            if with_legacy:
+                start = time.perf_counter()
+                legacy_payroll(WEEK_NUMBER, YEAR, salary_settings)
+                legacy_time = time.perf_counter() - start
+                legacy_rows = snapshot()
+                PayrollRecord.query.delete()
+                db.session.commit()
+            start = time.perf_counter()
+            run_weekly_payroll(WEEK_NUMBER, YEAR, salary_settings)
+            db.session.commit()
+            engine_time = time.perf_counter() - start
+            # تشغيل ثانٍ لقياس مسار التحديث
+            start = time.perf_counter()
+            run_weekly_payroll(WEEK_NUMBER, YEAR, salary_settings)
+            db.session.commit()
+            update_time = time.perf_counter() - start
+            if with_legacy:
+                assert snapshot() == legacy_rows, 'نتائج المحرك الجديد لا تطابق الحلقة القديمة'
+            db.engine.dispose()
+    legacy = f'{legacy_time:8.3f}s' if legacy_time is not None else '       -'
+    print(f'{count:>7} موظف | القديم {legacy} | الجديد (إدخال) {engine_time:7.3f}s | الجديد (تحديث) {update_time:7.3f}s')
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]
+    for count in counts:
+        # الحلقة القديمة بطيئة جداً عند 10,000 موظف، لذلك تُقارن حتى 1,000 فقط
+        run(count, with_legacy=count <= 1000)
@@ -0,0 +1,95 @@
+# اختبار ضغط لدفتر المخزون: N عملية متوازية ترسل قسائم في نفس الوقت على نفس المواد، ثم التحقق من:
+# - عدم نزول أي رصيد تحت الصفر رغم أن الطلب الكلي أكبر من المتوفر
+# - عدم ضياع أي تعديل: الرصيد النهائي = الرصيد الأولي + مجموع الحركات المسجلة فعلاً
+# - آخر balance_after لكل مادة يساوي رصيدها في stock_item
+# الاستخدام: python benchmarks/bench_stock_ledger.py [عدد العمليات] [قسائم لكل عملية]
+import os
+import sys
+import random
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP = tempfile.mkdtemp()
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(TMP, "ledger.db")}'
+config.Config.UPLOAD_FOLDER = os.path.join(TMP, 'uploads')
+config.Config.BACKUP_FOLDER = os.path.join(TMP, 'backups')
+
+from sqlalchemy import func, select
+from app import app, db, Warehouse, Material, StockItem, StockTransaction
+from stock_ledger import post_voucher
+
+INITIAL_STOCK = 500
+
+def seed():
+    with app.app_context():
+        warehouses = [Warehouse(name=f'مستودع {i}') for i in range(2)]
+        materials = [Material(name=f'مادة {i}', unit='طن', min_stock_level=10) for i in range(3)]
+        db.session.add_all(warehouses + materials)
+        db.session.commit()
+        ok, _ = post_voucher([
+            {'warehouse_id': w.id, 'material_id': m.id, 'transaction_type': 'in', 'quantity': INITIAL_STOCK}
+            for w in warehouses for m in materials
+        ])
+        assert ok
+        return [w.id for w in warehouses], [m.id for m in materials]
+
+def client(args):
+    seed_value, vouchers, warehouse_ids, material_ids = args
+    rng = random.Random(seed_value)
+    with app.app_context():
+        db.engine.dispose(close=False)
+        posted = rejected = 0
+        for _ in range(vouchers):
+            # قسيمة من 1-4 أسطر: صرف في الغالب وبعض الإضافات
+            lines = [{'warehouse_id': rng.choice(warehouse_ids), 'material_id': rng.choice(material_ids),
+                      'transaction_type': 'out' if rng.random() < 0.8 else 'in', 'quantity': rng.randint(1, 5)}
+                     for _ in range(rng.randint(1, 4))]
+            ok, _ = post_voucher(lines)
+            if ok:
+                posted += 1
+            else:
+                rejected += 1
+        return posted, rejected
+
+def verify():
+    with app.app_context():
+        errors = []
+        for item in StockItem.query:
+            moves = db.session.execute(
+                select(StockTransaction.transaction_type, func.sum(StockTransaction.quantity))
+                .where(StockTransaction.warehouse_id == item.warehouse_id, StockTransaction.material_id == item.material_id)
+                .group_by(StockTransaction.transaction_type)
+            ).all()
+            totals = dict(moves)
+            expected = totals.get('in', 0) - totals.get('out', 0)
+            last = StockTransaction.query.filter_by(warehouse_id=item.warehouse_id, material_id=item.material_id)\
+                .order_by(StockTransaction.id.desc()).first()
+            if item.quantity < 0:
+                errors.append(f'رصيد سالب {item.warehouse_id}/{item.material_id}: {item.quantity}')
+            if abs(item.quantity - expected) > 1e-9:
+                errors.append(f'تعديل ضائع {item.warehouse_id}/{item.material_id}: {item.quantity} != {expected}')
+            if abs(last.balance_after - item.quantity) > 1e-9:
+                errors.append(f'balance_after {item.warehouse_id}/{item.material_id}: {last.balance_after} != {item.quantity}')
+        return errors
+
+if __name__ == '__main__':
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    vouchers = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    warehouse_ids, material_ids = seed()
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        results = pool.map(client, [(i, vouchers, warehouse_ids, material_ids) for i in range(processes)])
+    elapsed = time.perf_counter() - started
+    posted = sum(r[0] for r in results)
+    rejected = sum(r[1] for r in results)
+    print(f'{processes} عملية × {vouchers} قسيمة: {posted} منفذة، {rejected} مرفوضة لعدم كفاية الرصيد، '
+          f'{(posted + rejected) / elapsed:.0f} قسيمة/ث')
+    errors = verify()
+    for error in errors:
+        print(f'خطأ: {error}')
+    print('لا تعديلات ضائعة ولا أرصدة سالبة' if not errors else f'{len(errors)} خطأ')
+    sys.exit(1 if errors else 0)
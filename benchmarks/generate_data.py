@@ -0,0 +1,343 @@
+# مولد بيانات تجريبية بحجم الإنتاج لكل النماذج (السيارات، الموظفون، الوثائق، المعدات وسجلات وقودها وصيانتها،
+# الحضور والإضافي والسلف والرواتب، المستودعات والمواد وحركات المخزون، سجل النشاط)، بنفس النتيجة لنفس البذرة.
+# الإدخال بعبارات Core على دفعات، ثم يُعاد بناء فهرس البحث ومؤشرات لوحة التحكم ولقطة المخزون لأن الإدخال
+# المباشر لا يمر بأحداث SQLAlchemy. الملفات المرفقة لا تُولد (لا توجد ملفات على القرص).
+# قاعدة البيانات من LOADTEST_DATABASE_URL (افتراضياً instance/loadtest.db)، ويستخدمها load_test.py أيضاً.
+# الاستخدام: python benchmarks/generate_data.py [--scale small|medium|production] [--seed 1]
+#            [--employees 10000 --attendance 2000000 --stock-movements 500000 ...]
+import os
+import sys
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = (os.environ.get('LOADTEST_DATABASE_URL')
+                                         or f"sqlite:///{os.path.join(ROOT, 'instance', 'loadtest.db')}")
+config.Config.AUDIT_ASYNC = False
+
+from sqlalchemy import func, select
+from app import app, db, Warehouse, Material, StockItem, StockTransaction
+from models import (User, Car, MaintenanceRecord, Employee, EmployeeSalary, Document, Equipment, FuelRecord,
+                    EquipmentMaintenance, SalarySettings, AttendanceRecord, OvertimeRecord, AdvancePayment, AuditLog,
+                    reserve_sequential_ids)
+from payroll import run_weekly_payroll
+from search import rebuild_search_index, search_enabled
+from dashboard_metrics import recompute_metrics
+from fuel_analytics import refresh_fuel_efficiency, refresh_fuel_baselines
+from maintenance_forecast import refresh_maintenance_forecast
+from stock_ledger import take_stock_snapshot, snapshot_day
+
+BATCH_SIZE = 10000
+ADMIN_PASSWORD = 'admin123'
+
+SCALES = {
+    'small': {
+        'employees': 200, 'attendance': 20000, 'overtime': 2000, 'advances': 500, 'payroll_weeks': 4,
+        'cars': 200, 'car_maintenance': 1000, 'documents': 500, 'equipment': 50, 'fuel': 5000,
+        'equipment_maintenance': 500, 'warehouses': 5, 'materials': 50, 'stock_movements': 10000, 'audit': 20000,
+    },
+    'medium': {
+        'employees': 2000, 'attendance': 300000, 'overtime': 20000, 'advances': 5000, 'payroll_weeks': 8,
+        'cars': 1000, 'car_maintenance': 10000, 'documents': 10000, 'equipment': 200, 'fuel': 50000,
+        'equipment_maintenance': 5000, 'warehouses': 10, 'materials': 300, 'stock_movements': 100000, 'audit': 200000,
+    },
+    'production': {
+        'employees': 10000, 'attendance': 2000000, 'overtime': 100000, 'advances': 20000, 'payroll_weeks': 12,
+        'cars': 5000, 'car_maintenance': 50000, 'documents': 50000, 'equipment': 500, 'fuel': 200000,
+        'equipment_maintenance': 20000, 'warehouses': 20, 'materials': 1000, 'stock_movements': 500000, 'audit': 1000000,
+    },
+}
+
+FIRST_NAMES = ['محمد', 'أحمد', 'علي', 'عمر', 'خالد', 'يوسف', 'إبراهيم', 'حسن', 'سامر', 'ماهر', 'فادي', 'رامي', 'سعيد', 'نور', 'سارة', 'ليلى']
+LAST_NAMES = ['الأحمد', 'الخطيب', 'الحلبي', 'الشامي', 'العلي', 'المصري', 'النجار', 'الحداد', 'السيد', 'الزعبي', 'القاسم', 'الحسن']
+DEPARTMENTS = ['الإنتاج', 'النقل', 'الصيانة', 'المستودعات', 'الإدارة', 'المبيعات']
+POSITIONS = ['عامل', 'سائق', 'فني', 'مشرف', 'محاسب', 'أمين مستودع']
+CAR_BRANDS = [('تويوتا', 'هايلكس'), ('نيسان', 'باترول'), ('هيونداي', 'اكسنت'), ('ميتسوبيشي', 'L200'), ('إيسوزو', 'NPR'), ('كيا', 'سيراتو')]
+COLORS = ['أبيض', 'أسود', 'فضي', 'أحمر', 'أزرق']
+CAR_MAINTENANCE = ['هيدروليك', 'محرك', 'بواط', 'حلة', 'جبالة', 'تريلا']
+EQUIPMENT_TYPES = ['قلاب', 'خلاطة', 'لودر', 'بلدوزر', 'ريشة', 'مضخة خرسانة']
+EQUIPMENT_BRANDS = [('مان', 'TGS'), ('مرسيدس', 'أكتروس'), ('كاتربيلر', '950H'), ('فولفو', 'FMX'), ('كوماتسو', 'D65')]
+DOC_TYPES = ['عقد', 'رخصة', 'تأمين', 'فاتورة', 'كتاب رسمي']
+DOC_FOLDERS = ['عام', 'العقود', 'الرخص', 'التأمين', 'المالية']
+MATERIALS = [('إسمنت', 'طن', 'مواد خام'), ('رمل', 'متر مكعب', 'مواد خام'), ('بحص', 'متر مكعب', 'مواد خام'),
+             ('حديد', 'طن', 'مواد خام'), ('مازوت', 'لتر', 'وقود'), ('زيت محرك', 'لتر', 'قطع غيار'), ('فلتر هواء', 'قطعة', 'قطع غيار')]
+AUDIT_ACTIONS = [('create', 'Car'), ('update', 'Employee'), ('create', 'Document'), ('update', 'Equipment'),
+                 ('login', 'User'), ('logout', 'User'), ('create', 'StockTransaction'), ('delete', 'Document')]
+
+def _insert(model, rows, returning=False):
+    # إدخال دفعة بعبارة Core؛ يعيد المعرفات بنفس ترتيب الصفوف عند الطلب
+    table = model.__table__
+    if not rows:
+        return []
+    if returning:
+        return db.session.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), rows).scalars().all()
+    db.session.execute(table.insert(), rows)
+    return []
+
+def _batched(rows, model):
+    # يستهلك مولد صفوف ويدخله على دفعات؛ يعيد عدد الصفوف
+    batch, total = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            _insert(model, batch)
+            db.session.commit()
+            total += len(batch)
+            batch = []
+    _insert(model, batch)
+    db.session.commit()
+    return total + len(batch)
+
+def _moment(rng, start, days):
+    return datetime.combine(start, datetime.min.time()) + timedelta(seconds=rng.randrange(days * 86400))
+
+def _with_ids(model, prefix, rows):
+    for row, unique_id in zip(rows, reserve_sequential_ids(prefix, len(rows))):
+        row['unique_id'] = unique_id
+    ids = _insert(model, rows, returning=True)
+    db.session.commit()
+    return ids
+
+# --- المستخدمون والإعدادات ---
+def generate_users():
+    admin = User(username='admin', email='admin@company.com', role='admin')
+    admin.set_password(ADMIN_PASSWORD)
+    users = [admin] + [User(username=f'user{i}', email=f'user{i}@company.com', role=role, password_hash=admin.password_hash)
+                       for i, role in enumerate(['archivist', 'archivist', 'user', 'user'], start=1)]
+    db.session.add_all(users)
+    if not SalarySettings.query.first():
+        db.session.add(SalarySettings())
+    db.session.commit()
+    return [(user.id, user.username) for user in users]
+
+# --- الموظفون والرواتب ---
+def generate_employees(rng, scale, start, days):
+    rows = []
+    for i in range(scale['employees']):
+        rows.append({
+            'national_id': f'{1000000000 + i:011d}', 'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'birth_date': date(1960, 1, 1) + timedelta(days=rng.randrange(40 * 365)), 'gender': rng.choice(['ذكر', 'أنثى']),
+            'phone': f'09{rng.randrange(10 ** 8):08d}', 'department': rng.choice(DEPARTMENTS), 'position': rng.choice(POSITIONS),
+            'hire_date': start - timedelta(days=rng.randrange(3650)), 'status': 'active' if rng.random() < 0.95 else 'inactive',
+            'created_at': _moment(rng, start, days),
+        })
+    ids = []
+    for offset in range(0, len(rows), BATCH_SIZE):
+        ids += _with_ids(Employee, 'EMP', rows[offset:offset + BATCH_SIZE])
+    _batched(({
+        'employee_id': employee_id,
+        'base_salary': None if daily else rng.randrange(2000, 6000, 50),
+        'daily_wage': rng.randrange(80, 250, 5) if daily else None,
+        'hourly_wage': rng.randrange(10, 30) if rng.random() < 0.5 else None,
+        'created_at': datetime.utcnow(),
+    } for employee_id, daily in ((employee_id, rng.random() < 0.6) for employee_id in ids) if rng.random() < 0.97), EmployeeSalary)
+    return ids
+
+def generate_attendance(rng, scale, employee_ids, end):
+    # أيام متتالية للخلف لكل الموظفين حتى الوصول للعدد المطلوب (سجل واحد للموظف في اليوم)
+    def rows():
+        remaining = scale['attendance']
+        day = end
+        while remaining > 0:
+            iso = day.isocalendar()
+            for employee_id in employee_ids[:remaining]:
+                roll = rng.random()
+                yield {'employee_id': employee_id, 'date': day, 'week_number': iso[1], 'year': iso[0],
+                       'status': 'present' if roll < 0.88 else 'absent' if roll < 0.95 else 'half_day',
+                       'created_at': datetime.combine(day, datetime.min.time())}
+            remaining -= min(remaining, len(employee_ids))
+            day -= timedelta(days=1)
+    return _batched(rows(), AttendanceRecord)
+
+def generate_overtime_and_advances(rng, scale, employee_ids, start, days):
+    def overtime():
+        for _ in range(scale['overtime']):
+            day = start + timedelta(days=rng.randrange(days))
+            iso = day.isocalendar()
+            hourly = rng.random() < 0.7
+            yield {'employee_id': rng.choice(employee_ids), 'date': day, 'overtime_type': 'hourly' if hourly else 'daily',
+                   'quantity': rng.randrange(1, 6) if hourly else 1, 'week_number': iso[1], 'year': iso[0],
+                   'created_at': datetime.combine(day, datetime.min.time())}
+
+    def advances():
+        for _ in range(scale['advances']):
+            day = start + timedelta(days=rng.randrange(days))
+            yield {'employee_id': rng.choice(employee_ids), 'amount': rng.randrange(100, 1500, 50), 'payment_date': day,
+                   'reason': 'سلفة', 'is_paid': rng.random() < 0.6, 'created_at': datetime.combine(day, datetime.min.time())}
+    return _batched(overtime(), OvertimeRecord), _batched(advances(), AdvancePayment)
+
+def generate_payroll(scale, end):
+    # حساب الرواتب الفعلي (payroll.py) لآخر الأسابيع
+    salary_settings = SalarySettings.query.first()
+    total = 0
+    for weeks_back in range(1, scale['payroll_weeks'] + 1):
+        year, week_number, _ = (end - timedelta(weeks=weeks_back)).isocalendar()
+        inserted, updated, _ = run_weekly_payroll(week_number, year, salary_settings)
+        db.session.commit()
+        total += inserted + updated
+    return total
+
+# --- السيارات والوثائق ---
+def generate_cars(rng, scale, start, days):
+    ids = []
+    for offset in range(0, scale['cars'], BATCH_SIZE):
+        rows = []
+        for i in range(offset, min(offset + BATCH_SIZE, scale['cars'])):
+            brand, model = rng.choice(CAR_BRANDS)
+            rows.append({'chassis_number': f'CH{i:010d}', 'brand': brand, 'model': model, 'car_type': 'بيك أب',
+                         'color': rng.choice(COLORS), 'year': rng.randrange(2005, 2026), 'plate_number': f'{rng.randrange(10 ** 6):06d}',
+                         'status': rng.choice(['active', 'active', 'active', 'inactive', 'maintenance']),
+                         'created_at': _moment(rng, start, days)})
+        ids += _with_ids(Car, 'CAR', rows)
+    _batched(({
+        'car_id': rng.choice(ids), 'maintenance_type': rng.choice(CAR_MAINTENANCE),
+        'date': start + timedelta(days=rng.randrange(days)), 'cost': rng.randrange(50, 3000), 'created_at': datetime.utcnow(),
+    } for _ in range(scale['car_maintenance'])), MaintenanceRecord)
+    return ids
+
+def generate_documents(rng, scale, start, days, today):
+    ids = []
+    for offset in range(0, scale['documents'], BATCH_SIZE):
+        rows = []
+        for i in range(offset, min(offset + BATCH_SIZE, scale['documents'])):
+            issue = start + timedelta(days=rng.randrange(days))
+            rows.append({'title': f'{rng.choice(DOC_TYPES)} رقم {i}', 'doc_type': rng.choice(DOC_TYPES), 'source': 'الإدارة',
+                         'issue_date': issue, 'receive_date': issue + timedelta(days=rng.randrange(10)),
+                         'expiry_date': today + timedelta(days=rng.randrange(-180, 365)) if rng.random() < 0.6 else None,
+                         'status': rng.choice(['pending', 'archived', 'archived']), 'folder': rng.choice(DOC_FOLDERS),
+                         'created_at': datetime.combine(issue, datetime.min.time())})
+        ids += _with_ids(Document, 'DOC', rows)
+    return ids
+
+# --- المعدات: عداد متزايد لكل معدة مع تعبئات وقود وصيانات دورية ---
+def generate_equipment(rng, scale, start, days):
+    per_equipment_fuel = max(1, scale['fuel'] // max(1, scale['equipment']))
+    per_equipment_maintenance = max(1, scale['equipment_maintenance'] // max(1, scale['equipment']))
+    fuel, maintenance, equipment = [], [], []
+    for i in range(scale['equipment']):
+        kind = rng.choice(EQUIPMENT_TYPES)
+        brand, model = rng.choice(EQUIPMENT_BRANDS)
+        daily_km = rng.uniform(20, 250)
+        consumption = rng.uniform(25, 60)  # لتر لكل 100 كم
+        interval = rng.choice([5000, 7500, 10000])
+        km = rng.randrange(10000, 200000)
+        step = days / per_equipment_fuel
+        readings = []
+        for n in range(per_equipment_fuel):
+            day = start + timedelta(days=int(n * step))
+            distance = max(1, int(daily_km * step * rng.uniform(0.6, 1.4)))
+            km += distance
+            liters = distance * consumption / 100 * (rng.uniform(1.5, 2.5) if rng.random() < 0.02 else rng.uniform(0.9, 1.1))
+            price = round(rng.uniform(0.8, 1.3), 2)
+            readings.append((day, km))
+            fuel.append({'equipment_index': i, 'date': day, 'quantity': round(liters, 1), 'price_per_liter': price,
+                         'total_cost': round(liters * price, 2), 'current_km': km, 'fuel_type': 'ديزل', 'created_at': datetime.utcnow()})
+        last_service = readings[0][1]
+        for n in range(per_equipment_maintenance):
+            day, service_km = readings[min(len(readings) - 1, (n + 1) * len(readings) // (per_equipment_maintenance + 1))]
+            last_service = service_km
+            maintenance.append({'equipment_index': i, 'maintenance_type': rng.choice(['دورية', 'دورية', 'طارئة', 'إصلاح']),
+                                'description': 'تغيير زيت وفلاتر', 'date': day, 'cost': rng.randrange(100, 5000), 'current_km': service_km,
+                                'next_maintenance_km': service_km + interval, 'performed_by': 'ورشة الشركة', 'created_at': datetime.utcnow()})
+        roll = rng.random()
+        equipment.append({'equipment_type': kind, 'brand': brand, 'model': model, 'chassis_number': f'EQ{i:08d}',
+                          'capacity': rng.choice([None, 8.0, 10.0, 12.0]), 'max_load': rng.choice([None, 20.0, 30.0]),
+                          'current_km': km, 'last_maintenance_km': last_service, 'next_maintenance_km': last_service + interval,
+                          'status': 'active' if roll < 0.85 else 'maintenance' if roll < 0.95 else 'out_of_service',
+                          'purchase_date': start - timedelta(days=rng.randrange(3000)), 'created_at': _moment(rng, start, days)})
+    ids = []
+    for offset in range(0, len(equipment), BATCH_SIZE):
+        ids += _with_ids(Equipment, 'EQP', equipment[offset:offset + BATCH_SIZE])
+    for rows, model in ((fuel, FuelRecord), (maintenance, EquipmentMaintenance)):
+        for row in rows:
+            row['equipment_id'] = ids[row.pop('equipment_index')]
+        _batched(iter(rows), model)
+    return len(fuel), len(maintenance)
+
+# --- المخزون: حركات بترتيب زمني مع رصيد لاحق صحيح، والأرصدة النهائية في stock_item ---
+def generate_stock(rng, scale, user_ids, start, days):
+    warehouse_ids = _insert(Warehouse, [{'name': f'مستودع {i + 1}', 'location': f'الموقع {i + 1}', 'is_active': True,
+                                         'created_at': datetime.combine(start, datetime.min.time())}
+                                        for i in range(scale['warehouses'])], returning=True)
+    material_ids = _insert(Material, [{'name': f'{name} {i // len(MATERIALS) + 1}', 'unit': unit, 'category': category,
+                                       'min_stock_level': rng.choice([0, 10, 50, 100]), 'created_at': datetime.combine(start, datetime.min.time())}
+                                      for i, (name, unit, category) in ((i, MATERIALS[i % len(MATERIALS)]) for i in range(scale['materials']))],
+                           returning=True)
+    db.session.commit()
+    balances = {}
+    spacing = days * 86400 / max(1, scale['stock_movements'])
+    origin = datetime.combine(start, datetime.min.time())
+
+    def rows():
+        for n in range(scale['stock_movements']):
+            key = (rng.choice(warehouse_ids), rng.choice(material_ids))
+            balance = balances.get(key, 0)
+            quantity = rng.randrange(1, 100)
+            kind = 'in' if balance < quantity or rng.random() < 0.55 else 'out'
+            balance += quantity if kind == 'in' else -quantity
+            balances[key] = balance
+            yield {'warehouse_id': key[0], 'material_id': key[1], 'transaction_type': kind, 'quantity': quantity,
+                   'balance_after': balance, 'reference': f'V-{n // 3 + 1}', 'created_by_id': rng.choice(user_ids),
+                   'created_at': origin + timedelta(seconds=n * spacing)}
+    total = _batched(rows(), StockTransaction)
+    _batched(({'warehouse_id': warehouse_id, 'material_id': material_id, 'quantity': quantity, 'last_updated': datetime.utcnow()}
+              for (warehouse_id, material_id), quantity in sorted(balances.items())), StockItem)
+    return total
+
+def generate_audit(rng, scale, users, start, days):
+    return _batched(({
+        'user_id': user_id, 'username': username, 'action': action, 'entity_type': entity, 'entity_id': rng.randrange(1, 1000),
+        'details': f'{action} {entity}', 'timestamp': _moment(rng, start, days),
+    } for user_id, username, (action, entity) in ((*rng.choice(users), rng.choice(AUDIT_ACTIONS)) for _ in range(scale['audit']))), AuditLog)
+
+def main():
+    parser = argparse.ArgumentParser(description='توليد بيانات تجريبية لاختبار الحمل')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--days', type=int, default=365, help='الفترة الزمنية للبيانات حتى اليوم')
+    for name in SCALES['small']:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name)
+    args = parser.parse_args()
+    scale = dict(SCALES[args.scale], **{name: getattr(args, name) for name in SCALES['small'] if getattr(args, name) is not None})
+    rng = random.Random(args.seed)
+    today = date.today()
+    start = today - timedelta(days=args.days)
+
+    with app.app_context():
+        if db.session.scalar(select(func.count()).select_from(Employee)):
+            sys.exit(f"قاعدة البيانات {db.engine.url} تحتوي على بيانات؛ استخدم قاعدة بيانات جديدة (LOADTEST_DATABASE_URL)")
+        print(f"[Generate] {db.engine.url} - {args.scale}: {scale}")
+        steps = [
+            ('المستخدمون', lambda: generate_users()),
+            ('الموظفون', lambda: generate_employees(rng, scale, start, args.days)),
+            ('الحضور', lambda: generate_attendance(rng, scale, results['الموظفون'], today)),
+            ('الإضافي والسلف', lambda: generate_overtime_and_advances(rng, scale, results['الموظفون'], start, args.days)),
+            ('الرواتب', lambda: generate_payroll(scale, today)),
+            ('السيارات', lambda: generate_cars(rng, scale, start, args.days)),
+            ('الوثائق', lambda: generate_documents(rng, scale, start, args.days, today)),
+            ('المعدات', lambda: generate_equipment(rng, scale, start, args.days)),
+            ('المخزون', lambda: generate_stock(rng, scale, [user_id for user_id, _ in results['المستخدمون']], start, args.days)),
+            ('سجل النشاط', lambda: generate_audit(rng, scale, results['المستخدمون'], start, args.days)),
+            ('لقطة المخزون', lambda: take_stock_snapshot(snapshot_day())),
+            ('فهرس البحث', lambda: rebuild_search_index() if search_enabled() else {}),
+            ('ملخص استهلاك الوقود', lambda: refresh_fuel_efficiency()),
+            ('خطوط أساس الوقود', lambda: refresh_fuel_baselines()),
+            ('الصيانة المتوقعة', lambda: refresh_maintenance_forecast()),
+            ('مؤشرات لوحة التحكم', lambda: recompute_metrics()),
+        ]
+        results = {}
+        total_start = time.perf_counter()
+        for name, step in steps:
+            started = time.perf_counter()
+            results[name] = step()
+            summary = len(results[name]) if isinstance(results[name], list) else results[name]
+            print(f"[Generate] {name}: {summary} ({time.perf_counter() - started:.1f} s)")
+        print(f"[Generate] اكتمل في {time.perf_counter() - total_start:.1f} s - الدخول: admin / {ADMIN_PASSWORD}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# اختبار الحمل: عدة مستخدمين متزامنين (خيوط، لكل منها جلسة دخول) ينفذون خليطاً موزوناً من المسارات الأساسية
+# (لوحة التحكم، القوائم مع البحث، حساب الرواتب، التصدير، قسائم المخزون) لمدة محددة، ثم يُكتب تقرير JSON
+# فيه p50/p95/p99 والمتوسط والأخطاء والإنتاجية لكل مسار وللكل، لمقارنة التشغيلات (--compare).
+# الخادم: --url لخادم يعمل مسبقاً (مثلاً gunicorn على قاعدة بيانات generate_data.py)، أو بدونه يُشغل التطبيق
+# داخل العملية بخادم werkzeug متعدد الخيوط على LOADTEST_DATABASE_URL (نتائجه للمقارنة النسبية فقط).
+# الاستخدام: python benchmarks/load_test.py [--url http://127.0.0.1:5000] [--users 10] [--duration 60]
+#            [--report benchmarks/reports/run.json] [--compare benchmarks/reports/previous.json]
+import os
+import sys
+import argparse
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SEARCH_TERMS = ['تويوتا', 'نيسان', 'محمد', 'أحمد', 'الخطيب', 'عقد', 'رخصة', 'قلاب', 'لودر']
+
+def _recent_week(rng):
+    year, week_number, _ = (date.today() - timedelta(weeks=rng.randrange(1, 5))).isocalendar()
+    return {'week_number': week_number, 'year': year}
+
+def _stock_voucher(rng):
+    # سطر إدخال وسطر صرف (قد يُرفض الصرف لعدم كفاية الرصيد، وهذا جزء من الحمل الطبيعي)
+    return {'warehouse_id': [rng.randrange(1, 4)] * 2, 'material_id': [rng.randrange(1, 20)] * 2,
+            'transaction_type': ['in', 'out'], 'quantity': [rng.randrange(5, 50), rng.randrange(1, 20)],
+            'reference': f'LT-{rng.randrange(10 ** 6)}'}
+
+# (الاسم، الوزن، الطريقة، المسار، بيانات POST)
+SCENARIOS = [
+    ('dashboard', 20, 'GET', lambda rng: '/', None),
+    ('car_search', 10, 'GET', lambda rng: '/cars?' + urlencode({'q': rng.choice(SEARCH_TERMS)}), None),
+    ('employee_search', 10, 'GET', lambda rng: '/employees?' + urlencode({'q': rng.choice(SEARCH_TERMS)}), None),
+    ('document_list', 8, 'GET', lambda rng: '/documents', None),
+    ('equipment_list', 6, 'GET', lambda rng: '/equipment', None),
+    ('payroll_list', 8, 'GET', lambda rng: '/salary/payroll', None),
+    ('audit_log', 4, 'GET', lambda rng: '/audit', None),
+    ('stock_balance', 6, 'GET', lambda rng: '/inventory/balance', None),
+    ('material_history', 6, 'GET', lambda rng: f'/inventory/material/{rng.randrange(1, 20)}', None),
+    ('stock_transaction', 8, 'POST', lambda rng: '/inventory/transaction', _stock_voucher),
+    ('payroll_calculation', 1, 'POST', lambda rng: '/salary/payroll/calculate', _recent_week),
+    ('export_cars_csv', 2, 'GET', lambda rng: '/cars/export?format=csv', None),
+    ('export_employees_xlsx', 1, 'GET', lambda rng: '/employees/export', None),
+]
+
+class _NoRedirect(HTTPRedirectHandler):
+    # زمن الإجراء نفسه بدون الصفحة التي يُعاد التوجيه إليها
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class VirtualUser:
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect)
+        status, _ = self.request('POST', '/login', {'username': username, 'password': password})
+        if status != 302:
+            raise RuntimeError(f'فشل تسجيل الدخول ({status})')
+
+    def request(self, method, path, data=None):
+        body = urlencode(data, doseq=True).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=body if method == 'POST' else None, timeout=300) as response:
+                size = sum(len(chunk) for chunk in iter(lambda: response.read(65536), b''))
+                return response.status, size
+        except HTTPError as e:
+            return e.code, 0
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(samples, elapsed):
+    # samples: [(زمن بالثواني، نجح)]
+    latencies = sorted(seconds * 1000 for seconds, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'requests': len(samples), 'errors': errors, 'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / len(latencies), 1) if latencies else None,
+        'p50_ms': _round(percentile(latencies, 0.50)), 'p95_ms': _round(percentile(latencies, 0.95)),
+        'p99_ms': _round(percentile(latencies, 0.99)), 'max_ms': _round(latencies[-1] if latencies else None),
+    }
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+def run(base_url, users, duration, seed, username, password, scenarios):
+    samples = {name: [] for name, *_ in scenarios}
+    lock = threading.Lock()
+    deadline = [None]
+    weights = [weight for _, weight, *_ in scenarios]
+    failures = []
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        try:
+            user = VirtualUser(base_url, username, password)
+        except Exception as e:
+            failures.append(str(e))
+            return
+        while time.perf_counter() < deadline[0]:
+            name, _, method, path, data = rng.choices(scenarios, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, _ = user.request(method, path(rng), data(rng) if data else None)
+                ok = status < 400
+            except OSError:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[name].append((elapsed, ok))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(users)]
+    started = time.perf_counter()
+    deadline[0] = started + duration
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        sys.exit(f'[Load Test] {failures[0]}')
+    return samples, elapsed
+
+def start_local_server():
+    # التطبيق داخل العملية على قاعدة بيانات الاختبار
+    import config
+    config.Config.SQLALCHEMY_DATABASE_URI = (os.environ.get('LOADTEST_DATABASE_URL')
+                                             or f"sqlite:///{os.path.join(ROOT, 'instance', 'loadtest.db')}")
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', config.Config.SQLALCHEMY_DATABASE_URI
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(report, previous_path):
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"\nمقارنة مع {previous_path} ({previous['meta']['started_at']}, {previous['meta'].get('git_commit')})")
+    print(f"{'المسار':<24}{'p50':>18}{'p95':>18}{'p99':>18}{'rps':>16}")
+    for name, current in list(report['routes'].items()) + [('TOTAL', report['total'])]:
+        before = previous['routes'].get(name) if name != 'TOTAL' else previous['total']
+        if not before:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if current[key] is None or before[key] is None:
+                cells.append(f"{'-':>18}")
+                continue
+            change = (current[key] - before[key]) / before[key] * 100 if before[key] else 0
+            cells.append(f"{before[key]:>7}→{current[key]:<7}{change:+.0f}%".rjust(18))
+        print(f"{name:<24}{''.join(cells)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار الحمل للمسارات الأساسية')
+    parser.add_argument('--url', help='عنوان خادم يعمل مسبقاً؛ بدونه يُشغل التطبيق داخل العملية')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60, help='بالثواني')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--only', help='أسماء مسارات مفصولة بفواصل (مثلاً dashboard,car_search)')
+    parser.add_argument('--report', help='مسار تقرير JSON (افتراضياً benchmarks/reports/load_<الوقت>.json)')
+    parser.add_argument('--compare', help='تقرير سابق للمقارنة')
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.only:
+        names = set(args.only.split(','))
+        scenarios = [scenario for scenario in SCENARIOS if scenario[0] in names]
+    database = None
+    base_url = args.url
+    if not base_url:
+        base_url, database = start_local_server()
+    started_at = datetime.now()
+    print(f"[Load Test] {base_url}: {args.users} مستخدم لمدة {args.duration:g} ثانية")
+    samples, elapsed = run(base_url, args.users, args.duration, args.seed, args.username, args.password, scenarios)
+
+    report = {
+        'meta': {
+            'started_at': started_at.isoformat(timespec='seconds'), 'duration_s': round(elapsed, 1), 'users': args.users,
+            'seed': args.seed, 'url': base_url, 'database': database, 'git_commit': _git_commit(),
+            'python': platform.python_version(), 'cpu_count': os.cpu_count(),
+            'weights': {name: weight for name, weight, *_ in scenarios},
+        },
+        'routes': {name: summarize(values, elapsed) for name, values in samples.items()},
+        'total': summarize([sample for values in samples.values() for sample in values], elapsed),
+    }
+    path = args.report or os.path.join(ROOT, 'benchmarks', 'reports', f"load_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'المسار':<24}{'طلبات':>8}{'أخطاء':>8}{'rps':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in list(report['routes'].items()) + [('TOTAL', report['total'])]:
+        print(f"{name:<24}{stats['requests']:>8}{stats['errors']:>8}{stats['throughput_rps']:>8}"
+              f"{stats['p50_ms'] or '-':>10}{stats['p95_ms'] or '-':>10}{stats['p99_ms'] or '-':>10}")
+    print(f"[Load Test] التقرير: {path}")
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import os
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import Column, Index, MetaData, Table, inspect, text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from models import db, CompanySettings, DocumentNotification, FuelBaseline, FuelEfficiency, IdCounter, MaintenanceForecast, SchemaVersion, StoredFile, seed_id_counters
+from schema_baseline import BASELINE
+from payroll import ensure_attendance_unique_index
+from search import ensure_search_index
+from dashboard_metrics import init_dashboard_metrics
+from notifications import scan_document_expiry
+from stock_ledger import take_stock_snapshot, snapshot_day
+from file_store import file_store
+from fuel_analytics import refresh_fuel_efficiency, refresh_fuel_baselines
+from maintenance_forecast import refresh_maintenance_forecast
+from settings_cache import settings_cache
+from audit import audit_writer
+
+# تهيئة التطبيق عند التشغيل مرة واحدة بدلاً من كل طلب:
+# - ترحيلات مرقمة تُنفذ مرة واحدة لكل قاعدة بيانات ويُسجل كل منها في جدول schema_version
+# - إنشاء مجلدات الرفع والنسخ الاحتياطي
+# - تقرير بزمن كل خطوة يُطبع عند التشغيل ويُحفظ في app.extensions['startup_report']
+# الترحيل الجديد يُضاف في آخر MIGRATIONS برقم أكبر، ويجب أن يكون قابلاً للتكرار دون ضرر
+# (عدة عمليات قد تبدأ معاً). قاعدة البيانات الجديدة تمر بكل الترحيلات بالترتيب مثل القديمة.
+# الترحيل المنفذ لا يتغير: الترحيل الأول ينشئ المخطط الأول المجمد في schema_baseline، والفهارس والأعمدة
+# بعده بتعريف ثابت (create_index و add_column) وليس من النماذج الحالية.
+# استثناء: الجداول الجديدة تُنشأ من __table__ نماذجها، وترحيلات البيانات (بذر العدادات، فهرس البحث،
+# المؤشرات، اللقطات، نقل الملفات، ملخصات الوقود والصيانة) تستدعي كود التطبيق الحالي. تعديل تلك الدوال
+# أو نماذجها يغير ما تفعله هذه الترحيلات في قاعدة بيانات لم تُرحَّل بعد، فيجب أن تبقى صالحة لمخطط
+# الإصدار الذي تُنفذ فيه (الأعمدة التي تضيفها ترحيلات لاحقة تُضاف قبلها بـ add_column كما في الترحيل 16).
+
+UPLOAD_SUBFOLDERS = ('cars', 'employees', 'documents', 'logos')
+
+def add_column(table_name, column_ddl):
+    # إضافة عمود إلى جدول موجود إن لم يكن موجوداً
+    column_name = column_ddl.split()[0]
+    if column_name not in _existing_columns(table_name):
+        quoted = db.engine.dialect.identifier_preparer.quote(table_name)
+        try:
+            db.session.execute(text(f'ALTER TABLE {quoted} ADD COLUMN {column_ddl}'))
+        except DBAPIError:
+            # عملية أخرى أضافت العمود بين الفحص والتعديل
+            db.session.rollback()
+            if column_name not in _existing_columns(table_name):
+                raise
+    db.session.commit()
+
+def _create_tables():
+    BASELINE.create_all(db.engine, checkfirst=True)
+
+def _id_counters():
+    IdCounter.__table__.create(db.engine, checkfirst=True)
+    seed_id_counters()
+
+def _existing_columns(table_name):
+    inspector = inspect(db.engine)
+    if not inspector.has_table(table_name):
+        return set()
+    return {c['name'] for c in inspector.get_columns(table_name)}
+
+def create_index(name, table_name, *column_names):
+    # فهرس بتعريف ثابت (لا يتبع النماذج الحالية) على جدول موجود؛ يُتجاوز إن لم تكن أعمدته موجودة
+    if not set(column_names) <= _existing_columns(table_name):
+        return
+    table = Table(table_name, MetaData(), *[Column(column_name) for column_name in column_names])
+    Index(name, *[table.c[column_name] for column_name in column_names]).create(db.engine, checkfirst=True)
+
+def _hot_query_indexes():
+    create_index('ix_stock_transaction_material_date', 'stock_transaction', 'material_id', 'created_at')
+    create_index('ix_document_expiry_status', 'document', 'expiry_date', 'status')
+    create_index('ix_audit_log_timestamp', 'audit_log', 'timestamp')
+    create_index('ix_equipment_status', 'equipment', 'status')
+    create_index('ix_attendance_employee_week', 'attendance_record', 'employee_id', 'year', 'week_number', 'status')
+    create_index('ix_overtime_employee_week', 'overtime_record', 'employee_id', 'year', 'week_number')
+    create_index('ix_advance_employee_paid', 'advance_payment', 'employee_id', 'is_paid')
+    create_index('ix_payroll_week', 'payroll_record', 'year', 'week_number')
+
+def _document_notifications():
+    DocumentNotification.__table__.create(db.engine, checkfirst=True)
+    add_column('user', 'last_seen_notification_id INTEGER DEFAULT 0')
+
+def _stock_snapshots():
+    db.metadata.tables['stock_snapshot'].create(db.engine, checkfirst=True)
+    create_index('ix_stock_transaction_created', 'stock_transaction', 'created_at')
+    take_stock_snapshot(date.today() - timedelta(days=1))
+
+def _material_name_index():
+    create_index('ix_material_name', 'material', 'name')
+
+def _content_addressed_uploads():
+    StoredFile.__table__.create(db.engine, checkfirst=True)
+    create_index('ix_stored_file_ref_count', 'stored_file', 'ref_count')
+    for table_name in ('car_file', 'employee_file', 'document_file'):
+        add_column(table_name, 'content_hash VARCHAR(64)')
+        create_index(f'ix_{table_name}_content_hash', table_name, 'content_hash')
+    moved, missing = file_store.migrate_legacy_files()
+    if missing:
+        print(f"[Startup] {missing} ملف مرفق غير موجود على القرص، بقي بمساره القديم")
+
+def _child_record_indexes():
+    create_index('ix_car_file_car_id', 'car_file', 'car_id')
+    create_index('ix_employee_file_employee_id', 'employee_file', 'employee_id')
+    create_index('ix_document_file_document_id', 'document_file', 'document_id')
+    create_index('ix_maintenance_car_date', 'maintenance_record', 'car_id', 'date')
+    create_index('ix_fuel_equipment_date', 'fuel_record', 'equipment_id', 'date')
+    create_index('ix_equipment_maintenance_date', 'equipment_maintenance', 'equipment_id', 'date')
+
+def _fuel_efficiency():
+    FuelEfficiency.__table__.create(db.engine, checkfirst=True)
+    refresh_fuel_efficiency()
+
+def _maintenance_forecast():
+    MaintenanceForecast.__table__.create(db.engine, checkfirst=True)
+    create_index('ix_maintenance_forecast_due', 'maintenance_forecast', 'due_date')
+    refresh_maintenance_forecast()
+
+def _fuel_baselines():
+    FuelBaseline.__table__.create(db.engine, checkfirst=True)
+    refresh_fuel_baselines()
+
+def _employee_salary_index():
+    create_index('ix_employee_salary_employee_id', 'employee_salary', 'employee_id')
+
+def _stock_snapshot_cutoff():
+    # اللقطات السابقة قد تنقصها حركات سُجلت بعد حسابها: تُحذف (الدفتر كامل) وتُؤخذ لقطة جديدة بلحظة قطع
+    add_column('stock_snapshot', 'cutoff_at DATETIME')
+    db.session.execute(db.metadata.tables['stock_snapshot'].delete())
+    db.session.commit()
+    take_stock_snapshot(snapshot_day())
+
+MIGRATIONS = [
+    (1, 'إنشاء الجداول', _create_tables),
+    (2, 'القيد الفريد لسجلات الحضور', ensure_attendance_unique_index),
+    (3, 'بذر عدادات الترقيم السنوي', _id_counters),
+    (4, 'فهرس البحث النصي', ensure_search_index),
+    (5, 'فهارس الاستعلامات المتكررة', _hot_query_indexes),
+    (6, 'مؤشرات لوحة التحكم', init_dashboard_metrics),
+    (7, 'تنبيهات انتهاء الوثائق', _document_notifications),
+    (8, 'لقطات رصيد المخزون', _stock_snapshots),
+    (9, 'فهرس أسماء المواد', _material_name_index),
+    (10, 'مخزن الملفات حسب المحتوى', _content_addressed_uploads),
+    (11, 'فهارس السجلات التابعة', _child_record_indexes),
+    (12, 'ملخص استهلاك الوقود', _fuel_efficiency),
+    (13, 'جدول الصيانة المتوقعة', _maintenance_forecast),
+    (14, 'خطوط أساس استهلاك الوقود', _fuel_baselines),
+    (15, 'فهرس رواتب الموظفين', _employee_salary_index),
+    (16, 'لحظة القطع في لقطات المخزون', _stock_snapshot_cutoff),
+    (17, 'فهرس البحث داخل المعرفات', ensure_search_index),
+]
+
+def current_schema_version():
+    return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+
+def run_migrations():
+    # يعيد قائمة الترحيلات المنفذة الآن [(الرقم، الاسم، المدة بالملي ثانية)]
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    applied = {version for (version,) in db.session.query(SchemaVersion.version)}
+    done = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        started = time.perf_counter()
+        migrate()
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        db.session.add(SchemaVersion(version=version, name=name, applied_at=datetime.utcnow(), duration_ms=duration_ms))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # عملية أخرى سجلت نفس الترحيل في نفس الوقت
+            db.session.rollback()
+            continue
+        done.append((version, name, duration_ms))
+    return done
+
+def ensure_directories(app):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    paths = [upload_folder, app.config['BACKUP_FOLDER'], app.instance_path]
+    paths += [os.path.join(upload_folder, subfolder) for subfolder in UPLOAD_SUBFOLDERS]
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+
+def ensure_company_settings():
+    if CompanySettings.query.first() is None:
+        db.session.add(CompanySettings())
+        db.session.commit()
+        settings_cache.invalidate()
+
+def bootstrap_app(app):
+    report = {'steps': [], 'migrations': []}
+    started = time.perf_counter()
+
+    def step(name, func):
+        step_started = time.perf_counter()
+        result = func()
+        report['steps'].append((name, int((time.perf_counter() - step_started) * 1000)))
+        return result
+
+    with app.app_context():
+        step('المجلدات', lambda: ensure_directories(app))
+        report['migrations'] = step('الترحيلات', run_migrations)
+        step('إعدادات الشركة', ensure_company_settings)
+        step('تنبيهات الوثائق', scan_document_expiry)
+        step('سجل النشاط المحفوظ في ملف', audit_writer.recover_spill)
+        report['schema_version'] = current_schema_version()
+    report['total_ms'] = int((time.perf_counter() - started) * 1000)
+    app.extensions['startup_report'] = report
+    print_startup_report(report)
+    return report
+
+def print_startup_report(report):
+    print(f"[Startup] إصدار المخطط {report['schema_version']} - التهيئة استغرقت {report['total_ms']} ms")
+    for name, duration_ms in report['steps']:
+        print(f"[Startup]   {name}: {duration_ms} ms")
+    for version, name, duration_ms in report['migrations']:
+        print(f"[Startup]   ترحيل {version} ({name}): {duration_ms} ms")
@@ -0,0 +1,132 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, case, event, func, select, true
+from models import db, DashboardMetric
+
+# مؤشرات لوحة التحكم: جدول dashboard_metric فيه صف لكل مؤشر يُعدَّل بالفرق (زيادة/نقصان) داخل
+# نفس معاملة الحفظ عبر أحداث SQLAlchemy، فتقرأ لوحة التحكم بضعة صفوف بدلاً من العدّ في كل زيارة،
+# وتكون القيمة واحدة في كل العمليات (workers).
+# مهمة دورية تعيد الحساب كاملاً وتصحح أي انحراف: التعديلات المجمعة (bulk) لا تمر بالأحداث،
+# والوثائق تدخل نافذة "قرب الانتهاء" بمرور الأيام دون أي تعديل عليها.
+
+EXPIRY_WINDOW_DAYS = 7
+
+def _expiry_window():
+    today = date.today()
+    return today, today + timedelta(days=EXPIRY_WINDOW_DAYS)
+
+def _min_stock_level(stock_item):
+    material = db.metadata.tables['material']
+    return select(material.c.min_stock_level).where(material.c.id == stock_item.c.material_id).scalar_subquery()
+
+# المؤشر: (الجدول، شرط العدّ). الشرط دالة حتى تُحسب التواريخ وقت التنفيذ
+METRICS = {
+    'total_equipment': ('equipment', lambda t: true()),
+    'active_equipment': ('equipment', lambda t: t.c.status == 'active'),
+    'overdue_maintenance': ('equipment', lambda t: and_(
+        t.c.next_maintenance_km.isnot(None), t.c.current_km >= t.c.next_maintenance_km)),
+    'expiring_documents': ('document', lambda t: and_(
+        t.c.expiry_date.between(*_expiry_window()), t.c.status != 'expired')),
+    'low_stock_items': ('stock_item', lambda t: t.c.quantity <= _min_stock_level(t)),
+}
+
+# جداول أخرى يغير تعديلها قيمة المؤشر: {المؤشر: {الجدول: عمود الربط في جدول المؤشر}}
+RELATED = {
+    'low_stock_items': {'material': 'material_id'},
+}
+
+def _watched():
+    # {الجدول المعدل: {عمود الربط: [المؤشرات]}}
+    watched = {}
+    for metric, (table_name, _) in METRICS.items():
+        watched.setdefault(table_name, {}).setdefault('id', []).append(metric)
+    for metric, tables in RELATED.items():
+        for table_name, key_column in tables.items():
+            watched.setdefault(table_name, {}).setdefault(key_column, []).append(metric)
+    return watched
+
+WATCHED = _watched()
+
+def _row_counts(connection, target):
+    # عدد الصفوف المرتبطة بالسجل التي تحقق شرط كل مؤشر (صف واحد غالباً)
+    counts = {}
+    for key_column, metrics in WATCHED[target.__table__.name].items():
+        by_table = {}
+        for metric in metrics:
+            by_table.setdefault(METRICS[metric][0], []).append(metric)
+        for table_name, table_metrics in by_table.items():
+            t = db.metadata.tables[table_name]
+            row = connection.execute(
+                select(*[func.coalesce(func.sum(case((METRICS[metric][1](t), 1), else_=0)), 0) for metric in table_metrics])
+                .where(t.c[key_column] == target.id)
+            ).one()
+            counts.update(zip(table_metrics, row))
+    return counts
+
+def _before_change(mapper, connection, target):
+    if target.__table__.name in WATCHED and target.id is not None:
+        connection.info.setdefault('dashboard_metrics', {})[id(target)] = _row_counts(connection, target)
+
+def _after_change(mapper, connection, target):
+    if target.__table__.name not in WATCHED:
+        return
+    before = connection.info.get('dashboard_metrics', {}).pop(id(target), {})
+    after = _row_counts(connection, target)
+    for metric in after:
+        add_to_metric(connection, metric, after[metric] - before.get(metric, 0))
+
+def add_to_metric(connection, metric, delta):
+    # تعديل المؤشر بالفرق داخل المعاملة الحالية، لمن يعرف الفرق دون إعادة العدّ
+    if delta:
+        table = DashboardMetric.__table__
+        connection.execute(
+            table.update().where(table.c.name == metric)
+            .values(value=table.c.value + delta, updated_at=datetime.utcnow())
+        )
+
+for _event in ('before_update', 'before_delete'):
+    event.listen(db.Model, _event, _before_change, propagate=True)
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(db.Model, _event, _after_change, propagate=True)
+
+def _count_query(metric):
+    table_name, condition = METRICS[metric]
+    t = db.metadata.tables[table_name]
+    return select(func.count()).select_from(t).where(condition(t)).scalar_subquery()
+
+def recount_metrics(connection, table_name):
+    # للكتابة المباشرة (Core) التي لا تمر بأحداث SQLAlchemy: إعادة عدّ مؤشرات الجدول داخل نفس المعاملة
+    table = DashboardMetric.__table__
+    for metric, (metric_table, _) in METRICS.items():
+        if metric_table == table_name:
+            connection.execute(
+                table.update().where(table.c.name == metric)
+                .values(value=_count_query(metric), updated_at=datetime.utcnow())
+            )
+
+def recompute_metrics():
+    # إعادة حساب كل المؤشرات من الجداول؛ يعيد {المؤشر: (القيمة المخزنة، القيمة الصحيحة)} لما كان منحرفاً
+    table = DashboardMetric.__table__
+    stored = dict(db.session.query(DashboardMetric.name, DashboardMetric.value))
+    drift = {}
+    for metric in METRICS:
+        count = _count_query(metric)
+        if metric in stored:
+            # عبارة واحدة حتى لا يضيع تعديل متزامن بين العدّ والكتابة
+            db.session.execute(table.update().where(table.c.name == metric).values(value=count, updated_at=datetime.utcnow()))
+        else:
+            db.session.execute(table.insert().values(name=metric, value=count, updated_at=datetime.utcnow()))
+        value = db.session.execute(select(table.c.value).where(table.c.name == metric)).scalar()
+        if stored.get(metric) != value:
+            drift[metric] = (stored.get(metric), value)
+    db.session.commit()
+    return drift
+
+def init_dashboard_metrics():
+    # ترحيل: إنشاء الجدول في قاعدة بيانات موجودة وحساب القيم الأولى
+    DashboardMetric.__table__.create(db.engine, checkfirst=True)
+    recompute_metrics()
+
+def get_metrics():
+    values = dict.fromkeys(METRICS, 0)
+    values.update(db.session.query(DashboardMetric.name, DashboardMetric.value))
+    return values
@@ -0,0 +1,83 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from models import db
+
+# طبقة محرك قاعدة البيانات:
+# - SQLite (الافتراضي): إعدادات PRAGMA لكل اتصال جديد تناسب عدة مستخدمين متزامنين، أهمها WAL
+#   حيث لا تمنع الكتابة القراءة، وbusy_timeout حيث ينتظر الاتصال القفل بدلاً من "database is locked".
+# - قاعدة بيانات خادم (PostgreSQL) عبر DATABASE_URL: مجمع اتصالات بحجم محدد مع pre-ping
+#   ومهلة قصوى لكل عبارة.
+# قواعد البيانات الأخرى (مثل MySQL/MariaDB) مرفوضة عند التشغيل: الترقيم والإدخال مع التحديث (upsert)
+# يعتمدان على ON CONFLICT و UPDATE ... RETURNING المتاحين في SQLite و PostgreSQL فقط.
+
+SUPPORTED_DIALECTS = ('sqlite', 'postgresql')
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('temp_store', 'MEMORY'),
+)
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+def sqlite_pragmas(config):
+    pragmas = list(SQLITE_PRAGMAS)
+    pragmas.append(('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)))
+    pragmas.append(('mmap_size', config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)))
+    # القيمة السالبة في cache_size تعني الحجم بالكيلوبايت لا بعدد الصفحات
+    pragmas.append(('cache_size', -config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)))
+    return pragmas
+
+def engine_options(config):
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if is_sqlite(uri):
+        return {}
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+    statement_timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if statement_timeout and uri.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout)}'}
+    return options
+
+def _apply_sqlite_profile(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return on_connect
+
+def configure_sqlite_engine(engine, config):
+    event.listen(engine, 'connect', _apply_sqlite_profile(sqlite_pragmas(config)))
+
+def init_database(app):
+    # بديل db.init_app(app): يضيف خيارات المحرك قبل إنشائه ثم إعدادات كل اتصال
+    backend = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    if backend not in SUPPORTED_DIALECTS:
+        raise RuntimeError(f"قاعدة البيانات {backend} غير مدعومة؛ المدعوم: {', '.join(SUPPORTED_DIALECTS)}")
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            configure_sqlite_engine(engine, app.config)
+    return engine
+
+def database_profile(engine):
+    # الإعدادات الفعلية (لصفحات المراقبة ومقارنة القياسات)
+    if engine.dialect.name != 'sqlite':
+        pool = engine.pool
+        return {'dialect': engine.dialect.name, 'pool_size': pool.size(), 'checked_out': pool.checkedout()}
+    with engine.connect() as connection:
+        profile = {'dialect': 'sqlite'}
+        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store'):
+            profile[name] = connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+        return profile
@@ -0,0 +1,168 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape, quoteattr
+from flask import Response, request, stream_with_context
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+from instrumentation import timed
+
+# طبقة التصدير المتدفق: تقرأ نتائج الاستعلام على دفعات (yield_per) وتكتب الصفوف
+# مباشرة في ملف Excel أو CSV وترسلها للعميل على أجزاء أثناء القراءة، دون بناء قائمة أو DataFrame
+# للبيانات كاملة في الذاكرة ودون انتظار اكتمال الملف.
+# ملف Excel للتنزيل يُكتب هنا مباشرة (iter_xlsx): أجزاء ZIP بواصفات بيانات بعد كل ملف، وورقة العمل XML
+# تُضغط صفاً بصف، فيصل أول جزء للعميل بعد أول دفعة صفوف. write_xlsx (openpyxl) للملفات الصغيرة على القرص.
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXPORT_BATCH_SIZE = 1000  # عدد الصفوف المقروءة من قاعدة البيانات في كل دفعة
+CHUNK_SIZE = 64 * 1024  # حجم الجزء المرسل للعميل
+
+def format_date(value):
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return value if value is not None else ''
+
+def write_xlsx(rows, headers, sheet_title, company_name, fileobj):
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_title)
+    title = WriteOnlyCell(worksheet, company_name)
+    title.font = Font(size=16, bold=True, color="0070C0")
+    title.alignment = Alignment(horizontal="center")
+    worksheet.append([title])
+    worksheet.merged_cells.add(f'A1:{get_column_letter(len(headers))}1')
+    worksheet.append(headers)
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(fileobj)
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # النمط 1: عنوان الشركة (خط 16 عريض أزرق في الوسط)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="16"/><color rgb="FF0070C0"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+        '<alignment horizontal="center"/></xf></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'),
+}
+# محارف تحكم غير مسموحة في XML (openpyxl يرفضها)
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+class _ChunkSink:
+    # ملف للكتابة فقط يجمع ما يكتبه zipfile حتى يُرسل؛ بدون seek يكتب zipfile واصفة البيانات بعد كل ملف
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+def _xlsx_cell(value, style=0):
+    style_attr = f' s="{style}"' if style else ''
+    if value is None or value == '':
+        return f'<c{style_attr}/>'
+    if isinstance(value, bool):
+        return f'<c t="b"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c{style_attr}><v>{value!r}</v></c>'
+    if isinstance(value, (date, datetime)):
+        value = format_date(value)
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _xlsx_row(values, style=0):
+    return '<row>' + ''.join(_xlsx_cell(value, style) for value in values) + '</row>'
+
+@timed('export_xlsx')
+def iter_xlsx(rows, headers, sheet_title, company_name):
+    # أجزاء الملف تُرسل أثناء كتابة الصفوف، كلما تجمع في المخرج CHUNK_SIZE
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name={quoteattr(sheet_title[:31])} sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row([company_name], style=1) + _xlsx_row(headers)).encode('utf-8'))
+            for row in rows:
+                sheet.write(_xlsx_row(row).encode('utf-8'))
+                if sink.size >= CHUNK_SIZE:
+                    yield sink.take()
+            sheet.write((f'</sheetData><mergeCells count="1"><mergeCell ref="A1:{get_column_letter(len(headers))}1"/></mergeCells>'
+                         '</worksheet>').encode('utf-8'))
+    yield sink.take()
+
+@timed('export_csv')
+def iter_csv(rows, headers, company_name):
+    # CSV يُرسل صفاً بصف بدون ملف مؤقت، مع BOM ليفتح Excel النص العربي بشكل صحيح
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([company_name])
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def export_response(rows, headers, sheet_title, filename, company_name):
+    # ?format=csv للجداول الكبيرة جداً، وإلا ملف Excel
+    if request.args.get('format') == 'csv':
+        body = iter_csv(rows, headers, company_name)
+        mimetype, download_name = 'text/csv; charset=utf-8', f'{filename}.csv'
+    else:
+        body = iter_xlsx(rows, headers, sheet_title, company_name)
+        mimetype, download_name = XLSX_MIMETYPE, f'{filename}.xlsx'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    return response
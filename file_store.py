@@ -0,0 +1,241 @@
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from flask import current_app, request, send_file
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, StoredFile, CarFile, EmployeeFile, DocumentFile
+
+# مخزن الملفات حسب المحتوى: كل ملف مرفوع يُنسخ إلى ملف مؤقت مع حساب sha256 في نفس المرور،
+# ثم يُنقل إلى uploads/store/ab/cd/<sha256>، فالملف المكرر (نفس صورة الهوية لعدة سجلات) يُخزن
+# مرة واحدة، ولا يتجاوز أي مجلد بضع مئات من الملفات، ولا يمكن أن يستبدل رفعٌ رفعاً آخر.
+# سجلات CarFile/EmployeeFile/DocumentFile تشير إلى المحتوى بـ content_hash، و stored_file.ref_count
+# يُعدَّل مع كل إضافة/حذف لسجل ملف عبر أحداث SQLAlchemy (بما فيها الحذف المتسلسل مع السيارة أو الموظف).
+# المحتوى الذي لم يعد له أي سجل يحذفه collect_garbage (مهمة مجدولة) بعد مهلة، حتى لا يُحذف ملف
+# يُعاد رفعه في نفس اللحظة.
+# التسليم (send_upload): رابط المخزن يحمل sha256 فلا يتغير محتواه أبداً، فيُرسل مع ETag قوي هو
+# sha256 نفسه و Cache-Control طويل immutable، ويدعم Range لعارضات PDF، أو يُسلم للخادم الأمامي
+# بـ X-Sendfile/X-Accel-Redirect حسب UPLOAD_SENDFILE فلا ينشغل عامل Python بنقل الملف.
+
+CHUNK_SIZE = 1024 * 1024
+GC_GRACE_SECONDS = 3600
+MIGRATE_BATCH_SIZE = 500
+FILE_MODELS = (CarFile, EmployeeFile, DocumentFile)
+_HASH_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+def _register(connection, content_hash, size):
+    # صف المحتوى (إن لم يكن موجوداً) مع تحديث updated_at، في معاملة سجل الملف نفسها
+    table = StoredFile.__table__
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    now = datetime.utcnow()
+    statement = dialect.insert(table).values(content_hash=content_hash, size=size, ref_count=0, created_at=now, updated_at=now)
+    connection.execute(statement.on_conflict_do_update(index_elements=['content_hash'], set_={'updated_at': now}))
+
+def _reference_listener(delta):
+    def listener(mapper, connection, target):
+        if target.content_hash:
+            table = StoredFile.__table__
+            connection.execute(
+                table.update().where(table.c.content_hash == target.content_hash)
+                .values(ref_count=table.c.ref_count + delta, updated_at=datetime.utcnow())
+            )
+    return listener
+
+for _model in FILE_MODELS:
+    event.listen(_model, 'after_insert', _reference_listener(1))
+    event.listen(_model, 'after_delete', _reference_listener(-1))
+
+def recount_references():
+    # إعادة حساب ref_count من جداول الملفات (بعد الترحيل أو أي تعديل مباشر على الجداول)
+    table = StoredFile.__table__
+    counts = [
+        select(func.count()).select_from(model.__table__)
+        .where(model.__table__.c.content_hash == table.c.content_hash).scalar_subquery()
+        for model in FILE_MODELS
+    ]
+    db.session.execute(table.update().values(ref_count=sum(counts[1:], counts[0])))
+    db.session.commit()
+
+class FileStore:
+    def __init__(self):
+        self.root = None
+
+    def init_app(self, app):
+        self.root = os.path.join(app.config['UPLOAD_FOLDER'], 'store')
+        os.makedirs(self._tmp_dir(), exist_ok=True)
+
+    def _tmp_dir(self):
+        return os.path.join(self.root, 'tmp')
+
+    def path(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], content_hash)
+
+    def existing_path(self, content_hash):
+        # مسار المحتوى على القرص، أو None لقيمة غير صالحة أو محتوى غير موجود
+        if not _HASH_PATTERN.fullmatch(content_hash or ''):
+            return None
+        path = self.path(content_hash)
+        return path if os.path.isfile(path) else None
+
+    def _place(self, tmp_path, content_hash):
+        # os.replace ذري؛ المحتوى نفسه إن كان موجوداً فلا ضرر من استبداله
+        target = self.path(content_hash)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        return target
+
+    def _write(self, source):
+        # نسخ المحتوى إلى ملف مؤقت مع حساب sha256؛ يعيد (المسار المؤقت، sha256، الحجم)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir())
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    def save(self, stream):
+        # يعيد sha256 المحتوى؛ سجل الملف يُضاف بعدها في نفس الجلسة فيزيد ref_count
+        tmp_path, content_hash, size = self._write(stream)
+        try:
+            _register(db.session.connection(), content_hash, size)
+            self._place(tmp_path, content_hash)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return content_hash
+
+    def collect_garbage(self, scan_disk=False, grace_seconds=GC_GRACE_SECONDS):
+        # حذف المحتوى بدون سجلات منذ أكثر من المهلة؛ scan_disk يحذف أيضاً الملفات على القرص التي
+        # ليس لها صف (رفع أُلغيت معاملته) والملفات المؤقتة المتروكة. يعيد عدد الملفات المحذوفة
+        # الملف يُحذف من القرص فقط إذا حذفت هذه العبارة صفه: المحتوى الذي أُعيد رفعه أو أُضيف له سجل بعد
+        # اختياره يبقى صفه بشرط الحذف نفسه، فلا يُحذف ملفه
+        table = StoredFile.__table__
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        unused = (table.c.ref_count <= 0, table.c.updated_at < cutoff)
+        if db.session.connection().dialect.delete_returning:
+            deleted = db.session.execute(table.delete().where(*unused).returning(table.c.content_hash)).scalars().all()
+        else:
+            candidates = db.session.execute(select(table.c.content_hash).where(*unused)).scalars().all()
+            deleted = [content_hash for content_hash in candidates if db.session.execute(
+                table.delete().where(table.c.content_hash == content_hash, *unused)).rowcount]
+        db.session.commit()
+        removed = 0
+        for content_hash in deleted:
+            if self._remove_if_unregistered(content_hash):
+                removed += 1
+        if scan_disk:
+            removed += self._collect_unregistered(time.time() - grace_seconds)
+        return removed
+
+    def _remove_if_unregistered(self, content_hash):
+        if db.session.get(StoredFile, content_hash) is not None:
+            return False
+        try:
+            os.remove(self.path(content_hash))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _collect_unregistered(self, cutoff):
+        removed = 0
+        for entry in os.scandir(self._tmp_dir()):
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        old = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or shard.name == 'tmp':
+                continue
+            for subshard in os.scandir(shard.path):
+                for entry in os.scandir(subshard.path):
+                    if _HASH_PATTERN.fullmatch(entry.name) and entry.stat().st_mtime < cutoff:
+                        old.append(entry.name)
+        table = StoredFile.__table__
+        for start in range(0, len(old), MIGRATE_BATCH_SIZE):
+            batch = old[start:start + MIGRATE_BATCH_SIZE]
+            registered = set(db.session.execute(select(table.c.content_hash).where(table.c.content_hash.in_(batch))).scalars())
+            for content_hash in batch:
+                if content_hash not in registered and self._remove_if_unregistered(content_hash):
+                    removed += 1
+        db.session.commit()
+        return removed
+
+    def migrate_legacy_files(self):
+        # ترحيل: نسخ الملفات القديمة (uploads/cars/...) إلى المخزن وربط سجلاتها، ثم حذف الأصل بعد
+        # حفظ السجلات، فيمكن إعادة التشغيل بأمان إن توقف في المنتصف. يعيد (المنقولة، المفقودة)
+        moved = missing = 0
+        for model in FILE_MODELS:
+            table = model.__table__
+            last_id = 0
+            while True:
+                rows = db.session.execute(
+                    select(table.c.id, table.c.filepath)
+                    .where(table.c.content_hash.is_(None), table.c.id > last_id)
+                    .order_by(table.c.id).limit(MIGRATE_BATCH_SIZE)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                connection = db.session.connection()
+                originals = []
+                for row in rows:
+                    if not row.filepath or not os.path.isfile(row.filepath):
+                        missing += 1
+                        continue
+                    with open(row.filepath, 'rb') as source:
+                        tmp_path, content_hash, size = self._write(source)
+                    _register(connection, content_hash, size)
+                    target = self._place(tmp_path, content_hash)
+                    connection.execute(table.update().where(table.c.id == row.id).values(content_hash=content_hash, filepath=target))
+                    originals.append(row.filepath)
+                db.session.commit()
+                for path in originals:
+                    if os.path.exists(path):
+                        os.remove(path)
+                moved += len(originals)
+        recount_references()
+        return moved, missing
+
+file_store = FileStore()
+
+# --- تسليم الملفات ---
+def _offload_response(path, mimetype, filename):
+    response = current_app.response_class(mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'inline', filename=filename)
+    if current_app.config['UPLOAD_SENDFILE'] == 'x-accel':
+        relative = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_PREFIX'] + quote(relative)
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    return response
+
+def send_upload(path, filename, content_hash=None):
+    # content_hash لملفات المخزن؛ بدونه (الشعار والملفات القديمة) يُتحقق من التعديل في كل طلب
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if not current_app.config.get('UPLOAD_SENDFILE'):
+        response = send_file(path, mimetype=mimetype, download_name=filename, etag=content_hash or True, conditional=True)
+    elif content_hash and content_hash in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        # الخادم الأمامي يتولى Range والإرسال
+        response = _offload_response(path, mimetype, filename)
+    if content_hash:
+        response.set_etag(content_hash)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = current_app.config['UPLOAD_CACHE_MAX_AGE']
+        response.cache_control.immutable = True
+    return response
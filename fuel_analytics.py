@@ -0,0 +1,238 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from models import db, Equipment, FuelRecord, FuelEfficiency, FuelBaseline
+
+# تحليل استهلاك الوقود من قراءات العداد في سجلات الوقود: القراءات مرتبة بالعداد لكل معدة، والوقود المعبأ
+# في قراءة هو ما استُهلك في المسافة منذ القراءة السابقة (طريقة ملء الخزان). يُحسب ذلك بعمليات pandas على
+# الأعمدة (shift و rolling لكل معدة) فيعطي لتر/100 كم (أو لتر/ساعة للمعدات بعداد ساعات) وكلفة الوحدة
+# ومتوسط آخر FUEL_ROLLING_WINDOW فترات.
+# الملخص لكل معدة محفوظ في جدول fuel_efficiency: سجل وقود جديد بعد آخر قراءة يُضاف إلى المجاميع في نفس
+# معاملة الحفظ (أحداث SQLAlchemy)، وأي تعديل أو حذف أو قراءة أقدم من آخر قراءة يعيد حساب تلك المعدة فقط.
+# الانحراف يُقارن بوسيط المعدات من نفس النوع، أو بوسيط الأسطول إن كانت معدات النوع أقل من FUEL_MIN_PEERS.
+# الوسيطات محفوظة في جدول fuel_baseline تحدثها مهمة دورية، فصفحة المعدة تقرأ صفها وخطي الأساس فقط.
+
+FUEL_ROLLING_WINDOW = 5
+FUEL_MIN_READINGS = 3  # قراءات المعدة قبل مقارنتها بغيرها
+FUEL_MIN_PEERS = 3
+FUEL_OUTLIER_DEVIATION = 0.25  # ±25% عن خط الأساس
+READING_OUTLIER_RATIO = 1.5  # فترة تستهلك أكثر من مرة ونصف متوسط المعدة أو أقل من ثلثيه
+# المعدات التي يقيس عدادها ساعات التشغيل بدلاً من الكيلومترات
+HOUR_METER_TYPES = ('لودر', 'بلدوزر')
+UNIT_LABELS = {'km': 'لتر/100 كم', 'hour': 'لتر/ساعة'}
+DISTANCE_LABELS = {'km': 'كم', 'hour': 'ساعة'}
+READING_COLUMNS = ['id', 'equipment_id', 'date', 'quantity', 'total_cost', 'current_km']
+
+def meter_unit(equipment_type):
+    return 'hour' if equipment_type in HOUR_METER_TYPES else 'km'
+
+def _per_unit(liters, distance, units):
+    # لتر/100 كم أو لتر/ساعة؛ NaN عند مسافة صفرية
+    factor = np.where(np.asarray(units) == 'hour', 1.0, 100.0)
+    return liters / distance.where(distance > 0) * factor
+
+def _readings(connection, equipment_ids=None, last=None):
+    table = FuelRecord.__table__
+    query = select(*[table.c[column] for column in READING_COLUMNS])
+    if equipment_ids is not None:
+        query = query.where(table.c.equipment_id.in_(equipment_ids))
+    if last:
+        # آخر القراءات بترتيب العداد (فهرس ix_fuel_equipment_date يحدد المعدة)
+        query = query.order_by(table.c.current_km.desc(), table.c.date.desc(), table.c.id.desc()).limit(last)
+    return pd.DataFrame(connection.execute(query).all(), columns=READING_COLUMNS)
+
+def compute_segments(readings):
+    # لكل قراءة: المسافة منذ القراءة السابقة للمعدة نفسها، والوقود والكلفة المحسوبة عليها، والمجموع المتحرك
+    frame = readings.sort_values(['equipment_id', 'current_km', 'date', 'id']).reset_index(drop=True)
+    distance = frame['current_km'] - frame.groupby('equipment_id', sort=False)['current_km'].shift()
+    valid = distance > 0
+    frame['distance'] = distance.where(valid, 0.0).astype(float)
+    frame['liters'] = frame['quantity'].where(valid, 0.0).astype(float)
+    frame['cost'] = frame['total_cost'].where(valid, 0.0).astype(float)
+    rolling = (frame.groupby('equipment_id', sort=False)[['liters', 'distance']]
+               .rolling(FUEL_ROLLING_WINDOW, min_periods=1).sum().reset_index(level=0, drop=True))
+    frame['rolling_liters'] = rolling['liters']
+    frame['rolling_distance'] = rolling['distance']
+    return frame
+
+def _summaries(segments):
+    grouped = segments.groupby('equipment_id')
+    last = grouped.tail(1).set_index('equipment_id')
+    summary = grouped[['distance', 'liters', 'cost']].sum()
+    summary['readings'] = grouped.size()
+    summary['rolling_distance'] = last['rolling_distance']
+    summary['rolling_liters'] = last['rolling_liters']
+    summary['last_km'] = last['current_km']
+    summary['last_record_id'] = last['id']
+    return summary.reset_index()
+
+def _recompute(connection, equipment_ids=None):
+    # إعادة حساب ملخص معدات معينة (أو الكل) من سجلات وقودها
+    table = FuelEfficiency.__table__
+    segments = compute_segments(_readings(connection, equipment_ids))
+    delete = table.delete()
+    if equipment_ids is not None:
+        delete = delete.where(table.c.equipment_id.in_(equipment_ids))
+    connection.execute(delete)
+    if segments.empty:
+        return 0
+    rows = _summaries(segments).to_dict('records')
+    now = datetime.utcnow()
+    for row in rows:
+        row['updated_at'] = now
+    connection.execute(table.insert(), rows)
+    return len(rows)
+
+def _append_reading(connection, target):
+    # سجل بعد آخر قراءة محسوبة: إضافة فترته إلى المجاميع وإعادة حساب المتوسط المتحرك من آخر القراءات فقط
+    table = FuelEfficiency.__table__
+    summary = connection.execute(select(table).where(table.c.equipment_id == target.equipment_id)).first()
+    if summary is None or summary.last_km is None or target.current_km <= summary.last_km:
+        _recompute(connection, [target.equipment_id])
+        return
+    distance = target.current_km - summary.last_km
+    recent = compute_segments(_readings(connection, [target.equipment_id], last=FUEL_ROLLING_WINDOW + 1)).iloc[-1]
+    connection.execute(table.update().where(table.c.equipment_id == target.equipment_id).values(
+        readings=summary.readings + 1, distance=summary.distance + distance, liters=summary.liters + target.quantity,
+        cost=summary.cost + target.total_cost, rolling_distance=float(recent['rolling_distance']),
+        rolling_liters=float(recent['rolling_liters']), last_km=target.current_km, last_record_id=target.id,
+        updated_at=datetime.utcnow(),
+    ))
+
+def _fuel_inserted(mapper, connection, target):
+    _append_reading(connection, target)
+
+def _fuel_changed(mapper, connection, target):
+    # حذف المعدة يحذف سجلاتها تتابعياً: ملخصها يُحذف مرة واحدة في _equipment_deleted بدل إعادة الحساب لكل سجل
+    session = object_session(target)
+    if session is not None and any(isinstance(obj, Equipment) and obj.id == target.equipment_id for obj in session.deleted):
+        return
+    _recompute(connection, [target.equipment_id])
+
+def _equipment_deleted(mapper, connection, target):
+    table = FuelEfficiency.__table__
+    connection.execute(table.delete().where(table.c.equipment_id == target.id))
+
+event.listen(FuelRecord, 'after_insert', _fuel_inserted)
+event.listen(FuelRecord, 'after_update', _fuel_changed)
+event.listen(FuelRecord, 'after_delete', _fuel_changed)
+event.listen(Equipment, 'after_delete', _equipment_deleted)
+
+def refresh_fuel_efficiency():
+    # إعادة بناء الجدول كاملاً (الترحيل، أو بعد إدخال مباشر لا يمر بالأحداث)؛ يعيد عدد المعدات
+    count = _recompute(db.session.connection())
+    db.session.commit()
+    return count
+
+# --- القراءة ---
+def _fleet_frame():
+    equipment, summaries = Equipment.__table__, FuelEfficiency.__table__
+    columns = ['equipment_id', 'unique_id', 'equipment_type', 'brand', 'model', 'readings', 'distance', 'liters', 'cost',
+               'rolling_distance', 'rolling_liters']
+    frame = pd.DataFrame(db.session.execute(
+        select(equipment.c.id, equipment.c.unique_id, equipment.c.equipment_type, equipment.c.brand, equipment.c.model,
+               summaries.c.readings, summaries.c.distance, summaries.c.liters, summaries.c.cost,
+               summaries.c.rolling_distance, summaries.c.rolling_liters)
+        .join_from(summaries, equipment, summaries.c.equipment_id == equipment.c.id)
+        .order_by(equipment.c.id)
+    ).all(), columns=columns)
+    return _with_consumption(frame)
+
+def _with_consumption(frame):
+    frame['unit'] = np.where(frame['equipment_type'].isin(HOUR_METER_TYPES), 'hour', 'km')
+    frame['consumption'] = _per_unit(frame['liters'], frame['distance'], frame['unit'])
+    frame['cost_per_unit'] = frame['cost'] / frame['distance'].where(frame['distance'] > 0)
+    frame['rolling_consumption'] = _per_unit(frame['rolling_liters'], frame['rolling_distance'], frame['unit'])
+    return frame
+
+def _comparable(frame):
+    return frame['consumption'].where(frame['readings'] >= FUEL_MIN_READINGS)
+
+def _with_deviation(frame):
+    # type_baseline (فارغ إن كانت معدات النوع أقل من FUEL_MIN_PEERS) وإلا fleet_baseline
+    baseline = frame['type_baseline'].astype(float).fillna(frame['fleet_baseline'].astype(float))
+    frame['deviation'] = _comparable(frame) / baseline - 1
+    frame['flag'] = np.select([frame['deviation'] > FUEL_OUTLIER_DEVIATION, frame['deviation'] < -FUEL_OUTLIER_DEVIATION],
+                              ['high', 'low'], default='')
+    return frame
+
+def fuel_baselines(frame):
+    # وسيط الاستهلاك لكل (وحدة، نوع)، ولكل وحدة في الأسطول كله بنوع فارغ
+    comparable = frame.assign(consumption=_comparable(frame)).dropna(subset=['consumption'])
+    by_type = comparable.groupby(['unit', 'equipment_type'])['consumption'].agg(median='median', peers='count').reset_index()
+    fleet = comparable.groupby('unit')['consumption'].agg(median='median', peers='count').reset_index().assign(equipment_type='')
+    return pd.concat([by_type, fleet], ignore_index=True)
+
+def refresh_fuel_baselines():
+    # مهمة دورية: إعادة حساب جدول fuel_baseline من ملخصات المعدات؛ يعيد عدد الصفوف
+    rows = fuel_baselines(_fleet_frame()).to_dict('records')
+    now = datetime.utcnow()
+    for row in rows:
+        row['updated_at'] = now
+    table = FuelBaseline.__table__
+    connection = db.session.connection()
+    connection.execute(table.delete())
+    if rows:
+        connection.execute(table.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+def fleet_efficiency():
+    # DataFrame لكل المعدات التي لها سجلات وقود، مع خط أساس النوع والأسطول (محسوبين الآن) والانحراف عنه
+    frame = _fleet_frame()
+    baselines = fuel_baselines(frame)
+    by_type = baselines[(baselines['equipment_type'] != '') & (baselines['peers'] >= FUEL_MIN_PEERS)]
+    fleet = baselines[baselines['equipment_type'] == ''][['unit', 'median']]
+    frame = (frame.merge(by_type[['unit', 'equipment_type', 'median']].rename(columns={'median': 'type_baseline'}),
+                         on=['unit', 'equipment_type'], how='left')
+             .merge(fleet.rename(columns={'median': 'fleet_baseline'}), on='unit', how='left'))
+    return _with_deviation(frame)
+
+def equipment_efficiency(equipment):
+    # ملخص معدة واحدة (dict) أو None إن لم يكن لها سجلات وقود: صفها في fuel_efficiency مع خطي الأساس
+    # المحفوظين في fuel_baseline، في استعلام واحد بالمفتاح الأساسي
+    summaries, baselines = FuelEfficiency.__table__, FuelBaseline.__table__
+    unit = meter_unit(equipment.equipment_type)
+
+    def baseline(equipment_type, min_peers):
+        return select(baselines.c.median).where(
+            baselines.c.unit == unit, baselines.c.equipment_type == equipment_type, baselines.c.peers >= min_peers
+        ).scalar_subquery()
+
+    row = db.session.execute(
+        select(summaries, baseline(equipment.equipment_type, FUEL_MIN_PEERS).label('type_baseline'),
+               baseline('', 1).label('fleet_baseline'))
+        .where(summaries.c.equipment_id == equipment.id)
+    ).mappings().first()
+    if row is None:
+        return None
+    frame = _with_deviation(_with_consumption(pd.DataFrame([dict(row, equipment_type=equipment.equipment_type)])))
+    return {key: (None if isinstance(value, float) and np.isnan(value) else value) for key, value in frame.iloc[0].items()}
+
+def _reading_consumption(segments, unit):
+    segments['consumption'] = _per_unit(segments['liters'], segments['distance'], unit)
+    segments['cost_per_unit'] = segments['cost'] / segments['distance'].where(segments['distance'] > 0)
+    segments['rolling_consumption'] = _per_unit(segments['rolling_liters'], segments['rolling_distance'], unit)
+    average = _per_unit(pd.Series([segments['liters'].sum()]), pd.Series([segments['distance'].sum()]), unit).iloc[0]
+    ratio = segments['consumption'] / average
+    segments['outlier'] = np.select([ratio > READING_OUTLIER_RATIO, ratio < 1 / READING_OUTLIER_RATIO], ['high', 'low'], default='')
+    return segments
+
+def equipment_segments(equipment_id, equipment_type):
+    # كل سجلات وقود المعدة مع تحليل فتراتها، بترتيب العداد (للتصدير)
+    segments = compute_segments(_readings(db.session.connection(), [equipment_id]))
+    return _reading_consumption(segments, meter_unit(equipment_type))
+
+def reading_analytics(records, equipment_type):
+    # {معرف سجل الوقود: تحليل فترته} لسجلات معدة محملة مسبقاً (صفحة التفاصيل)، دون استعلام إضافي
+    if not records:
+        return {}
+    readings = pd.DataFrame([[getattr(record, column) for column in READING_COLUMNS] for record in records], columns=READING_COLUMNS)
+    segments = _reading_consumption(compute_segments(readings), meter_unit(equipment_type))
+    columns = ['distance', 'consumption', 'cost_per_unit', 'rolling_consumption', 'outlier']
+    return {
+        row_id: {column: (None if isinstance(value, float) and np.isnan(value) else value) for column, value in zip(columns, values)}
+        for row_id, *values in segments[['id'] + columns].itertuples(index=False)
+    }
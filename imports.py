@@ -0,0 +1,336 @@
+import csv
+import io
+import os
+import re
+import tempfile
+import time
+import uuid
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, reserve_sequential_ids
+from search import SEARCH_FIELDS, index_rows
+from dashboard_metrics import recount_metrics
+from exports import write_xlsx, format_date
+from instrumentation import timed
+
+# الاستيراد الجماعي (عكس exports.py): يُقرأ الملف صفاً بصف (openpyxl بوضع القراءة فقط أو csv)
+# ويُعالج على دفعات من IMPORT_CHUNK_SIZE صف: التحقق بأعمدة pandas (الحقول المطلوبة، الأنواع،
+# التكرار داخل الملف)، والتكرار مع قاعدة البيانات باستعلام IN واحد على العمود الفريد المفهرس،
+# ثم إدراج الدفعة بعبارة Core واحدة في معاملة مستقلة مع أرقام مرجعية محجوزة دفعة واحدة.
+# الإدراج المباشر لا يمر بأحداث SQLAlchemy، لذلك تُفهرس الصفوف للبحث داخل نفس المعاملة
+# وتُعاد مؤشرات لوحة التحكم للجدول في آخر الاستيراد. الصفوف المرفوضة تُكتب مع سبب الرفض
+# في تقرير Excel يمكن تنزيله، ويُقبل ملف التصدير نفسه (عناوين الأعمدة بالعربية) أو أسماء الحقول.
+
+IMPORT_CHUNK_SIZE = 1000
+HEADER_SCAN_ROWS = 10  # صف العناوين قد يسبقه صف اسم الشركة كما في ملفات التصدير
+ERROR_PREVIEW_ROWS = 50
+REPORT_MAX_AGE = 24 * 3600
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y')
+
+# كل نوع: الجدول، بادئة الرقم المرجعي، العمود الفريد، والأعمدة (الحقل، العنوان، النوع، مطلوب)
+IMPORT_SPECS = {
+    'employees': {
+        'label': 'الموظفون', 'table': 'employee', 'prefix': 'EMP', 'key': 'national_id',
+        'columns': [
+            ('full_name', 'الاسم الكامل', 'str', True),
+            ('national_id', 'الرقم الوطني', 'str', True),
+            ('birth_date', 'تاريخ الميلاد', 'date', False),
+            ('gender', 'الجنس', 'str', False),
+            ('address', 'العنوان', 'str', False),
+            ('phone', 'الهاتف', 'str', False),
+            ('email', 'البريد الإلكتروني', 'str', False),
+            ('department', 'القسم', 'str', False),
+            ('position', 'الوظيفة', 'str', False),
+            ('hire_date', 'تاريخ التعيين', 'date', False),
+            ('status', 'الحالة', 'str', False),
+            ('notes', 'ملاحظات', 'str', False),
+        ],
+        'defaults': {'status': 'active'},
+    },
+    'cars': {
+        'label': 'السيارات', 'table': 'car', 'prefix': 'CAR', 'key': 'chassis_number',
+        'columns': [
+            ('chassis_number', 'رقم الشاسيه', 'str', True),
+            ('brand', 'الماركة', 'str', True),
+            ('model', 'الموديل', 'str', True),
+            ('car_type', 'النوع', 'str', False),
+            ('color', 'اللون', 'str', False),
+            ('year', 'السنة', 'int', False),
+            ('plate_number', 'رقم اللوحة', 'str', False),
+            ('status', 'الحالة', 'str', False),
+            ('notes', 'ملاحظات', 'str', False),
+        ],
+        'defaults': {'status': 'active'},
+    },
+    'equipment': {
+        'label': 'المعدات', 'table': 'equipment', 'prefix': 'EQP', 'key': 'chassis_number',
+        'columns': [
+            ('equipment_type', 'نوع المعدة', 'str', True),
+            ('brand', 'الماركة', 'str', True),
+            ('model', 'الموديل', 'str', True),
+            ('chassis_number', 'رقم الشاسيه', 'str', True),
+            ('engine_number', 'رقم المحرك', 'str', False),
+            ('capacity', 'السعة', 'float', False),
+            ('max_load', 'الحمولة القصوى', 'float', False),
+            ('current_km', 'عداد الكيلومترات', 'int', False),
+            ('next_maintenance_km', 'كيلومتر الصيانة القادمة', 'int', False),
+            ('status', 'الحالة', 'str', False),
+            ('purchase_date', 'تاريخ الشراء', 'date', False),
+            ('notes', 'ملاحظات', 'str', False),
+        ],
+        'defaults': {'status': 'active', 'current_km': 0},
+    },
+    'materials': {
+        'label': 'المواد', 'table': 'material', 'prefix': None, 'key': 'name',
+        'columns': [
+            ('name', 'اسم المادة', 'str', True),
+            ('unit', 'الوحدة', 'str', True),
+            ('min_stock_level', 'الحد الأدنى', 'float', False),
+            ('category', 'التصنيف', 'str', False),
+            ('notes', 'ملاحظات', 'str', False),
+        ],
+        'defaults': {'min_stock_level': 0},
+    },
+}
+
+SEARCH_MODELS = {model.__tablename__: model for model in SEARCH_FIELDS}
+
+class ImportFileError(Exception):
+    pass
+
+# --- قراءة الملف ---
+def _read_rows(fileobj, filename):
+    # مولد (رقم الصف في الملف، قيم الصف) دون تحميل الملف كاملاً
+    if filename.lower().endswith('.csv'):
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        for line_number, row in enumerate(csv.reader(text), start=1):
+            yield line_number, row
+        text.detach()
+    elif filename.lower().endswith('.xlsx'):
+        try:
+            workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFileError(f'تعذر قراءة ملف Excel: {e}')
+        try:
+            for line_number, row in enumerate(workbook.worksheets[0].iter_rows(values_only=True), start=1):
+                yield line_number, row
+        finally:
+            workbook.close()
+    else:
+        raise ImportFileError('صيغة الملف غير مدعومة، استخدم xlsx أو csv.')
+
+def _header_key(value):
+    return re.sub(r'\s+', ' ', str(value)).strip().lower() if value is not None else ''
+
+def _find_header(rows, spec):
+    # يعيد {رقم العمود في الملف: الحقل} من أول صف يحوي كل الأعمدة المطلوبة
+    names = {}
+    for field, header, _, _ in spec['columns']:
+        names[_header_key(field)] = field
+        names[_header_key(header)] = field
+    required = {field for field, _, _, is_required in spec['columns'] if is_required}
+    for _ in range(HEADER_SCAN_ROWS):
+        line_number, row = next(rows, (None, None))
+        if row is None:
+            break
+        positions = {}
+        for position, value in enumerate(row):
+            field = names.get(_header_key(value))
+            if field and field not in positions.values():
+                positions[position] = field
+        if required <= set(positions.values()):
+            return positions
+    headers = '، '.join(header for field, header, _, is_required in spec['columns'] if is_required)
+    raise ImportFileError(f'لم يُعثر على صف العناوين، الأعمدة المطلوبة: {headers}')
+
+def _chunks(rows, positions, fields):
+    chunk = []
+    for line_number, row in rows:
+        if not any(value not in (None, '') for value in row):
+            continue
+        record = dict.fromkeys(fields)
+        for position, field in positions.items():
+            if position < len(row):
+                record[field] = row[position]
+        record['_line'] = line_number
+        chunk.append(record)
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# --- تحويل القيم والتحقق ---
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # الأرقام الوطنية وأرقام الشاسيه تُقرأ من Excel كأرقام
+        value = int(value)
+    if isinstance(value, (date, datetime)):
+        value = format_date(value)
+    value = str(value).strip()
+    return value or None
+
+def _dates(raw):
+    # النص (التواريخ من Excel حولها _text إلى 2025-01-31) يُحلل بكل صيغة على العمود كاملاً
+    parsed = pd.Series(pd.NaT, index=raw.index, dtype='datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        missing = parsed.isna() & raw.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(raw[missing], format=date_format, errors='coerce')
+    return parsed.dt.date.astype(object).where(parsed.notna(), None)
+
+def _validate(frame, spec):
+    # يحول أعمدة الدفعة إلى أنواعها ويعيد سلسلة أسباب الرفض لكل صف ('' للصف السليم)
+    errors = pd.Series('', index=frame.index, dtype=object)
+
+    def reject(mask, message):
+        errors[mask] = errors[mask] + message + '؛ '
+
+    for field, header, kind, required in spec['columns']:
+        raw = frame[field].map(_text).astype(object)
+        present = raw.notna()
+        if kind == 'str':
+            frame[field] = raw
+        elif kind == 'date':
+            frame[field] = _dates(raw)
+            reject(present & frame[field].isna(), f'«{header}» ليس تاريخاً صحيحاً')
+        else:
+            numbers = pd.to_numeric(raw, errors='coerce')
+            invalid = present & numbers.isna()
+            if kind == 'int':
+                invalid |= numbers.notna() & (numbers % 1 != 0)
+            reject(invalid, f'«{header}» ليس رقماً صحيحاً' if kind == 'int' else f'«{header}» ليس رقماً')
+            frame[field] = numbers.where(~invalid)
+        if field in spec['defaults']:
+            frame[field] = frame[field].where(frame[field].notna(), spec['defaults'][field])
+        if required:
+            reject(~present, f'«{header}» مطلوب')
+    return errors
+
+def _python(value, kind):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    return int(value) if kind == 'int' else value
+
+def _import_chunk(connection, table, spec, chunk, seen_keys):
+    # يعيد ([الصفوف المدرجة مع id]، [(الصف الأصلي، سبب الرفض)])
+    fields = [field for field, _, _, _ in spec['columns']]
+    kinds = [kind for _, _, kind, _ in spec['columns']]
+    originals = [dict(record) for record in chunk]
+    frame = pd.DataFrame(chunk, columns=fields + ['_line'], dtype=object)
+    errors = _validate(frame, spec)
+
+    key = spec['key']
+    keys = frame[key]
+    duplicate = keys.notna() & (keys.duplicated(keep='first') | keys.isin(seen_keys))
+    errors[duplicate] = errors[duplicate] + 'مكرر في الملف؛ '
+    lookup = [value for value in keys[keys.notna() & ~duplicate].unique()]
+    existing = set(connection.execute(select(table.c[key]).where(table.c[key].in_(lookup))).scalars()) if lookup else set()
+    exists = keys.isin(existing)
+    errors[exists] = errors[exists] + 'موجود مسبقاً في النظام؛ '
+
+    valid = frame[errors == '']
+    rows = [
+        {field: _python(value, kind) for field, kind, value in zip(fields, kinds, values)}
+        for values in valid[fields].itertuples(index=False)
+    ]
+    if rows:
+        if spec['prefix']:
+            for row, unique_id in zip(rows, reserve_sequential_ids(spec['prefix'], len(rows), connection)):
+                row['unique_id'] = unique_id
+        if spec['table'] == 'equipment':
+            for row in rows:
+                row['last_maintenance_km'] = row['current_km']
+        ids = connection.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for row, row_id in zip(rows, ids):
+            row['id'] = row_id
+        model = SEARCH_MODELS.get(spec['table'])
+        if model is not None:
+            index_rows(connection, model, rows)
+    rejected = [(originals[i], errors.iat[i].rstrip('؛ ')) for i in range(len(originals)) if errors.iat[i]]
+    return rows, rejected
+
+# --- تقرير الأخطاء ---
+def _report_folder():
+    from flask import current_app
+    folder = os.path.join(current_app.instance_path, 'imports')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def report_path(token):
+    if not re.fullmatch(r'[0-9a-f]{32}', token or ''):
+        return None
+    path = os.path.join(_report_folder(), f'{token}.xlsx')
+    return path if os.path.exists(path) else None
+
+def _cleanup_reports(folder):
+    now = time.time()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if now - os.path.getmtime(path) > REPORT_MAX_AGE:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _write_report(rejected_file, spec, company_name):
+    folder = _report_folder()
+    _cleanup_reports(folder)
+    token = uuid.uuid4().hex
+    headers = ['رقم الصف', 'سبب الرفض'] + [header for _, header, _, _ in spec['columns']]
+    rejected_file.seek(0)
+    with open(os.path.join(folder, f'{token}.xlsx'), 'wb') as report:
+        rows = ([int(row[0])] + row[1:] for row in csv.reader(rejected_file))
+        write_xlsx(rows, headers, 'الصفوف المرفوضة', company_name, report)
+    return token
+
+# --- الاستيراد ---
+@timed('bulk_import')
+def import_file(kind, fileobj, filename, company_name=''):
+    # يعيد {'total', 'imported', 'failed', 'errors': أول الأخطاء [(رقم الصف، السبب)], 'report': رمز التقرير أو None}
+    spec = IMPORT_SPECS[kind]
+    table = db.metadata.tables[spec['table']]
+    fields = [field for field, _, _, _ in spec['columns']]
+    rows = _read_rows(fileobj, filename)
+    positions = _find_header(rows, spec)
+    result = {'total': 0, 'imported': 0, 'failed': 0, 'errors': [], 'report': None}
+    seen_keys = set()
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as rejected_file:
+        writer = csv.writer(rejected_file)
+        for chunk in _chunks(rows, positions, fields):
+            for attempt in range(2):
+                connection = db.session.connection()
+                try:
+                    inserted, rejected = _import_chunk(connection, table, spec, chunk, seen_keys)
+                    db.session.commit()
+                    break
+                except IntegrityError:
+                    # إدخال متزامن لنفس المفتاح بين الفحص والإدراج: إعادة الدفعة مرة واحدة
+                    db.session.rollback()
+                    if attempt:
+                        raise
+            seen_keys.update(row[spec['key']] for row in inserted)
+            result['total'] += len(chunk)
+            result['imported'] += len(inserted)
+            result['failed'] += len(rejected)
+            for record, message in rejected:
+                if len(result['errors']) < ERROR_PREVIEW_ROWS:
+                    result['errors'].append((record['_line'], message))
+                writer.writerow([record['_line'], message] + [_text(record[field]) or '' for field in fields])
+        if result['imported']:
+            recount_metrics(db.session.connection(), spec['table'])
+            db.session.commit()
+        if result['failed']:
+            result['report'] = _write_report(rejected_file, spec, company_name)
+    return result
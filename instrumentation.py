@@ -0,0 +1,218 @@
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# قياس الأداء لكل مسار: زمن الطلب (histogram)، عدد عبارات SQL وزمنها عبر أحداث
+# before/after_cursor_execute، حجم الاستجابة، والأخطاء. والأقسام الثقيلة (توليد PDF، بناء ملفات
+# التصدير، حساب الرواتب، النسخ الاحتياطي، الاستيراد) تُقاس بـ @timed('الاسم').
+# القيم تُعرض بصيغة Prometheus في /metrics، وهي لكل عملية (worker) منذ تشغيلها.
+# الطلب الأبطأ من SLOW_REQUEST_MS يُطبع في السجل مع أبطأ عباراته.
+# الاستجابات المتدفقة (التصدير) يُقاس زمنها حتى بدء الإرسال، وبناء الملف نفسه في قسمه.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SLOW_LOG_SIZE = 50
+TOP_STATEMENTS = 5
+METRIC_PREFIX = 'archive'
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + '}'
+
+class Instrumentation:
+    def __init__(self):
+        self.slow_request_ms = 1000
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._sql_counts = {}
+        self._requests = {}
+        self._sql = {}
+        self._sections = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._started = time.time()
+
+    def init_app(self, app):
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', self.slow_request_ms)
+        self.enabled = app.config.get('INSTRUMENTATION_ENABLED', self.enabled)
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # --- SQL ---
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'perf' in g:
+            conn.info.setdefault('perf_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('perf_started')
+        if not started or not has_request_context() or 'perf' not in g:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        perf = g.perf
+        perf['sql_count'] += 1
+        perf['sql_seconds'] += elapsed
+        entry = perf['statements'].setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    # --- الطلبات ---
+    def _before_request(self):
+        g.perf = {'started': time.perf_counter(), 'sql_count': 0, 'sql_seconds': 0.0, 'statements': {}, 'recorded': False}
+
+    def _after_request(self, response):
+        # Content-Length فقط: calculate_content_length يحول الاستجابة المتدفقة إلى قائمة في الذاكرة
+        self._record(response.status_code, response.content_length or 0)
+        return response
+
+    def _teardown_request(self, exc):
+        # استثناء لم يتحول إلى استجابة (after_request لم يُنفذ)
+        if exc is not None:
+            self._record(500, 0)
+
+    def _record(self, status, size):
+        perf = g.get('perf')
+        if perf is None or perf['recorded']:
+            return
+        perf['recorded'] = True
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint == 'static':
+            return
+        elapsed = time.perf_counter() - perf['started']
+        with self._lock:
+            self._latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self._sql_counts.setdefault(endpoint, Histogram(SQL_COUNT_BUCKETS)).observe(perf['sql_count'])
+            totals = self._requests.setdefault(endpoint, {'errors': 0, 'bytes': 0, 'statuses': {}})
+            totals['statuses'][status // 100] = totals['statuses'].get(status // 100, 0) + 1
+            totals['bytes'] += size
+            if status >= 500:
+                totals['errors'] += 1
+            sql = self._sql.setdefault(endpoint, [0, 0.0])
+            sql[0] += perf['sql_count']
+            sql[1] += perf['sql_seconds']
+        if elapsed * 1000 >= self.slow_request_ms:
+            self._log_slow(endpoint, elapsed, perf)
+
+    def _log_slow(self, endpoint, elapsed, perf):
+        top = sorted(perf['statements'].items(), key=lambda item: item[1][1], reverse=True)[:TOP_STATEMENTS]
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'endpoint': endpoint, 'path': request.full_path.rstrip('?'),
+            'ms': round(elapsed * 1000, 1), 'sql_count': perf['sql_count'], 'sql_ms': round(perf['sql_seconds'] * 1000, 1),
+            'top_statements': [
+                {'statement': ' '.join(statement.split())[:500], 'count': count, 'ms': round(seconds * 1000, 1)}
+                for statement, (count, seconds) in top
+            ],
+        }
+        with self._lock:
+            self._slow.append(entry)
+        print(f"[Slow Request] {entry['path']} ({endpoint}): {entry['ms']} ms، {entry['sql_count']} عبارة SQL في {entry['sql_ms']} ms")
+        for statement in entry['top_statements']:
+            print(f"[Slow Request]   {statement['ms']} ms × {statement['count']}: {statement['statement'][:200]}")
+
+    # --- الأقسام ---
+    def observe_section(self, name, seconds):
+        with self._lock:
+            self._sections.setdefault(name, Histogram(LATENCY_BUCKETS)).observe(seconds)
+
+    def slow_requests(self):
+        with self._lock:
+            return list(self._slow)
+
+    # --- صيغة Prometheus ---
+    def _histogram_lines(self, name, label, histograms):
+        lines = []
+        for key, histogram in sorted(histograms.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{_labels(**{label: key, "le": bound})} {count}')
+            lines.append(f'{name}_bucket{_labels(**{label: key, "le": "+Inf"})} {histogram.count}')
+            lines.append(f'{name}_sum{_labels(**{label: key})} {histogram.total:.6f}')
+            lines.append(f'{name}_count{_labels(**{label: key})} {histogram.count}')
+        return lines
+
+    def render(self, gauges=None):
+        # gauges: {الاسم: (الوصف، القيمة)} لقيم إضافية من بقية الخدمات
+        p = METRIC_PREFIX
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+            lines.extend(samples)
+
+        with self._lock:
+            metric('http_request_duration_seconds', 'histogram', 'Request latency per endpoint.',
+                   self._histogram_lines(f'{p}_http_request_duration_seconds', 'endpoint', self._latency))
+            metric('http_requests_total', 'counter', 'Requests per endpoint and status class.', [
+                f'{p}_http_requests_total{_labels(endpoint=endpoint, status=f"{status}xx")} {count}'
+                for endpoint, totals in sorted(self._requests.items()) for status, count in sorted(totals['statuses'].items())
+            ])
+            metric('http_errors_total', 'counter', 'Responses with status >= 500 or unhandled exceptions.', [
+                f'{p}_http_errors_total{_labels(endpoint=endpoint)} {totals["errors"]}' for endpoint, totals in sorted(self._requests.items())
+            ])
+            metric('http_response_bytes_total', 'counter', 'Response body bytes (streamed responses not included).', [
+                f'{p}_http_response_bytes_total{_labels(endpoint=endpoint)} {totals["bytes"]}' for endpoint, totals in sorted(self._requests.items())
+            ])
+            metric('sql_statements_per_request', 'histogram', 'SQL statements sent per request.',
+                   self._histogram_lines(f'{p}_sql_statements_per_request', 'endpoint', self._sql_counts))
+            metric('sql_statements_total', 'counter', 'SQL statements per endpoint.', [
+                f'{p}_sql_statements_total{_labels(endpoint=endpoint)} {count}' for endpoint, (count, _) in sorted(self._sql.items())
+            ])
+            metric('sql_seconds_total', 'counter', 'Time spent executing SQL per endpoint.', [
+                f'{p}_sql_seconds_total{_labels(endpoint=endpoint)} {seconds:.6f}' for endpoint, (_, seconds) in sorted(self._sql.items())
+            ])
+            metric('section_duration_seconds', 'histogram', 'Duration of named hot sections.',
+                   self._histogram_lines(f'{p}_section_duration_seconds', 'section', self._sections))
+        metric('process_uptime_seconds', 'gauge', 'Seconds since this worker started.', [f'{p}_process_uptime_seconds {time.time() - self._started:.0f}'])
+        for name, (help_text, value) in sorted((gauges or {}).items()):
+            metric(name, 'gauge', help_text, [f'{p}_{name} {value}'])
+        return '\n'.join(lines) + '\n'
+
+instrumentation = Instrumentation()
+
+def timed(name):
+    # مُزخرف لقياس قسم ثقيل؛ للمولدات (مثل التصدير المتدفق) يُقاس الزمن حتى انتهاء التوليد
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                finally:
+                    instrumentation.observe_section(name, time.perf_counter() - started)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                instrumentation.observe_section(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
@@ -0,0 +1,119 @@
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, func, select, union_all
+from models import db, Equipment, EquipmentMaintenance, FuelRecord, MaintenanceForecast
+
+# الصيانة المتوقعة: معدل استخدام كل معدة (كم أو ساعات في اليوم) يُقدر بانحدار خطي لقراءات العداد على
+# التاريخ من سجلات الوقود والصيانة، ومنه قراءة اليوم المقدرة وتاريخ بلوغ next_maintenance_km.
+# الحساب لكل الأسطول بمرور واحد (مجاميع groupby في pandas) ويُحفظ في جدول maintenance_forecast مفهرساً
+# بتاريخ الاستحقاق، فتقرأ لوحة التحكم أقرب المواعيد بنطاق على الفهرس بدل المرور على كل المعدات.
+# يُعاد البناء ليلاً، ولمعدة واحدة بعد إضافة وقود أو صيانة لها أو تعديلها.
+
+FORECAST_WINDOW_DAYS = 90  # القراءات الأحدث تعكس الاستخدام الحالي
+FORECAST_MIN_READINGS = 3
+FORECAST_MIN_SPAN_DAYS = 7  # أقل مدى زمني بين أول وآخر قراءة لتقدير المعدل
+FORECAST_MAX_DAYS = 3650  # معدل ضئيل جداً: لا يُجدول موعد أبعد من ذلك
+FORECAST_DASHBOARD_LIMIT = 5
+READING_COLUMNS = ['equipment_id', 'date', 'current_km']
+
+def _readings(connection, equipment_ids=None):
+    fuel, service = FuelRecord.__table__, EquipmentMaintenance.__table__
+    queries = [select(t.c.equipment_id, t.c.date, t.c.current_km) for t in (fuel, service)]
+    if equipment_ids is not None:
+        queries = [query.where(t.c.equipment_id.in_(equipment_ids)) for query, t in zip(queries, (fuel, service))]
+    return pd.DataFrame(connection.execute(union_all(*queries)).all(), columns=READING_COLUMNS)
+
+def _equipment(connection, equipment_ids=None):
+    # المعدات خارج الخدمة لا تُجدول لها صيانة
+    table = Equipment.__table__
+    query = select(table.c.id, table.c.current_km, table.c.next_maintenance_km).where(
+        table.c.next_maintenance_km.isnot(None), table.c.status != 'out_of_service')
+    if equipment_ids is not None:
+        query = query.where(table.c.id.in_(equipment_ids))
+    return pd.DataFrame(connection.execute(query).all(), columns=['equipment_id', 'current_km', 'next_maintenance_km'])
+
+def _regression(frame):
+    # ميل العداد على الأيام لكل معدة من المتوسطات: (م(س ص) - م(س) م(ص)) / (م(س²) - م(س)²)
+    grouped = frame.assign(xy=frame['day'] * frame['km'], xx=frame['day'] ** 2).groupby('equipment_id')
+    means = grouped[['day', 'km', 'xy', 'xx']].mean()
+    stats = pd.DataFrame({'readings': grouped.size(), 'span': grouped['day'].max() - grouped['day'].min()})
+    slope = (means['xy'] - means['day'] * means['km']) / (means['xx'] - means['day'] ** 2)
+    valid = (stats['readings'] >= FORECAST_MIN_READINGS) & (stats['span'] >= FORECAST_MIN_SPAN_DAYS) & (slope > 0)
+    stats['usage'] = slope.where(valid)
+    return stats
+
+def estimate_usage(readings, today):
+    # المعدل من آخر FORECAST_WINDOW_DAYS يوماً، أو من كل السجل إن لم تكفِ القراءات الحديثة
+    frame = readings.assign(day=(pd.to_datetime(readings['date']) - pd.Timestamp(today)).dt.days.astype(float),
+                            km=readings['current_km'].astype(float))
+    full = _regression(frame)
+    recent = _regression(frame[frame['day'] >= -FORECAST_WINDOW_DAYS]).reindex(full.index)
+    use_recent = recent['usage'].notna()
+    usage = pd.DataFrame({
+        'daily_usage': recent['usage'].where(use_recent, full['usage']),
+        'readings': recent['readings'].where(use_recent, full['readings']).astype(int),
+    })
+    latest = frame.sort_values(['equipment_id', 'km', 'day']).groupby('equipment_id').tail(1).set_index('equipment_id')
+    usage['last_day'] = latest['day']
+    usage['last_km'] = latest['km']
+    return usage
+
+def compute_forecast(equipment, readings, today):
+    # DataFrame بصف لكل معدة: المعدل، القراءة المقدرة اليوم، وتاريخ الاستحقاق
+    frame = equipment.join(estimate_usage(readings, today), on='equipment_id')
+    frame['readings'] = frame['readings'].fillna(0).astype(int)
+    # آخر قراءة + المعدل × الأيام منذها، ولا تقل عن العداد المسجل للمعدة
+    projected = frame['last_km'] + frame['daily_usage'] * -frame['last_day']
+    frame['estimated_km'] = np.fmax(frame['current_km'].fillna(0).astype(float), projected.fillna(0)).round().astype(int)
+    remaining = frame['next_maintenance_km'] - frame['estimated_km']
+    days_left = np.ceil(remaining / frame['daily_usage'])
+    # تجاوز العداد المسجل حد الصيانة دون معدل معروف: مستحقة اليوم
+    days_left = days_left.mask(days_left.isna() & (remaining <= 0), 0)
+    days_left = days_left.where(days_left.abs() <= FORECAST_MAX_DAYS)
+    frame['due_date'] = pd.Timestamp(today) + pd.to_timedelta(days_left, unit='D')
+    return frame
+
+def refresh_maintenance_forecast(equipment_ids=None):
+    # إعادة بناء الجدول لكل المعدات أو لمعدات معينة؛ يعيد عدد المعدات المجدولة
+    connection = db.session.connection()
+    today = date.today()
+    frame = compute_forecast(_equipment(connection, equipment_ids), _readings(connection, equipment_ids), today)
+    table = MaintenanceForecast.__table__
+    delete = table.delete()
+    if equipment_ids is not None:
+        delete = delete.where(table.c.equipment_id.in_(equipment_ids))
+    connection.execute(delete)
+    now = datetime.utcnow()
+    rows = [{
+        'equipment_id': int(row.equipment_id), 'daily_usage': None if pd.isna(row.daily_usage) else float(row.daily_usage),
+        'readings': int(row.readings), 'estimated_km': int(row.estimated_km), 'next_maintenance_km': int(row.next_maintenance_km),
+        'due_date': None if pd.isna(row.due_date) else row.due_date.date(), 'computed_at': now,
+    } for row in frame.itertuples(index=False)]
+    if rows:
+        connection.execute(table.insert(), rows)
+    db.session.commit()
+    return sum(1 for row in rows if row['due_date'] is not None)
+
+def _equipment_deleted(mapper, connection, target):
+    table = MaintenanceForecast.__table__
+    connection.execute(table.delete().where(table.c.equipment_id == target.id))
+
+event.listen(Equipment, 'after_delete', _equipment_deleted)
+
+# --- القراءة (نطاق على ix_maintenance_forecast_due) ---
+def _due_before(days):
+    return MaintenanceForecast.due_date <= date.today() + timedelta(days=days)
+
+def upcoming_maintenance(days, limit=None):
+    # [(التوقع، المعدة)] بترتيب تاريخ الاستحقاق، المتأخرة أولاً
+    query = (db.session.query(MaintenanceForecast, Equipment)
+             .join(Equipment, Equipment.id == MaintenanceForecast.equipment_id)
+             .filter(_due_before(days))
+             .order_by(MaintenanceForecast.due_date, MaintenanceForecast.equipment_id))
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+def upcoming_maintenance_count(days):
+    return db.session.scalar(select(func.count()).select_from(MaintenanceForecast).where(_due_before(days)))
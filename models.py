@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from flask_bcrypt import Bcrypt
-from flask import url_for
+from flask import url_for, current_app
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime
+import os
 import uuid
 
 # تهيئة قاعدة البيانات والتشفير
@@ -10,28 +12,127 @@ db = SQLAlchemy()
 bcrypt = Bcrypt()
 
 # دالة توليد الترقيم السنوي (CAR-2025-0001, EQP-2025-0001)
-def generate_sequential_id(prefix):
-    year = datetime.now().year
-    last_record = None
-    if prefix == "CAR":
-        last_record = Car.query.filter(Car.unique_id.like(f"{prefix}-{year}-%")).order_by(Car.id.desc()).first()
-    elif prefix == "EMP":
-        last_record = Employee.query.filter(Employee.unique_id.like(f"{prefix}-{year}-%")).order_by(Employee.id.desc()).first()
-    elif prefix == "DOC":
-        last_record = Document.query.filter(Document.unique_id.like(f"{prefix}-{year}-%")).order_by(Document.id.desc()).first()
-    elif prefix == "EQP":
-        last_record = Equipment.query.filter(Equipment.unique_id.like(f"{prefix}-{year}-%")).order_by(Equipment.id.desc()).first()
-
-    if last_record and last_record.unique_id:
+# الرقم التالي يُحجز من جدول id_counter (صف لكل بادئة وسنة) بعبارة UPDATE واحدة ذرية داخل
+# نفس معاملة الإدراج، بدلاً من البحث بـ LIKE عن آخر رقم، فلا يحصل إدراجان متزامنان على نفس الرقم.
+# السنة جزء من مفتاح العداد، فيبدأ الترقيم من 1 تلقائياً مع بداية كل سنة.
+def format_sequential_id(prefix, year, number):
+    return f"{prefix}-{year}-{number:04d}"
+
+def _sequential_id_model(prefix):
+    return {"CAR": Car, "EMP": Employee, "DOC": Document, "EQP": Equipment}[prefix]
+
+def _existing_max_numbers(connection, prefix, year=None):
+    # أكبر رقم مستخدم فعلاً لكل سنة في جدول الكيان (لبذر العدادات من البيانات الحالية)
+    model = _sequential_id_model(prefix)
+    pattern = f"{prefix}-{year}-%" if year else f"{prefix}-%"
+    maximums = {}
+    for unique_id in connection.execute(db.select(model.unique_id).where(model.unique_id.like(pattern))).scalars():
         try:
-            last_num = int(last_record.unique_id.split('-')[-1])
-            new_num = last_num + 1
-        except:
-            new_num = 1
-    else:
-        new_num = 1
+            _, record_year, number = unique_id.split('-')
+            record_year, number = int(record_year), int(number)
+        except (ValueError, AttributeError):
+            continue
+        maximums[record_year] = max(maximums.get(record_year, 0), number)
+    return maximums
+
+def _counter_upsert(connection, prefix, year, initial, increment):
+    # INSERT ... ON CONFLICT DO UPDATE: يحجز الأرقام حتى لو أنشأ طلب آخر الصف في نفس اللحظة
+    table = IdCounter.__table__
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(table).values(prefix=prefix, year=year, last_value=initial)
+    statement = statement.on_conflict_do_update(
+        index_elements=['prefix', 'year'],
+        set_={'last_value': table.c.last_value + increment}
+    ).returning(table.c.last_value)
+    return connection.execute(statement).scalar()
+
+def reserve_sequential_numbers(connection, prefix, count=1, year=None):
+    # يحجز count رقماً متتالياً ويعيد أولها
+    year = year or datetime.now().year
+    table = IdCounter.__table__
+    last = connection.execute(
+        table.update()
+        .where(table.c.prefix == prefix, table.c.year == year)
+        .values(last_value=table.c.last_value + count)
+        .returning(table.c.last_value)
+    ).scalar()
+    if last is None:
+        # أول رقم لهذه السنة: يبدأ العداد بعد أكبر رقم موجود (إن وُجدت بيانات قبل إنشاء العداد)
+        start = _existing_max_numbers(connection, prefix, year).get(year, 0)
+        last = _counter_upsert(connection, prefix, year, start + count, count)
+    return last - count + 1
+
+def generate_sequential_id(prefix, connection=None):
+    year = datetime.now().year
+    connection = connection if connection is not None else db.session.connection()
+    return format_sequential_id(prefix, year, reserve_sequential_numbers(connection, prefix, 1, year))
+
+def reserve_sequential_ids(prefix, count, connection=None):
+    # حجز مجموعة أرقام دفعة واحدة للاستيراد الجماعي
+    if count <= 0:
+        return []
+    year = datetime.now().year
+    connection = connection if connection is not None else db.session.connection()
+    first = reserve_sequential_numbers(connection, prefix, count, year)
+    return [format_sequential_id(prefix, year, number) for number in range(first, first + count)]
+
+def sequential_id_default(prefix):
+    # قيمة افتراضية للعمود تُنفذ على اتصال الإدراج نفسه (context.connection)
+    def default(context):
+        return generate_sequential_id(prefix, context.connection)
+    return default
+
+def seed_id_counters():
+    # ترحيل: بذر العدادات من أكبر الأرقام الحالية في الجداول (لا ينقص عداداً موجوداً)
+    connection = db.session.connection()
+    table = IdCounter.__table__
+    for prefix in ("CAR", "EMP", "DOC", "EQP"):
+        for year, number in _existing_max_numbers(connection, prefix).items():
+            _counter_upsert(connection, prefix, year, number, 0)
+            connection.execute(
+                table.update()
+                .where(table.c.prefix == prefix, table.c.year == year, table.c.last_value < number)
+                .values(last_value=number)
+            )
+    db.session.commit()
+
+# نموذج إصدار مخطط قاعدة البيانات (سجل الترحيلات المنفذة، انظر bootstrap.py)
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    duration_ms = db.Column(db.Integer)
+
+# نموذج مؤشرات لوحة التحكم (قيمة محدثة لكل مؤشر، انظر dashboard_metrics.py)
+class DashboardMetric(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# نموذج الملف المخزن حسب محتواه (نسخة واحدة على القرص لكل sha256، انظر file_store.py)
+class StoredFile(db.Model):
+    content_hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0, index=True)  # عدد سجلات الملفات المرتبطة
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# أعمدة وروابط مشتركة لملفات السيارات والموظفين والوثائق: الملفات الجديدة في المخزن حسب المحتوى،
+# والقديمة التي لم ينقلها الترحيل (غير موجودة على القرص) تبقى بمسارها داخل مجلد الرفع
+class UploadedFileMixin:
+    content_hash = db.Column(db.String(64), index=True)
+
+    def url(self, external=False):
+        if self.content_hash:
+            return url_for('stored_file', content_hash=self.content_hash, filename=self.filename, _external=external)
+        relative = os.path.relpath(self.filepath, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        return url_for('uploaded_file', filename=relative, _external=external)
 
-    return f"{prefix}-{year}-{new_num:04d}"
+# نموذج عداد الترقيم السنوي
+class IdCounter(db.Model):
+    prefix = db.Column(db.String(10), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
 
 # نموذج إعدادات الشركة
 class CompanySettings(db.Model):
@@ -54,6 +155,7 @@ class User(db.Model, UserMixin):
     password_hash = db.Column(db.String(128), nullable=False)
     role = db.Column(db.String(20), default='user')  # admin, archivist, user
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_notification_id = db.Column(db.Integer, default=0)  # آخر تنبيه اطلع عليه المستخدم
 
     def set_password(self, password):
         self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
@@ -70,7 +172,7 @@ class User(db.Model, UserMixin):
 # نموذج السيارة
 class Car(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=lambda: generate_sequential_id("CAR"))
+    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=sequential_id_default("CAR"))
     chassis_number = db.Column(db.String(100), unique=True, nullable=False)
     brand = db.Column(db.String(50), nullable=False)
     model = db.Column(db.String(50), nullable=False)
@@ -82,16 +184,18 @@ class Car(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    files = db.relationship('CarFile', backref='car', lazy=True, cascade="all, delete-orphan")
-    maintenance_records = db.relationship('MaintenanceRecord', backref='car', lazy=True, cascade="all, delete-orphan")
+    # الترتيب في SQL (الأحدث أولاً) بدلاً من sort في القالب
+    files = db.relationship('CarFile', backref='car', lazy=True, cascade="all, delete-orphan", order_by='CarFile.id')
+    maintenance_records = db.relationship('MaintenanceRecord', backref='car', lazy=True, cascade="all, delete-orphan",
+                                          order_by=lambda: (MaintenanceRecord.date.desc(), MaintenanceRecord.id.desc()))
 
-class CarFile(db.Model):
+class CarFile(UploadedFileMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
     filepath = db.Column(db.String(300), nullable=False)
     file_type = db.Column(db.String(10))  # 'image' or 'pdf'
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
-    car_id = db.Column(db.Integer, db.ForeignKey('car.id'), nullable=False)
+    car_id = db.Column(db.Integer, db.ForeignKey('car.id'), nullable=False, index=True)
 
 # نموذج سجل صيانة السيارة
 class MaintenanceRecord(db.Model):
@@ -103,13 +207,16 @@ class MaintenanceRecord(db.Model):
     notes = db.Column(db.Text)  # ملاحظات
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # سجلات سيارة معينة مرتبة بالتاريخ (تحميل العلاقة بـ selectinload)
+    __table_args__ = (db.Index('ix_maintenance_car_date', 'car_id', 'date'),)
+
     def __repr__(self):
         return f'<MaintenanceRecord {self.maintenance_type} for Car {self.car_id}>'
 
 # نموذج الموظف
 class Employee(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=lambda: generate_sequential_id("EMP"))
+    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=sequential_id_default("EMP"))
     national_id = db.Column(db.String(20), unique=True, nullable=False)
     full_name = db.Column(db.String(100), nullable=False)
     birth_date = db.Column(db.Date)
@@ -124,21 +231,21 @@ class Employee(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    files = db.relationship('EmployeeFile', backref='employee', lazy=True, cascade="all, delete-orphan")
+    files = db.relationship('EmployeeFile', backref='employee', lazy=True, cascade="all, delete-orphan", order_by='EmployeeFile.id')
     salary_info = db.relationship('EmployeeSalary', backref='employee', uselist=False)
 
-class EmployeeFile(db.Model):
+class EmployeeFile(UploadedFileMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
     filepath = db.Column(db.String(300), nullable=False)
     file_type = db.Column(db.String(10))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
-    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False, index=True)
 
 # نموذج الوثيقة
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=lambda: generate_sequential_id("DOC"))
+    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=sequential_id_default("DOC"))
     title = db.Column(db.String(200), nullable=False)
     doc_type = db.Column(db.String(50))
     source = db.Column(db.String(100))
@@ -150,15 +257,30 @@ class Document(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    files = db.relationship('DocumentFile', backref='document', lazy=True, cascade="all, delete-orphan")
+    files = db.relationship('DocumentFile', backref='document', lazy=True, cascade="all, delete-orphan", order_by='DocumentFile.id')
+    notifications = db.relationship('DocumentNotification', backref='document', lazy=True, cascade="all, delete-orphan")
+
+    # تنبيهات انتهاء الصلاحية: نطاق تاريخ مع استبعاد المنتهية
+    __table_args__ = (db.Index('ix_document_expiry_status', 'expiry_date', 'status'),)
 
-class DocumentFile(db.Model):
+class DocumentFile(UploadedFileMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
     filepath = db.Column(db.String(300), nullable=False)
     file_type = db.Column(db.String(10))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+
+# نموذج تنبيهات انتهاء الوثائق (تُحدث بمهمة مجدولة، انظر notifications.py)
+class DocumentNotification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # expiring, expired
+    title = db.Column(db.String(200))
+    expiry_date = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('document_id', 'kind', name='uq_notification_document_kind'),)
 
 # نموذج سجل النشاط
 class AuditLog(db.Model):
@@ -173,10 +295,13 @@ class AuditLog(db.Model):
 
     user = db.relationship('User', backref='audit_logs')
 
+    # صفحة سجل النشاط مرتبة بالأحدث
+    __table_args__ = (db.Index('ix_audit_log_timestamp', 'timestamp'),)
+
 # نموذج المعدات (قلابات، خلاطات، لودرات...)
 class Equipment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=lambda: generate_sequential_id("EQP"))
+    unique_id = db.Column(db.String(50), unique=True, nullable=False, default=sequential_id_default("EQP"))
     equipment_type = db.Column(db.String(50), nullable=False)  # قلاب، خلاطة، لودر...
     brand = db.Column(db.String(50), nullable=False)
     model = db.Column(db.String(50), nullable=False)
@@ -193,8 +318,12 @@ class Equipment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # العلاقات
-    fuel_records = db.relationship('FuelRecord', backref='equipment', lazy=True, cascade="all, delete-orphan")
-    maintenance_records = db.relationship('EquipmentMaintenance', backref='equipment', lazy=True, cascade="all, delete-orphan")
+    fuel_records = db.relationship('FuelRecord', backref='equipment', lazy=True, cascade="all, delete-orphan",
+                                   order_by=lambda: (FuelRecord.date.desc(), FuelRecord.id.desc()))
+    maintenance_records = db.relationship('EquipmentMaintenance', backref='equipment', lazy=True, cascade="all, delete-orphan",
+                                          order_by=lambda: (EquipmentMaintenance.date.desc(), EquipmentMaintenance.id.desc()))
+
+    __table_args__ = (db.Index('ix_equipment_status', 'status'),)
 
     def __repr__(self):
         return f'<Equipment {self.brand} {self.model}>'
@@ -212,6 +341,8 @@ class FuelRecord(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_fuel_equipment_date', 'equipment_id', 'date'),)
+
     def __repr__(self):
         return f'<FuelRecord {self.quantity}L for Equipment {self.equipment_id}>'
 
@@ -229,9 +360,44 @@ class EquipmentMaintenance(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_equipment_maintenance_date', 'equipment_id', 'date'),)
+
     def __repr__(self):
         return f'<EquipmentMaintenance {self.maintenance_type} for Equipment {self.equipment_id}>'
 
+# نموذج ملخص استهلاك الوقود لكل معدة (يُحدث مع كل سجل وقود، انظر fuel_analytics.py)
+class FuelEfficiency(db.Model):
+    equipment_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    readings = db.Column(db.Integer, nullable=False, default=0)  # عدد سجلات الوقود
+    distance = db.Column(db.Float, nullable=False, default=0)  # مجموع المسافة (كم أو ساعات) بين القراءات
+    liters = db.Column(db.Float, nullable=False, default=0)  # الوقود المستهلك في هذه المسافة
+    cost = db.Column(db.Float, nullable=False, default=0)
+    rolling_distance = db.Column(db.Float, nullable=False, default=0)  # آخر FUEL_ROLLING_WINDOW فترات
+    rolling_liters = db.Column(db.Float, nullable=False, default=0)
+    last_km = db.Column(db.Integer)  # آخر قراءة عداد محسوبة
+    last_record_id = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# نموذج وسيط استهلاك الوقود لكل نوع معدات وللأسطول كله (equipment_type فارغ)، يُحدث دورياً
+class FuelBaseline(db.Model):
+    unit = db.Column(db.String(10), primary_key=True)  # km أو hour
+    equipment_type = db.Column(db.String(50), primary_key=True)
+    median = db.Column(db.Float, nullable=False)
+    peers = db.Column(db.Integer, nullable=False)  # عدد المعدات الداخلة في الوسيط
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# نموذج جدول الصيانة المتوقعة لكل معدة (يُعاد بناؤه دورياً، انظر maintenance_forecast.py)
+class MaintenanceForecast(db.Model):
+    equipment_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    daily_usage = db.Column(db.Float)  # كم (أو ساعات) في اليوم؛ فارغ إذا لم تكفِ القراءات للتقدير
+    readings = db.Column(db.Integer, nullable=False, default=0)  # القراءات المستخدمة في التقدير
+    estimated_km = db.Column(db.Integer, nullable=False)  # قراءة العداد المقدرة يوم الحساب
+    next_maintenance_km = db.Column(db.Integer, nullable=False)
+    due_date = db.Column(db.Date)  # التاريخ المتوقع لبلوغ next_maintenance_km (سابق لليوم إذا تجاوزه)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_maintenance_forecast_due', 'due_date'),)
+
 # نموذج إعدادات الرواتب
 class SalarySettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -251,6 +417,8 @@ class EmployeeSalary(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_employee_salary_employee_id', 'employee_id'),)
+
 # نموذج سجل الحضور والغياب
 class AttendanceRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -262,6 +430,13 @@ class AttendanceRecord(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # ضمان فريد: سجل حضور واحد للموظف في اليوم
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'date', name='uq_attendance_employee_date'),
+        # حساب الرواتب: عدد الأيام لكل حالة في الأسبوع دون قراءة الجدول (فهرس مغطٍ)
+        db.Index('ix_attendance_employee_week', 'employee_id', 'year', 'week_number', 'status'),
+    )
+
 # نموذج الساعات والأيام الإضافية
 class OvertimeRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -274,6 +449,8 @@ class OvertimeRecord(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_overtime_employee_week', 'employee_id', 'year', 'week_number'),)
+
 # نموذج السلف
 class AdvancePayment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -285,6 +462,9 @@ class AdvancePayment(db.Model):
     paid_date = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # السلف غير المسددة للموظف
+    __table_args__ = (db.Index('ix_advance_employee_paid', 'employee_id', 'is_paid'),)
+
 # نموذج سجل الرواتب الأسبوعية
 class PayrollRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -305,4 +485,9 @@ class PayrollRecord(db.Model):
     paid = db.Column(db.Boolean, default=False)
     paid_date = db.Column(db.Date)
     notes = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    employee = db.relationship('Employee')
+
+    # رواتب أسبوع معين، وقائمة الرواتب مرتبة بالسنة ثم الأسبوع
+    __table_args__ = (db.Index('ix_payroll_week', 'year', 'week_number'),)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from datetime import date, timedelta
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import db, Document, DocumentNotification
+
+# تنبيهات انتهاء الوثائق: مهمة مجدولة تحول الوثائق المنتهية إلى "expired" بعبارة UPDATE واحدة
+# وتحدّث جدول document_notification (الوثائق المنتهية حديثاً والتي تنتهي قريباً).
+# صفحة الإشعارات وشارة القائمة تقرآن القائمة من ذاكرة العملية، ويُعاد تحميلها فقط عندما تلمس
+# المهمة ملف الإصدار في مجلد instance (كما في settings_cache). غير المقروء لكل مستخدم هو
+# التنبيهات التي رقمها أكبر من User.last_seen_notification_id، فلا يحتاج حسابه أي استعلام.
+
+EXPIRING_DAYS = 7
+EXPIRED_DAYS = 30
+
+def scan_document_expiry():
+    today = date.today()
+    documents = Document.__table__
+    # المنتهية تُحول دفعة واحدة (فهرس ix_document_expiry_status على expiry_date)
+    expired_count = db.session.execute(
+        update(documents)
+        .where(documents.c.expiry_date < today, documents.c.status != 'expired')
+        .values(status='expired')
+    ).rowcount
+
+    wanted = {}
+    rows = db.session.query(Document.id, Document.title, Document.expiry_date, Document.status).filter(
+        Document.expiry_date.between(today - timedelta(days=EXPIRED_DAYS), today + timedelta(days=EXPIRING_DAYS))
+    )
+    for document_id, title, expiry_date, status in rows:
+        if expiry_date < today:
+            wanted[(document_id, 'expired')] = (title, expiry_date)
+        elif status != 'expired':
+            wanted[(document_id, 'expiring')] = (title, expiry_date)
+
+    existing = {(n.document_id, n.kind): n for n in DocumentNotification.query}
+    stale = [existing[key].id for key in existing.keys() - wanted.keys()]
+    if stale:
+        DocumentNotification.query.filter(DocumentNotification.id.in_(stale)).delete(synchronize_session=False)
+    added = 0
+    for key, (title, expiry_date) in wanted.items():
+        notification = existing.get(key)
+        if notification is None:
+            db.session.add(DocumentNotification(document_id=key[0], kind=key[1], title=title, expiry_date=expiry_date))
+            added += 1
+        elif (notification.title, notification.expiry_date) != (title, expiry_date):
+            notification.title, notification.expiry_date = title, expiry_date
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # عملية أخرى نفذت الفحص في نفس الوقت
+        db.session.rollback()
+        return {'expired': 0, 'added': 0, 'removed': 0}
+    notification_feed.invalidate()
+    return {'expired': expired_count, 'added': added, 'removed': len(stale)}
+
+class NotificationFeed:
+    def __init__(self):
+        self.version_file = None
+        self._version = None
+        self._items = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        os.makedirs(app.instance_path, exist_ok=True)
+        self.version_file = os.path.join(app.instance_path, 'notifications.version')
+
+    def _current_version(self):
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def invalidate(self):
+        with self._lock:
+            self._items = None
+            if self.version_file:
+                with open(self.version_file, 'a'):
+                    pass
+                now = time.time_ns()
+                os.utime(self.version_file, ns=(now, now))
+
+    def items(self):
+        # [{'id', 'document_id', 'kind', 'title', 'expiry_date'}] مرتبة بتاريخ الانتهاء
+        version = self._current_version()
+        with self._lock:
+            if self._items is not None and version == self._version:
+                return self._items
+        items = [
+            {'id': n.id, 'document_id': n.document_id, 'kind': n.kind, 'title': n.title, 'expiry_date': n.expiry_date}
+            for n in DocumentNotification.query.order_by(DocumentNotification.expiry_date, DocumentNotification.id)
+        ]
+        with self._lock:
+            self._items, self._version = items, version
+        return items
+
+    def latest_id(self):
+        return max((item['id'] for item in self.items()), default=0)
+
+    def unread_count(self, last_seen_id):
+        return sum(1 for item in self.items() if item['id'] > (last_seen_id or 0))
+
+notification_feed = NotificationFeed()
@@ -0,0 +1,146 @@
+import base64
+import json
+from datetime import date, datetime
+from flask import request, url_for
+from sqlalchemy import and_, false, or_
+
+# ترقيم الصفحات بالمؤشر (keyset): بدلاً من OFFSET أو تحميل كل الصفوف، يتم الاستعلام عن
+# الصفوف التي تلي (أو تسبق) قيم مفاتيح الترتيب لآخر صف معروض، فيبقى زمن الصفحة ثابتاً
+# مهما كبر الجدول. المفتاح الأخير دائماً id لضمان ترتيب ثابت وفريد.
+# القيمة الفارغة (NULL) في مفتاح يقبلها أصغر من كل القيم في الترتيب وفي شرط المؤشر معاً (كما يرتبها
+# SQLite)، فلا تُفقد الصفوف الفارغة ولا تتكرر بين الصفحات.
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _decode_value(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, keys):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        if len(values) != len(keys):
+            return None
+        return [_decode_value(column, value) for (column, _), value in zip(keys, values)]
+    except (ValueError, TypeError):
+        return None
+
+def _nullable(column):
+    return getattr(getattr(column, 'expression', column), 'nullable', False)
+
+def _equals(column, value):
+    return column.is_(None) if value is None else column == value
+
+def _step(column, value, greater):
+    # الصفوف بعد value في اتجاه المفتاح، و NULL أصغر من كل القيم
+    if greater:
+        return column.isnot(None) if value is None else column > value
+    if value is None:
+        return false()
+    return or_(column < value, column.is_(None)) if _nullable(column) else column < value
+
+def _order(column, ascending):
+    if not _nullable(column):
+        return column.asc() if ascending else column.desc()
+    return column.asc().nulls_first() if ascending else column.desc().nulls_last()
+
+def _seek_condition(keys, values, forward):
+    # (a, b, id) > (x, y, z) مع مراعاة اتجاه كل مفتاح:
+    # a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+    clauses = []
+    for index, (column, descending) in enumerate(keys):
+        equals = [_equals(keys[i][0], values[i]) for i in range(index)]
+        clauses.append(and_(*equals, _step(column, values[index], greater=descending != forward)))
+    return or_(*clauses)
+
+class KeysetPage:
+    def __init__(self, rows, per_page, has_next, has_prev, sort=None, order=None):
+        # rows: (السجل، قيم مفاتيح الترتيب...) كما يعيدها keyset_paginate
+        items = [row[0] for row in rows]
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next and bool(items)
+        self.has_prev = has_prev and bool(items)
+        self.sort = sort
+        self.order = order
+        self.next_cursor = encode_cursor(rows[-1][1:]) if self.has_next else None
+        self.prev_cursor = encode_cursor(rows[0][1:]) if self.has_prev else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _url(self, **changes):
+        # نفس عنوان الصفحة الحالية (مع q وبقية المرشحات) بعد استبدال المؤشر أو الترتيب
+        args = request.args.to_dict()
+        args.pop('after', None)
+        args.pop('before', None)
+        args.update(changes)
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    @property
+    def next_url(self):
+        return self._url(after=self.next_cursor) if self.has_next else None
+
+    @property
+    def prev_url(self):
+        return self._url(before=self.prev_cursor) if self.has_prev else None
+
+    def sort_url(self, field):
+        # الضغط على نفس العمود يعكس اتجاه الترتيب
+        order = 'desc' if self.sort == field and self.order == 'asc' else 'asc'
+        return self._url(sort=field, order=order)
+
+def keyset_paginate(query, keys, after=None, before=None, per_page=DEFAULT_PER_PAGE, sort=None, order=None):
+    # keys: [(column, descending)] ويجب أن يكون آخرها عموداً فريداً (id)
+    # قيم المفاتيح تُختار مع السجل، فيمكن أن يكون المفتاح عموداً من جدول مرتبط (مثل درجة الصلة في البحث)
+    cursor = decode_cursor(before, keys) if before else decode_cursor(after, keys) if after else None
+    forward = not (before and cursor is not None)
+    if cursor is not None:
+        query = query.filter(_seek_condition(keys, cursor, forward))
+    ordering = [_order(column, ascending=descending != forward) for column, descending in keys]
+    rows = query.add_columns(*[column for column, _ in keys]).order_by(*ordering).limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if forward:
+        return KeysetPage(rows, per_page, has_next=more, has_prev=cursor is not None, sort=sort, order=order)
+    rows.reverse()
+    return KeysetPage(rows, per_page, has_next=True, has_prev=more, sort=sort, order=order)
+
+def paginate_request(query, sort_columns, default_sort, default_order='asc', id_column=None):
+    # يقرأ sort و order و after و before و per_page من عنوان الطلب
+    # sort_columns: {'اسم الحقل في العنوان': column أو (column, ...)} — قائمة بيضاء للحقول المسموح الترتيب بها
+    sort = request.args.get('sort', default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
+    order = request.args.get('order', default_order)
+    if order not in ('asc', 'desc'):
+        order = default_order
+    per_page = request.args.get('per_page', DEFAULT_PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    columns = sort_columns[sort]
+    columns = list(columns) if isinstance(columns, (list, tuple)) else [columns]
+    id_column = id_column if id_column is not None else query.column_descriptions[0]['entity'].id
+    keys = [(column, order == 'desc') for column in columns]
+    if columns[-1] is not id_column:
+        keys.append((id_column, order == 'desc'))
+    return keyset_paginate(query, keys, request.args.get('after'), request.args.get('before'), per_page, sort=sort, order=order)
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert, text
+from sqlalchemy.dialects import postgresql, sqlite
+from instrumentation import timed
+from models import db, Employee, EmployeeSalary, AttendanceRecord, OvertimeRecord, AdvancePayment, PayrollRecord
+
+# محرك حساب الرواتب الأسبوعية على مستوى المجموعة:
+# بدلاً من أربعة استعلامات لكل موظف، يتم تحميل بيانات الأسبوع كاملة باستعلامات مجمعة
+# ثم يتم الحساب بأعمدة pandas/NumPy ويُحفظ PayrollRecord دفعة واحدة.
+
+PAYROLL_COLUMNS = [
+    'present_days', 'absent_days', 'half_days', 'overtime_days', 'overtime_hours',
+    'basic_salary', 'overtime_amount', 'deductions', 'advances_deduction', 'net_salary'
+]
+
+def _employee_filter(employee_id=None):
+    # الموظفون المشمولون بالحساب: موظف واحد أو كل الموظفين النشطين
+    if employee_id:
+        return Employee.id == employee_id
+    return Employee.status == 'active'
+
+def load_week_frame(week_number, year, employee_id=None):
+    employee_filter = _employee_filter(employee_id)
+    employee_ids = db.select(Employee.id).where(employee_filter)
+    employees = pd.DataFrame(
+        db.session.query(Employee.id, Employee.full_name).filter(employee_filter).order_by(Employee.id).all(),
+        columns=['employee_id', 'full_name']
+    ).set_index('employee_id')
+
+    # الحضور: عدد الأيام لكل حالة
+    attendance = pd.DataFrame(
+        db.session.query(AttendanceRecord.employee_id, AttendanceRecord.status, func.count(AttendanceRecord.id))
+        .filter(AttendanceRecord.week_number == week_number,
+                AttendanceRecord.year == year,
+                AttendanceRecord.employee_id.in_(employee_ids))
+        .group_by(AttendanceRecord.employee_id, AttendanceRecord.status).all(),
+        columns=['employee_id', 'status', 'count']
+    )
+    attendance = attendance.pivot_table(index='employee_id', columns='status', values='count', aggfunc='sum')
+
+    # الإضافي: مجموع الكميات لكل نوع
+    overtime = pd.DataFrame(
+        db.session.query(OvertimeRecord.employee_id, OvertimeRecord.overtime_type, OvertimeRecord.quantity)
+        .filter(OvertimeRecord.week_number == week_number,
+                OvertimeRecord.year == year,
+                OvertimeRecord.employee_id.in_(employee_ids))
+        .order_by(OvertimeRecord.id).all(),
+        columns=['employee_id', 'overtime_type', 'quantity']
+    )
+    overtime = overtime.pivot_table(index='employee_id', columns='overtime_type', values='quantity', aggfunc='sum')
+
+    # السلف غير المسددة
+    advances = pd.DataFrame(
+        db.session.query(AdvancePayment.employee_id, AdvancePayment.amount)
+        .filter(AdvancePayment.is_paid == False,
+                AdvancePayment.employee_id.in_(employee_ids))
+        .order_by(AdvancePayment.id).all(),
+        columns=['employee_id', 'amount']
+    ).groupby('employee_id')['amount'].sum()
+
+    # معلومات الراتب (أول سجل لكل موظف كما في الحساب السابق)
+    salaries = pd.DataFrame(
+        db.session.query(EmployeeSalary.employee_id, EmployeeSalary.base_salary, EmployeeSalary.daily_wage)
+        .filter(EmployeeSalary.employee_id.in_(employee_ids))
+        .order_by(EmployeeSalary.id).all(),
+        columns=['employee_id', 'base_salary', 'daily_wage']
+    ).drop_duplicates('employee_id').set_index('employee_id')
+
+    frame = employees.copy()
+    frame['has_salary'] = frame.index.isin(salaries.index)
+    frame['base_salary'] = salaries['base_salary'].reindex(frame.index).astype(float)
+    frame['daily_wage'] = salaries['daily_wage'].reindex(frame.index).astype(float)
+    for status, column in (('present', 'present_days'), ('absent', 'absent_days'), ('half_day', 'half_days')):
+        values = attendance[status] if status in attendance.columns else pd.Series(dtype=float)
+        frame[column] = values.reindex(frame.index).fillna(0).astype(int)
+    for overtime_type, column in (('daily', 'overtime_days'), ('hourly', 'overtime_hours')):
+        values = overtime[overtime_type] if overtime_type in overtime.columns else pd.Series(dtype=float)
+        frame[column] = values.reindex(frame.index).fillna(0).astype(float)
+    frame['advances_deduction'] = advances.reindex(frame.index).fillna(0).astype(float)
+    return frame
+
+def compute_payroll(frame, salary_settings):
+    frame = frame.copy()
+    daily_wage = frame['daily_wage'].fillna(0).to_numpy()
+    base_salary = frame['base_salary'].fillna(0).to_numpy()
+    present = frame['present_days'].to_numpy()
+    absent = frame['absent_days'].to_numpy()
+    half = frame['half_days'].to_numpy()
+
+    # نفس قواعد الحساب السابقة: الأجر اليومي أولاً ثم الراتب الأساسي / 26
+    daily_rate = np.where(daily_wage != 0, daily_wage, base_salary / 26)
+    frame['basic_salary'] = present * daily_rate + half * (daily_rate / 2)
+    frame['overtime_amount'] = (frame['overtime_days'] * salary_settings.overtime_daily_rate) + (frame['overtime_hours'] * salary_settings.overtime_hourly_rate)
+    frame['deductions'] = absent * daily_rate
+    frame['net_salary'] = frame['basic_salary'] + frame['overtime_amount'] - frame['deductions'] - frame['advances_deduction']
+    return frame
+
+def upsert_payroll(frame, week_number, year):
+    frame = frame[frame['has_salary']]
+    if frame.empty:
+        return 0, 0
+    # سجلات الأسبوع الموجودة مسبقاً باستعلام واحد (سجل واحد لكل موظف في الأسبوع)
+    existing = dict(
+        db.session.query(PayrollRecord.employee_id, PayrollRecord.id)
+        .filter(PayrollRecord.week_number == week_number, PayrollRecord.year == year)
+        .order_by(PayrollRecord.id.desc()).all()
+    )
+    updates, inserts = [], []
+    for employee_id, row in zip(frame.index, frame[PAYROLL_COLUMNS].to_dict('records')):
+        values = {key: (int(value) if key in ('present_days', 'absent_days', 'half_days') else float(value)) for key, value in row.items()}
+        if employee_id in existing:
+            updates.append(dict(values, id=existing[employee_id]))
+        else:
+            inserts.append(dict(values, employee_id=int(employee_id), week_number=week_number, year=year, paid=False))
+    if updates:
+        db.session.bulk_update_mappings(PayrollRecord, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(PayrollRecord, inserts)
+    return len(inserts), len(updates)
+
+@timed('payroll_calculation')
+def run_weekly_payroll(week_number, year, salary_settings, employee_id=None):
+    # يعيد (عدد السجلات الجديدة، عدد السجلات المحدثة، أسماء الموظفين بدون معلومات راتب)
+    frame = compute_payroll(load_week_frame(week_number, year, employee_id), salary_settings)
+    skipped = frame.loc[~frame['has_salary'], 'full_name'].tolist()
+    inserted, updated = upsert_payroll(frame, week_number, year)
+    return inserted, updated, skipped
+
+# --- الإدخال الجماعي للحضور والإضافي ---
+DUPLICATES_SHOWN = 20
+
+def ensure_attendance_unique_index():
+    # ترحيل: قواعد البيانات القديمة أُنشئت بدون القيد الفريد (employee_id, date) الذي يحتاجه ON CONFLICT.
+    # السجلات المكررة بيانات رواتب لا تُحذف تلقائياً: يتوقف الترحيل ويعرضها ليحسمها المسؤول
+    duplicates = db.session.execute(text(
+        "SELECT employee_id, date, GROUP_CONCAT(id) FROM attendance_record "
+        "GROUP BY employee_id, date HAVING COUNT(*) > 1 ORDER BY employee_id, date"
+    )).all()
+    if duplicates:
+        listed = '\n'.join(f"  الموظف {employee_id} بتاريخ {day}: السجلات {ids}"
+                           for employee_id, day, ids in duplicates[:DUPLICATES_SHOWN])
+        more = f"\n  و{len(duplicates) - DUPLICATES_SHOWN} تكرار آخر" if len(duplicates) > DUPLICATES_SHOWN else ''
+        raise RuntimeError(
+            f"سجلات حضور مكررة لنفس الموظف واليوم ({len(duplicates)}): احذف السجل الخاطئ من كل مجموعة "
+            f"ثم أعد التشغيل.\n{listed}{more}"
+        )
+    db.session.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_employee_date ON attendance_record (employee_id, date)"
+    ))
+    db.session.commit()
+
+def _dialect_insert(model):
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model)
+
+def upsert_attendance_sheet(attendance_date, rows):
+    # rows: [{'employee_id', 'status', 'notes'}] لتاريخ واحد، تُكتب بدفعة واحدة INSERT ... ON CONFLICT
+    if not rows:
+        return 0, 0
+    week_number = attendance_date.isocalendar()[1]
+    existing = {employee_id for (employee_id,) in db.session.query(AttendanceRecord.employee_id)
+                .filter(AttendanceRecord.date == attendance_date)}
+    statement = _dialect_insert(AttendanceRecord)
+    statement = statement.on_conflict_do_update(
+        index_elements=['employee_id', 'date'],
+        set_={'status': statement.excluded.status, 'notes': statement.excluded.notes}
+    )
+    db.session.execute(statement, [dict(row, date=attendance_date, week_number=week_number, year=attendance_date.year) for row in rows])
+    updated = sum(1 for row in rows if row['employee_id'] in existing)
+    return len(rows) - updated, updated
+
+def insert_overtime_sheet(overtime_date, rows):
+    # rows: [{'employee_id', 'overtime_type', 'quantity', 'notes'}] تُدرج كلها بعبارة واحدة
+    if not rows:
+        return 0
+    week_number = overtime_date.isocalendar()[1]
+    db.session.execute(insert(OvertimeRecord), [dict(row, date=overtime_date, week_number=week_number, year=overtime_date.year) for row in rows])
+    return len(rows)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import pdfkit
+from flask import make_response
+from instrumentation import timed
+
+# خدمة توليد PDF: كل عملية wkhtmltopdf تعمل في مجمع محدود العدد بدلاً من تشغيلها داخل الطلب
+# مباشرة، مع مهلة قصوى لكل عملية، وذاكرة مؤقتة على القرص مفتاحها بصمة HTML الناتج،
+# فالسجل الذي لم يتغير يُعاد ملفه فوراً دون تشغيل wkhtmltopdf.
+
+PDF_OPTIONS = {
+    'encoding': 'UTF-8',
+    'enable-local-file-access': '',
+    'quiet': ''
+}
+
+class PdfServiceBusy(Exception):
+    pass
+
+class PdfRenderError(Exception):
+    pass
+
+class PdfService:
+    def __init__(self):
+        self.cache_dir = None
+        self.max_workers = 2
+        self.max_pending = 8
+        self.render_timeout = 30
+        self.cache_max_bytes = 500 * 1024 * 1024
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'renders': 0, 'cache_hits': 0, 'cache_misses': 0, 'failures': 0,
+            'timeouts': 0, 'rejected': 0, 'render_seconds_total': 0.0, 'render_seconds_max': 0.0
+        }
+
+    def init_app(self, app):
+        self.cache_dir = app.config.get('PDF_CACHE_DIR') or os.path.join(app.instance_path, 'pdf_cache')
+        self.max_workers = app.config.get('PDF_MAX_WORKERS', self.max_workers)
+        self.max_pending = app.config.get('PDF_MAX_PENDING', self.max_pending)
+        self.render_timeout = app.config.get('PDF_RENDER_TIMEOUT', self.render_timeout)
+        self.cache_max_bytes = app.config.get('PDF_CACHE_MAX_BYTES', self.cache_max_bytes)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pdf-render')
+        # الطلبات المنتظرة + قيد التنفيذ، وما زاد عنها يُرفض فوراً بدلاً من حجز عامل الويب
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+
+    # --- الذاكرة المؤقتة ---
+    def cache_key(self, html, options=None):
+        digest = hashlib.sha256()
+        digest.update(html.encode('utf-8'))
+        digest.update(repr(sorted((options or PDF_OPTIONS).items())).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _cache_path(self, key):
+        # مجلدات فرعية بأول حرفين من البصمة حتى لا يتضخم مجلد واحد
+        return os.path.join(self.cache_dir, key[:2], f'{key}.pdf')
+
+    def _read_cache(self, key):
+        path = self._cache_path(key)
+        try:
+            with open(path, 'rb') as f:
+                pdf = f.read()
+        except OSError:
+            return None
+        os.utime(path)
+        return pdf
+
+    def _write_cache(self, key, pdf):
+        path = self._cache_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+
+    def prune_cache(self):
+        # حذف الأقدم استخداماً حتى يعود الحجم تحت الحد
+        entries = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.pdf'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+    # --- التوليد ---
+    @timed('pdf_render')
+    def _render(self, html, options):
+        # تشغيل wkhtmltopdf مباشرة بأمر pdfkit حتى تُقتل العملية إذا تجاوزت المهلة
+        started = time.perf_counter()
+        try:
+            command = pdfkit.PDFKit(html, 'string', options=options).command()
+            result = subprocess.run(command, input=html.encode('utf-8'), capture_output=True, timeout=self.render_timeout)
+        except subprocess.TimeoutExpired:
+            self._record(timeouts=1)
+            raise PdfRenderError('انتهت مهلة توليد ملف PDF.')
+        except OSError as e:
+            # wkhtmltopdf غير مثبت أو تعذر تشغيله
+            self._record(failures=1)
+            raise PdfRenderError(str(e))
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0 and not result.stdout.startswith(b'%PDF'):
+            self._record(failures=1)
+            raise PdfRenderError(result.stderr.decode('utf-8', errors='replace'))
+        self._record(renders=1, render_seconds=elapsed)
+        return result.stdout
+
+    def _record(self, render_seconds=None, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+            if render_seconds is not None:
+                self._stats['render_seconds_total'] += render_seconds
+                self._stats['render_seconds_max'] = max(self._stats['render_seconds_max'], render_seconds)
+
+    def render(self, html, options=None):
+        options = options or PDF_OPTIONS
+        key = self.cache_key(html, options)
+        pdf = self._read_cache(key)
+        if pdf is not None:
+            self._record(cache_hits=1)
+            return pdf
+        self._record(cache_misses=1)
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            raise PdfServiceBusy('خدمة PDF مشغولة حالياً، يرجى المحاولة بعد قليل.')
+        try:
+            future = self._executor.submit(self._render, html, options)
+        except Exception:
+            self._slots.release()
+            raise
+        # المكان يُحرر عند انتهاء العملية فعلاً، لا عند توقف الطلب عن انتظارها
+        future.add_done_callback(lambda _: self._slots.release())
+        # مهلة الانتظار تشمل الوقت في الطابور خلف الطلبات الأخرى
+        waves = -(-self.max_pending // self.max_workers) + 1
+        try:
+            pdf = future.result(timeout=self.render_timeout * waves)
+        except FutureTimeout:
+            self._record(timeouts=1)
+            raise PdfRenderError('انتهت مهلة توليد ملف PDF.')
+        self._write_cache(key, pdf)
+        return pdf
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        stats['cache_hit_ratio'] = stats['cache_hits'] / lookups if lookups else 0.0
+        stats['render_seconds_avg'] = stats['render_seconds_total'] / stats['renders'] if stats['renders'] else 0.0
+        stats['max_workers'] = self.max_workers
+        stats['max_pending'] = self.max_pending
+        return stats
+
+pdf_service = PdfService()
+
+def pdf_response(html, filename):
+    pdf = pdf_service.render(html)
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+from sqlalchemy import event, func, select
+from models import db, User
+from payroll import load_week_frame
+from stock_ledger import stock_balances
+from notifications import scan_document_expiry
+
+# فحص خطط تنفيذ الاستعلامات المتكررة (EXPLAIN QUERY PLAN في SQLite): كل مسار هنا يشغّل كود التطبيق نفسه
+# (صفحة يفتحها مستخدم مسؤول، أو دالة تستدعيها الصفحات والمهام المجدولة)، وتُلتقط عبارات SELECT التي نفذها
+# وتُفحص خطة كل منها، فلا يبتعد الفحص عن الاستعلامات الفعلية عند تعديلها. الفحص يفشل إذا لجأ أي منها إلى
+# قراءة جدول كامل (SCAN بدون فهرس)، عدا الجداول الصغيرة بطبيعتها في SMALL_TABLES.
+# يُشغل بـ flask check-query-plans بعد أي تعديل على النماذج أو الفهارس أو الاستعلامات، ويفحصه
+# tests/test_query_plans.py.
+
+# جداول بعدد صفوف ثابت تقريباً أو محدود بنافذة زمنية: قراءتها كاملة أرخص من أي فهرس
+SMALL_TABLES = ('company_settings', 'salary_settings', 'dashboard_metric', 'schema_version', 'document_notification')
+
+def _first_id(table_name):
+    table = db.metadata.tables[table_name]
+    return db.session.scalar(select(func.min(table.c.id))) or 0
+
+def _current_week():
+    year, week_number, _ = date.today().isocalendar()
+    return week_number, year
+
+HOT_PATHS = {
+    # لوحة التحكم: المؤشرات وأقرب مواعيد الصيانة المتوقعة
+    'dashboard': lambda client: client.get('/'),
+    'car_detail': lambda client: client.get(f"/cars/{_first_id('car')}"),
+    'employee_detail': lambda client: client.get(f"/employees/{_first_id('employee')}"),
+    'equipment_detail': lambda client: client.get(f"/equipment/{_first_id('equipment')}"),
+    # قائمة الرواتب (الصفحة الأولى) ورواتب أسبوع معين
+    'payroll_list': lambda client: client.get('/salary/payroll'),
+    'payroll_list_week': lambda client: client.get('/salary/payroll?week_number={}&year={}'.format(*_current_week())),
+    # حركة مادة معينة (الصفحة الأولى)
+    'material_history': lambda client: client.get(f"/inventory/material/{_first_id('material')}"),
+    # سجل النشاط (الصفحة الأولى)
+    'audit_log': lambda client: client.get('/audit'),
+    # حساب الرواتب: الحضور والإضافي والسلف لموظفي الأسبوع
+    'payroll_week': lambda client: load_week_frame(*_current_week()),
+    # الرصيد في تاريخ سابق: آخر لقطة والحركات بعدها
+    'stock_as_of': lambda client: stock_balances(date.today() - timedelta(days=1)),
+    # المهمة المجدولة: الوثائق المنتهية والتي تنتهي قريباً
+    'document_expiry': lambda client: scan_document_expiry(),
+}
+
+# جداول يحتاجها المسار كاملة (وليست تصفية بلا فهرس): كل الموظفين النشطين في الرواتب، وأسماء كل المواد في الأرصدة
+FULL_READS = {
+    'payroll_week': ('employee',),
+    'stock_as_of': ('material',),
+}
+
+@contextmanager
+def captured_selects():
+    # عبارات SELECT المنفذة داخل الكتلة [(النص، المعاملات)] بلا تكرار
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and (statement, parameters) not in statements:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+def explain_query_plan(statement, parameters=()):
+    # يعيد أسطر الخطة (detail) لعبارة SQL كما نفذها التطبيق
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    return [row[-1] for row in rows]
+
+def is_full_scan(detail, full_reads=()):
+    # "SCAN table" بدون فهرس (SCAN ... USING INDEX يمر على فهرس مرتب وليس الجدول)
+    if not detail.startswith('SCAN ') or 'USING' in detail or detail == 'SCAN CONSTANT ROW':
+        return False
+    return detail.split()[1] not in SMALL_TABLES + full_reads
+
+def _admin_client(app):
+    admin_id = db.session.scalar(select(func.min(User.id)).where(User.role == 'admin'))
+    if admin_id is None:
+        raise RuntimeError('فحص خطط الاستعلامات يحتاج مستخدماً مسؤولاً في قاعدة البيانات')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    return client
+
+def check_query_plans(app):
+    # يعيد {الاسم: (حالة الصفحة، [(العبارة، أسطر الخطة)]، أسطر القراءة الكاملة)}؛ الدوال حالتها 200
+    client = _admin_client(app)
+    results = {}
+    for name, run in HOT_PATHS.items():
+        with captured_selects() as statements:
+            response = run(client)
+        status = getattr(response, 'status_code', 200)
+        plans = [(statement, explain_query_plan(statement, parameters)) for statement, parameters in statements]
+        full_reads = FULL_READS.get(name, ())
+        results[name] = (status, plans, [detail for _, plan in plans for detail in plan if is_full_scan(detail, full_reads)])
+    return results
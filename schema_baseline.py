@@ -0,0 +1,258 @@
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, UniqueConstraint
+
+# مخطط قاعدة البيانات كما كان قبل الترحيلات المرقمة (الإصدار الأول من التطبيق) بتعريف ثابت لا يتبع النماذج.
+# الترحيل الأول ينشئ هذه الجداول فقط، وكل جدول أو عمود أو فهرس أُضيف بعدها يُنشأ في ترحيله.
+# لا يُعدل هذا الملف: أي تغيير على المخطط يكون ترحيلاً جديداً في bootstrap.MIGRATIONS.
+
+BASELINE = MetaData()
+
+Table('car', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('unique_id', String(50), nullable=False, unique=True),
+    Column('chassis_number', String(100), nullable=False, unique=True),
+    Column('brand', String(50), nullable=False),
+    Column('model', String(50), nullable=False),
+    Column('car_type', String(50)),
+    Column('color', String(30)),
+    Column('year', Integer),
+    Column('plate_number', String(20)),
+    Column('status', String(20)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('company_settings', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('company_name', String(200)),
+    Column('logo_filename', String(200)),
+    Column('updated_at', DateTime),
+)
+Table('document', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('unique_id', String(50), nullable=False, unique=True),
+    Column('title', String(200), nullable=False),
+    Column('doc_type', String(50)),
+    Column('source', String(100)),
+    Column('issue_date', Date),
+    Column('receive_date', Date),
+    Column('expiry_date', Date),
+    Column('status', String(20)),
+    Column('folder', String(100)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('employee', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('unique_id', String(50), nullable=False, unique=True),
+    Column('national_id', String(20), nullable=False, unique=True),
+    Column('full_name', String(100), nullable=False),
+    Column('birth_date', Date),
+    Column('gender', String(10)),
+    Column('address', String(200)),
+    Column('phone', String(20)),
+    Column('email', String(100)),
+    Column('department', String(50)),
+    Column('position', String(50)),
+    Column('hire_date', Date),
+    Column('status', String(20)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('equipment', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('unique_id', String(50), nullable=False, unique=True),
+    Column('equipment_type', String(50), nullable=False),
+    Column('brand', String(50), nullable=False),
+    Column('model', String(50), nullable=False),
+    Column('chassis_number', String(100), nullable=False, unique=True),
+    Column('engine_number', String(100)),
+    Column('capacity', Float),
+    Column('max_load', Float),
+    Column('current_km', Integer),
+    Column('last_maintenance_km', Integer),
+    Column('next_maintenance_km', Integer),
+    Column('status', String(20)),
+    Column('purchase_date', Date),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('material', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('unit', String(20), nullable=False),
+    Column('min_stock_level', Float),
+    Column('category', String(50)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('salary_settings', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('daily_rate', Float, nullable=False),
+    Column('hourly_rate', Float, nullable=False),
+    Column('overtime_daily_rate', Float, nullable=False),
+    Column('overtime_hourly_rate', Float, nullable=False),
+    Column('updated_at', DateTime),
+)
+Table('user', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(50), nullable=False, unique=True),
+    Column('email', String(100), nullable=False, unique=True),
+    Column('password_hash', String(128), nullable=False),
+    Column('role', String(20)),
+    Column('created_at', DateTime),
+)
+Table('warehouse', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False, unique=True),
+    Column('location', String(200)),
+    Column('is_active', Boolean),
+    Column('created_at', DateTime),
+)
+Table('advance_payment', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('employee.id'), nullable=False),
+    Column('amount', Float, nullable=False),
+    Column('payment_date', Date, nullable=False),
+    Column('reason', Text),
+    Column('is_paid', Boolean),
+    Column('paid_date', Date),
+    Column('created_at', DateTime),
+)
+Table('attendance_record', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('employee.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('status', String(20), nullable=False),
+    Column('week_number', Integer, nullable=False),
+    Column('year', Integer, nullable=False),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('audit_log', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id')),
+    Column('username', String(50)),
+    Column('action', String(50)),
+    Column('entity_type', String(50)),
+    Column('entity_id', Integer),
+    Column('details', Text),
+    Column('timestamp', DateTime),
+)
+Table('car_file', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('filename', String(200), nullable=False),
+    Column('filepath', String(300), nullable=False),
+    Column('file_type', String(10)),
+    Column('uploaded_at', DateTime),
+    Column('car_id', Integer, ForeignKey('car.id'), nullable=False),
+)
+Table('document_file', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('filename', String(200), nullable=False),
+    Column('filepath', String(300), nullable=False),
+    Column('file_type', String(10)),
+    Column('uploaded_at', DateTime),
+    Column('document_id', Integer, ForeignKey('document.id'), nullable=False),
+)
+Table('employee_file', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('filename', String(200), nullable=False),
+    Column('filepath', String(300), nullable=False),
+    Column('file_type', String(10)),
+    Column('uploaded_at', DateTime),
+    Column('employee_id', Integer, ForeignKey('employee.id'), nullable=False),
+)
+Table('employee_salary', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('employee.id'), nullable=False),
+    Column('base_salary', Float),
+    Column('daily_wage', Float),
+    Column('hourly_wage', Float),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('equipment_maintenance', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('equipment_id', Integer, ForeignKey('equipment.id'), nullable=False),
+    Column('maintenance_type', String(50), nullable=False),
+    Column('description', String(100)),
+    Column('date', Date, nullable=False),
+    Column('cost', Float),
+    Column('current_km', Integer, nullable=False),
+    Column('next_maintenance_km', Integer),
+    Column('performed_by', String(100)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('fuel_record', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('equipment_id', Integer, ForeignKey('equipment.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('quantity', Float, nullable=False),
+    Column('price_per_liter', Float, nullable=False),
+    Column('total_cost', Float, nullable=False),
+    Column('current_km', Integer, nullable=False),
+    Column('fuel_type', String(20)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('maintenance_record', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('car_id', Integer, ForeignKey('car.id'), nullable=False),
+    Column('maintenance_type', String(50), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('cost', Float),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('overtime_record', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('employee.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('overtime_type', String(20), nullable=False),
+    Column('quantity', Float, nullable=False),
+    Column('week_number', Integer, nullable=False),
+    Column('year', Integer, nullable=False),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('payroll_record', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('employee.id'), nullable=False),
+    Column('week_number', Integer, nullable=False),
+    Column('year', Integer, nullable=False),
+    Column('total_days', Integer),
+    Column('present_days', Integer),
+    Column('absent_days', Integer),
+    Column('half_days', Integer),
+    Column('overtime_days', Float),
+    Column('overtime_hours', Float),
+    Column('basic_salary', Float),
+    Column('overtime_amount', Float),
+    Column('deductions', Float),
+    Column('advances_deduction', Float),
+    Column('net_salary', Float),
+    Column('paid', Boolean),
+    Column('paid_date', Date),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+)
+Table('stock_item', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('warehouse_id', Integer, ForeignKey('warehouse.id'), nullable=False),
+    Column('material_id', Integer, ForeignKey('material.id'), nullable=False),
+    Column('quantity', Float),
+    Column('last_updated', DateTime),
+    UniqueConstraint('warehouse_id', 'material_id', name='uq_warehouse_material'),
+)
+Table('stock_transaction', BASELINE,
+    Column('id', Integer, primary_key=True),
+    Column('warehouse_id', Integer, ForeignKey('warehouse.id'), nullable=False),
+    Column('material_id', Integer, ForeignKey('material.id'), nullable=False),
+    Column('transaction_type', String(20), nullable=False),
+    Column('quantity', Float, nullable=False),
+    Column('balance_after', Float, nullable=False),
+    Column('reference', String(100)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+    Column('created_by_id', Integer, ForeignKey('user.id')),
+)
@@ -0,0 +1,192 @@
+import re
+from sqlalchemy import event, func, literal_column, select, table, column, text, union_all, Float
+from models import db, Car, Employee, Document, Equipment
+
+# فهرس البحث النصي الكامل (SQLite FTS5): جدول افتراضي لكل كيان، رقم الصف فيه (rowid) هو id السجل.
+# يُحدَّث الفهرس مع كل إضافة/تعديل/حذف عبر أحداث SQLAlchemy، وتُرتب النتائج بـ bm25
+# بدلاً من مسح الجدول كاملاً بستة شروط LIKE '%q%'.
+# الكلمات تُطابق كبادئة فقط، لذلك للمعرفات (الرقم المرجعي، الشاسيه، اللوحة، الهاتف) جدول FTS5 ثانٍ بمقسم
+# trigram يطابق النص من أي موضع فيها (جزء من وسط رقم الشاسيه أو الهاتف) بالفهرس أيضاً، بدءاً من 3 أحرف.
+
+SEARCH_FIELDS = {
+    Car: ('chassis_number', 'brand', 'model', 'plate_number', 'color', 'notes'),
+    Employee: ('full_name', 'national_id', 'department', 'position', 'phone', 'email', 'notes'),
+    Document: ('title', 'unique_id', 'doc_type', 'source', 'folder', 'notes'),
+    Equipment: ('equipment_type', 'brand', 'model', 'chassis_number', 'status'),
+}
+
+# الحقول التي يُبحث فيها بجزء من وسطها
+IDENTIFIER_FIELDS = {
+    Car: ('unique_id', 'chassis_number', 'plate_number'),
+    Employee: ('unique_id', 'national_id', 'phone'),
+    Document: ('unique_id',),
+    Equipment: ('unique_id', 'chassis_number'),
+}
+
+# وزن الحقل الأول (الاسم/العنوان/الشاسيه) أعلى من بقية الحقول في ترتيب bm25
+PRIMARY_FIELD_WEIGHT = 5.0
+REBUILD_BATCH_SIZE = 1000
+MIN_SUBSTRING_LENGTH = 3  # أقصر نص يطابقه trigram
+
+# الحركات (التشكيل) والتطويل
+_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+})
+
+def normalize_arabic(value):
+    # توحيد الهمزات والألف والتاء المربوطة وإزالة التشكيل، ليطابق "أحمد" و"احمد" و"أَحْمَد"
+    if value is None:
+        return None
+    return _DIACRITICS.sub('', str(value)).translate(_LETTERS).lower()
+
+def fts_table_name(model):
+    return f'fts_{model.__tablename__}'
+
+def trigram_table_name(model):
+    return f'fts_{model.__tablename__}_trigram'
+
+def _index_tables(model):
+    # [(الجدول الافتراضي، حقوله، المقسم)] لكل كيان
+    return [
+        (fts_table_name(model), SEARCH_FIELDS[model], 'unicode61 remove_diacritics 2'),
+        (trigram_table_name(model), IDENTIFIER_FIELDS[model], 'trigram'),
+    ]
+
+def build_match_query(query):
+    # كل كلمة تُطابق كبادئة ("كلم"*) ويجب أن تتحقق كل الكلمات
+    tokens = re.findall(r'\w+', normalize_arabic(query) or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def build_substring_query(query):
+    # النص كاملاً كعبارة trigram تُطابق من أي موضع في المعرف، أو '' للنص الأقصر من MIN_SUBSTRING_LENGTH
+    value = ' '.join((normalize_arabic(query) or '').split())
+    if len(value) < MIN_SUBSTRING_LENGTH:
+        return ''
+    return '"' + value.replace('"', '""') + '"'
+
+def search_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+# --- تحديث الفهرس ---
+def _row_values(fields, target):
+    return {field: normalize_arabic(getattr(target, field)) for field in fields}
+
+def _upsert_statement(name, fields):
+    return text(
+        f"INSERT OR REPLACE INTO {name} (rowid, {', '.join(fields)}) "
+        f"VALUES (:rowid, {', '.join(':' + field for field in fields)})"
+    )
+
+def _delete_statement(name):
+    return text(f"DELETE FROM {name} WHERE rowid = :rowid")
+
+def _index_listener(model):
+    def after_save(mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            for name, fields, _ in _index_tables(model):
+                connection.execute(_upsert_statement(name, fields), dict(_row_values(fields, target), rowid=target.id))
+    return after_save
+
+def _unindex_listener(model):
+    def after_delete(mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            for name, _, _ in _index_tables(model):
+                connection.execute(_delete_statement(name), {'rowid': target.id})
+    return after_delete
+
+def index_rows(connection, model, rows):
+    # فهرسة صفوف أُدرجت بعبارة Core مباشرة (الاستيراد الجماعي) ولا تمر بالأحداث؛ كل صف dict فيه id
+    if connection.dialect.name != 'sqlite' or not rows:
+        return
+    for name, fields, _ in _index_tables(model):
+        connection.execute(_upsert_statement(name, fields), [
+            dict({field: normalize_arabic(row.get(field)) for field in fields}, rowid=row['id']) for row in rows
+        ])
+
+for _model in SEARCH_FIELDS:
+    event.listen(_model, 'after_insert', _index_listener(_model))
+    event.listen(_model, 'after_update', _index_listener(_model))
+    event.listen(_model, 'after_delete', _unindex_listener(_model))
+
+# --- إنشاء الفهرس وإعادة بنائه ---
+_search_index_ready = False
+
+def _rebuild_table(model, name, fields):
+    db.session.execute(text(f"DELETE FROM {name}"))
+    statement = _upsert_statement(name, fields)
+    rows = db.session.query(model.id, *[getattr(model, field) for field in fields]).order_by(model.id)
+    batch, total = [], 0
+    for row in rows.yield_per(REBUILD_BATCH_SIZE):
+        batch.append(dict(zip(fields, map(normalize_arabic, row[1:])), rowid=row[0]))
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            db.session.execute(statement, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(statement, batch)
+        total += len(batch)
+    db.session.execute(text(f"INSERT INTO {name} ({name}) VALUES ('optimize')"))
+    return total
+
+def rebuild_search_index(models=None):
+    # يعيد بناء الفهرس من الجداول الأصلية (بعد الاستيراد المباشر أو التعديل خارج التطبيق)
+    counts = {}
+    for model in models or SEARCH_FIELDS:
+        for name, fields, _ in _index_tables(model):
+            counts[model.__name__] = _rebuild_table(model, name, fields)
+    db.session.commit()
+    return counts
+
+def ensure_search_index():
+    # إنشاء الجداول الافتراضية عند أول تشغيل، وبناء الفهرس للبيانات الموجودة مسبقاً
+    global _search_index_ready
+    if _search_index_ready or not search_enabled():
+        return
+    existing = {name for (name,) in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    created = []
+    for model in SEARCH_FIELDS:
+        for name, fields, tokenize in _index_tables(model):
+            if name in existing:
+                continue
+            db.session.execute(text(f"CREATE VIRTUAL TABLE {name} USING fts5({', '.join(fields)}, tokenize='{tokenize}')"))
+            created.append((model, name, fields))
+    db.session.commit()
+    for model, name, fields in created:
+        _rebuild_table(model, name, fields)
+    db.session.commit()
+    _search_index_ready = True
+
+# --- البحث ---
+def _ranked_matches(name, fields, match, weights):
+    fts = table(name, column('rowid'), *[column(field) for field in fields])
+    rank_source = literal_column(name)
+    return select(
+        fts.c.rowid.label('entity_id'),
+        func.bm25(rank_source, *weights, type_=Float).label('rank')
+    ).select_from(fts).where(rank_source.op('MATCH')(match))
+
+def apply_search(query, model, search_query):
+    # يعيد (الاستعلام بعد التصفية، عمود الترتيب حسب الصلة أو None)
+    if not search_enabled():
+        pattern = f'%{search_query}%'
+        fields = dict.fromkeys(SEARCH_FIELDS[model] + IDENTIFIER_FIELDS[model])
+        return query.filter(db.or_(*[getattr(model, field).ilike(pattern) for field in fields])), None
+    word_match, substring_match = build_match_query(search_query), build_substring_query(search_query)
+    matches = []
+    if word_match:
+        weights = [PRIMARY_FIELD_WEIGHT] + [1.0] * (len(SEARCH_FIELDS[model]) - 1)
+        matches.append(_ranked_matches(fts_table_name(model), SEARCH_FIELDS[model], word_match, weights))
+    if substring_match:
+        fields = IDENTIFIER_FIELDS[model]
+        matches.append(_ranked_matches(trigram_table_name(model), fields, substring_match, [1.0] * len(fields)))
+    if not matches:
+        return query, None
+    if len(matches) == 1:
+        ranked = matches[0].subquery()
+    else:
+        # السجل المطابق في الفهرسين يأخذ أفضل درجة (bm25 أصغر = أكثر صلة)
+        combined = union_all(*matches).subquery()
+        ranked = select(combined.c.entity_id, func.min(combined.c.rank).label('rank')).group_by(combined.c.entity_id).subquery()
+    return query.join(ranked, ranked.c.entity_id == model.id), ranked.c.rank
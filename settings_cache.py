@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from sqlalchemy import inspect
+from models import CompanySettings, SalarySettings
+
+# ذاكرة مؤقتة على مستوى العملية لإعدادات الشركة والرواتب: تُقرأ من قاعدة البيانات مرة واحدة
+# ثم تُعاد من الذاكرة. رقم الإصدار هو وقت تعديل ملف صغير في مجلد instance تلمسه أي عملية
+# عند حفظ الإعدادات، فتكتشف بقية العمليات (workers) التغيير بـ stat واحد دون أي استعلام.
+
+def _detached_copy(record):
+    mapper = inspect(type(record))
+    return mapper.class_(**{attr.key: getattr(record, attr.key) for attr in mapper.column_attrs})
+
+class SettingsCache:
+    def __init__(self):
+        self.version_file = None
+        self._version = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        os.makedirs(app.instance_path, exist_ok=True)
+        self.version_file = os.path.join(app.instance_path, 'settings.version')
+        if not os.path.exists(self.version_file):
+            self.invalidate()
+
+    def _current_version(self):
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def invalidate(self):
+        # يُستدعى بعد commit حفظ الإعدادات
+        with self._lock:
+            self._values = {}
+            self._version = None
+            if self.version_file:
+                with open(self.version_file, 'a'):
+                    pass
+                now = time.time_ns()
+                os.utime(self.version_file, ns=(now, now))
+
+    def get(self, model):
+        version = self._current_version()
+        with self._lock:
+            if version is None or version != self._version:
+                self._values = {}
+                self._version = version
+            if model in self._values:
+                return self._values[model]
+        record = model.query.first()
+        if record is None:
+            # لا يُخزن غياب السجل، ليظهر فور إنشائه
+            return None
+        # نسخة غير مرتبطة بالجلسة حتى لا تنتهي صلاحية حقولها مع commit أو انتهاء الطلب
+        record = _detached_copy(record)
+        with self._lock:
+            if self._version == version:
+                self._values[model] = record
+        return record
+
+settings_cache = SettingsCache()
+
+def get_company_settings():
+    return settings_cache.get(CompanySettings)
+
+def get_salary_settings():
+    return settings_cache.get(SalarySettings)
@@ -0,0 +1,214 @@
+from datetime import datetime, time, timedelta
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db
+from dashboard_metrics import add_to_metric
+
+# دفتر المخزون: قسيمة متعددة الأسطر (عدة مواد ومستودعات) تُنفذ في معاملة واحدة.
+# الصرف عبارة واحدة مشروطة UPDATE ... SET quantity = quantity - :q WHERE quantity >= :q
+# فلا يمكن لعمليتي صرف متزامنتين أن تمرا معاً بالتحقق وتجعلا الرصيد سالباً، والإضافة
+# INSERT ... ON CONFLICT DO UPDATE. حركات القسيمة تُكتب دفعة واحدة بعد نجاح كل الأسطر،
+# وإذا تعذر أي سطر تُلغى القسيمة كاملة ويُعاد سبب الرفض لكل سطر.
+# الأرصدة في تاريخ سابق: لقطة دورية لرصيد كل (مستودع، مادة) في جدول stock_snapshot، والرصيد في
+# أي يوم = أقرب لقطة قبله + الحركات بعدها فقط، فلا يُعاد تشغيل الدفتر كاملاً مهما طال.
+# الأيام بتوقيت UTC مثل created_at في الحركات، وكل لقطة تحفظ لحظة القطع (cutoff_at) التي حُسبت حتى
+# ما قبلها: لا تتجاوز الآن، فالحركات بعدها تُعاد من الدفتر ولا تضيع من أي رصيد لاحق.
+# مؤشر المواد منخفضة المخزون يُعدَّل بفرق أسطر القسيمة فقط (الرصيد قبل كل سطر وبعده) بدلاً من إعادة العدّ.
+# الجداول من db.metadata لأن نماذج المخزون معرفة في app.py.
+
+TRANSACTION_TYPES = ('in', 'out')
+SNAPSHOT_SETTLE = timedelta(minutes=5)  # مهلة لقسيمة بدأت قبل لحظة القطع ولم تُثبت بعد
+
+def _tables():
+    tables = db.metadata.tables
+    return tables['stock_item'], tables['stock_transaction']
+
+def _update_returning(connection, items, statement, key):
+    # الرصيد بعد التعديل، أو None إذا لم يُعدَّل أي صف
+    if connection.dialect.update_returning:
+        return connection.execute(statement.returning(items.c.quantity)).scalar_one_or_none()
+    if connection.execute(statement).rowcount == 0:
+        return None
+    return connection.execute(select(items.c.quantity).where(*key)).scalar_one()
+
+def _receive(connection, items, warehouse_id, material_id, quantity, now):
+    # يعيد (الرصيد بعد الإضافة، هل أُنشئ صف الرصيد)
+    key = (items.c.warehouse_id == warehouse_id, items.c.material_id == material_id)
+    balance = _update_returning(connection, items, items.update().where(*key).values(
+        quantity=items.c.quantity + quantity, last_updated=now
+    ), key)
+    if balance is not None:
+        return balance, False
+    # ON CONFLICT لقسيمة متزامنة أنشأت الصف بعد التعديل
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(items).values(
+        warehouse_id=warehouse_id, material_id=material_id, quantity=quantity, last_updated=now
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['warehouse_id', 'material_id'],
+        set_={'quantity': items.c.quantity + statement.excluded.quantity, 'last_updated': now}
+    ).returning(items.c.quantity)
+    return connection.execute(statement).scalar_one(), True
+
+def _issue(connection, items, warehouse_id, material_id, quantity, now):
+    # يعيد الرصيد بعد الصرف، أو None إذا لم يكن الرصيد كافياً
+    key = (items.c.warehouse_id == warehouse_id, items.c.material_id == material_id)
+    statement = items.update().where(*key, items.c.quantity >= quantity).values(
+        quantity=items.c.quantity - quantity, last_updated=now
+    )
+    return _update_returning(connection, items, statement, key)
+
+def _available(connection, items, warehouse_id, material_id):
+    return connection.execute(
+        select(items.c.quantity).where(items.c.warehouse_id == warehouse_id, items.c.material_id == material_id)
+    ).scalar() or 0
+
+def _missing_references(connection, lines):
+    tables = db.metadata.tables
+    warehouses = {line['warehouse_id'] for line in lines}
+    materials = {line['material_id'] for line in lines}
+    found_warehouses = set(connection.execute(select(tables['warehouse'].c.id).where(tables['warehouse'].c.id.in_(warehouses))).scalars())
+    # {المادة: الحد الأدنى للمخزون} للمواد الموجودة
+    found_materials = dict(connection.execute(
+        select(tables['material'].c.id, tables['material'].c.min_stock_level).where(tables['material'].c.id.in_(materials))
+    ).all())
+    return warehouses - found_warehouses, materials - found_materials.keys(), found_materials
+
+def _is_low(quantity, min_stock_level):
+    # نفس شرط مؤشر low_stock_items (المقارنة مع NULL لا تُعدّ)
+    return min_stock_level is not None and quantity <= min_stock_level
+
+def _line_error(line):
+    if line.get('transaction_type') not in TRANSACTION_TYPES:
+        return 'نوع الحركة غير صحيح.'
+    if not line.get('quantity') or line['quantity'] <= 0:
+        return 'الكمية يجب أن تكون أكبر من صفر.'
+    return None
+
+def post_voucher(lines, created_by_id=None):
+    # lines: [{'warehouse_id', 'material_id', 'transaction_type', 'quantity', 'reference', 'notes'}]
+    # يعيد (نجحت القسيمة، [{'ok', 'balance_after', 'error'}] بنفس ترتيب الأسطر)
+    if not lines:
+        return False, []
+    items, transactions = _tables()
+    connection = db.session.connection()
+    now = datetime.utcnow()
+    results = [{'ok': False, 'balance_after': None, 'error': _line_error(line)} for line in lines]
+    missing_warehouses, missing_materials, min_levels = _missing_references(connection, lines)
+    rows = {}
+    low_stock_delta = 0
+    # ترتيب ثابت لأقفال الصفوف (مستودع، مادة) حتى لا تتقاطع قسيمتان متزامنتان في قاعدة بيانات خادم
+    for index in sorted(range(len(lines)), key=lambda i: (lines[i]['warehouse_id'], lines[i]['material_id'])):
+        line, result = lines[index], results[index]
+        if result['error']:
+            continue
+        if line['warehouse_id'] in missing_warehouses or line['material_id'] in missing_materials:
+            result['error'] = 'المستودع أو المادة غير موجودة.'
+            continue
+        args = (connection, items, line['warehouse_id'], line['material_id'], line['quantity'], now)
+        min_level = min_levels[line['material_id']]
+        if line['transaction_type'] == 'in':
+            balance, created = _receive(*args)
+            was_low = not created and _is_low(balance - line['quantity'], min_level)
+        else:
+            balance = _issue(*args)
+            if balance is None:
+                available = _available(connection, items, line['warehouse_id'], line['material_id'])
+                result['error'] = f"الكمية المتوفرة {available:g} أقل من المطلوب {line['quantity']:g}."
+                continue
+            was_low = _is_low(balance + line['quantity'], min_level)
+        low_stock_delta += _is_low(balance, min_level) - was_low
+        result.update(ok=True, balance_after=balance)
+        rows[index] = {
+            'warehouse_id': line['warehouse_id'], 'material_id': line['material_id'],
+            'transaction_type': line['transaction_type'], 'quantity': line['quantity'], 'balance_after': balance,
+            'reference': line.get('reference'), 'notes': line.get('notes'),
+            'created_at': now, 'created_by_id': created_by_id
+        }
+    if not all(result['ok'] for result in results):
+        db.session.rollback()
+        for result in results:
+            result['balance_after'] = None
+            if result['ok']:
+                result.update(ok=False, error='أُلغي السطر لتعذر أسطر أخرى في القسيمة.')
+        return False, results
+    connection.execute(transactions.insert(), [rows[index] for index in sorted(rows)])
+    add_to_metric(connection, 'low_stock_items', low_stock_delta)
+    db.session.commit()
+    return True, results
+
+# --- الأرصدة في تاريخ سابق ---
+def _end_of_day(day):
+    return datetime.combine(day + timedelta(days=1), time.min)
+
+def snapshot_day():
+    # آخر يوم مكتمل بتوقيت UTC
+    return datetime.utcnow().date() - timedelta(days=1)
+
+def _quantities_until(connection, until, latest_base):
+    # {(مستودع، مادة): الرصيد من الحركات قبل until}، ابتداءً من آخر لقطة بتاريخ لا يتجاوز latest_base
+    tables = db.metadata.tables
+    snapshots, transactions = tables['stock_snapshot'], tables['stock_transaction']
+    base = connection.execute(
+        select(snapshots.c.snapshot_date, snapshots.c.cutoff_at).where(snapshots.c.snapshot_date <= latest_base)
+        .order_by(snapshots.c.snapshot_date.desc()).limit(1)
+    ).first()
+    quantities = {}
+    replay = select(
+        transactions.c.warehouse_id, transactions.c.material_id,
+        func.sum(case((transactions.c.transaction_type == 'in', transactions.c.quantity), else_=-transactions.c.quantity))
+    ).where(transactions.c.created_at < until)
+    if base is not None:
+        rows = connection.execute(
+            select(snapshots.c.warehouse_id, snapshots.c.material_id, snapshots.c.quantity)
+            .where(snapshots.c.snapshot_date == base.snapshot_date)
+        )
+        quantities = {(warehouse_id, material_id): quantity for warehouse_id, material_id, quantity in rows}
+        replay = replay.where(transactions.c.created_at >= base.cutoff_at)
+    for warehouse_id, material_id, change in connection.execute(replay.group_by(transactions.c.warehouse_id, transactions.c.material_id)):
+        quantities[(warehouse_id, material_id)] = quantities.get((warehouse_id, material_id), 0) + change
+    return quantities
+
+def take_stock_snapshot(snapshot_date):
+    # لقطة رصيد نهاية يوم snapshot_date (تُستبدل إن وُجدت)، ويعيد عدد الأسطر
+    snapshots = db.metadata.tables['stock_snapshot']
+    connection = db.session.connection()
+    now = datetime.utcnow()
+    cutoff = min(_end_of_day(snapshot_date), now - SNAPSHOT_SETTLE)
+    quantities = _quantities_until(connection, cutoff, snapshot_date - timedelta(days=1))
+    connection.execute(snapshots.delete().where(snapshots.c.snapshot_date == snapshot_date))
+    if quantities:
+        connection.execute(snapshots.insert(), [
+            {'snapshot_date': snapshot_date, 'warehouse_id': warehouse_id, 'material_id': material_id,
+             'quantity': quantity, 'cutoff_at': cutoff, 'created_at': now}
+            for (warehouse_id, material_id), quantity in sorted(quantities.items())
+        ])
+    db.session.commit()
+    return len(quantities)
+
+def stock_balances(as_of=None):
+    # أرصدة المخزون الحالية (as_of=None) أو في نهاية يوم معين، مع أسماء المستودعات والمواد
+    tables = db.metadata.tables
+    items, warehouses, materials = tables['stock_item'], tables['warehouse'], tables['material']
+    connection = db.session.connection()
+    if as_of is None:
+        quantities = {(w, m): q for w, m, q in connection.execute(
+            select(items.c.warehouse_id, items.c.material_id, items.c.quantity).order_by(items.c.id))}
+    else:
+        quantities = _quantities_until(connection, _end_of_day(as_of), as_of)
+    warehouse_names = dict(connection.execute(select(warehouses.c.id, warehouses.c.name)).all())
+    material_rows = {row.id: row for row in connection.execute(
+        select(materials.c.id, materials.c.name, materials.c.unit, materials.c.min_stock_level))}
+    balances = []
+    for (warehouse_id, material_id), quantity in quantities.items():
+        material = material_rows.get(material_id)
+        if material is None or warehouse_id not in warehouse_names:
+            continue
+        balances.append({
+            'warehouse_id': warehouse_id, 'material_id': material_id,
+            'warehouse_name': warehouse_names[warehouse_id], 'material_name': material.name,
+            'unit': material.unit, 'min_stock_level': material.min_stock_level or 0, 'quantity': quantity
+        })
+    if as_of is not None:
+        balances.sort(key=lambda b: (b['warehouse_name'], b['material_name']))
+    return balances
@@ -0,0 +1,72 @@
+import os
+import sys
+from datetime import date, timedelta
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# عدد السجلات التابعة لكل سجل في البذر: أكبر من حدود عدد العبارات عمداً حتى يظهر أي N+1
+SEED_CHILDREN = 20
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # التطبيق يُهيأ عند استيراده: قاعدة بيانات ومجلدات مؤقتة قبل import app
+    base = tmp_path_factory.mktemp('app')
+    import config
+    config.Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{base / 'test.db'}"
+    config.Config.UPLOAD_FOLDER = str(base / 'uploads')
+    config.Config.BACKUP_FOLDER = str(base / 'backups')
+    config.Config.AUDIT_ASYNC = False
+    from app import app
+    app.config['TESTING'] = True
+    with app.app_context():
+        seed(SEED_CHILDREN)
+    return app
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return client
+
+def seed(children):
+    from app import db, Warehouse, Material
+    from models import (User, Car, CarFile, MaintenanceRecord, Employee, EmployeeFile, EmployeeSalary, Document, DocumentFile,
+                        Equipment, FuelRecord, EquipmentMaintenance, PayrollRecord, AuditLog)
+    from stock_ledger import post_voucher
+    today = date.today()
+    admin = User(username='admin', email='admin@example.com', role='admin')
+    admin.set_password('admin123')
+    db.session.add(admin)
+    # صفوف كثيرة في كل قائمة، والسجلات التابعة للصف الأول منها
+    cars = [Car(chassis_number=f'CH-{i}', brand='تويوتا', model='هايلكس', status='active') for i in range(children)]
+    employees = [Employee(national_id=f'{i:011d}', full_name=f'موظف {i}') for i in range(children)]
+    documents = [Document(title=f'وثيقة {i}', expiry_date=today + timedelta(days=i)) for i in range(children)]
+    equipment_list = [Equipment(equipment_type='قلاب', brand='مان', model='TGS', chassis_number=f'EQ-{i}', status='active',
+                                current_km=1000) for i in range(children)]
+    db.session.add_all([*cars, *documents, *equipment_list, *employees])
+    db.session.flush()
+    car, document, equipment = cars[0], documents[0], equipment_list[0]
+    for i in range(children):
+        day = today - timedelta(days=i)
+        db.session.add_all([
+            CarFile(filename=f'{i}.pdf', filepath=f'{i}.pdf', file_type='pdf', car_id=car.id),
+            MaintenanceRecord(car_id=car.id, maintenance_type='محرك', date=day, cost=100),
+            EmployeeFile(filename=f'{i}.pdf', filepath=f'{i}.pdf', file_type='pdf', employee_id=employees[0].id),
+            DocumentFile(filename=f'{i}.pdf', filepath=f'{i}.pdf', file_type='pdf', document_id=document.id),
+            FuelRecord(equipment_id=equipment.id, date=day, quantity=50, price_per_liter=2, total_cost=100, current_km=1000 + i * 100),
+            EquipmentMaintenance(equipment_id=equipment.id, maintenance_type='دورية', date=day, current_km=1000 + i * 100),
+            EmployeeSalary(employee_id=employees[i].id, base_salary=3000),
+            PayrollRecord(employee_id=employees[i].id, week_number=1, year=today.year, net_salary=500),
+            AuditLog(user_id=admin.id, username=admin.username, action='update', entity_type='Car', entity_id=car.id),
+        ])
+    warehouses = [Warehouse(name=f'مستودع {i}') for i in range(children)]
+    material = Material(name='إسمنت', unit='طن', min_stock_level=1)
+    db.session.add_all([*warehouses, material])
+    db.session.commit()
+    ok, results = post_voucher([
+        {'warehouse_id': warehouse.id, 'material_id': material.id, 'transaction_type': 'in', 'quantity': 10}
+        for warehouse in warehouses
+    ], created_by_id=admin.id)
+    assert ok, results
@@ -0,0 +1,76 @@
+import threading
+from audit import AuditWriter
+from models import AuditLog
+
+# flush تحت الضغط: الأحداث تصل باستمرار من خيوط أخرى، و flush ينتظر فقط ما كان في الطابور لحظة استدعائه
+def test_flush_returns_while_events_keep_arriving(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUDIT_ASYNC', True)
+    monkeypatch.setitem(app.config, 'AUDIT_BATCH_SIZE', 10)
+    monkeypatch.setitem(app.config, 'AUDIT_QUEUE_SIZE', 2000)
+    writer = AuditWriter()
+    writer.init_app(app)
+    stop = threading.Event()
+
+    def produce():
+        while not stop.is_set():
+            writer.log({'username': 'load', 'action': 'test', 'entity_type': 'AuditLoad'})
+
+    producers = [threading.Thread(target=produce) for _ in range(2)]
+    for producer in producers:
+        producer.start()
+    try:
+        writer.log({'username': 'flush', 'action': 'test', 'entity_type': 'AuditFlush'})
+        flushing = threading.Thread(target=writer.flush, daemon=True)
+        flushing.start()
+        flushing.join(timeout=30)
+        assert not flushing.is_alive()
+    finally:
+        stop.set()
+        for producer in producers:
+            producer.join()
+        writer.shutdown()
+    with app.app_context():
+        assert AuditLog.query.filter_by(entity_type='AuditFlush').count() == 1
+
+def _failing_once(writer):
+    write, calls = writer._write, []
+
+    def flaky(events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        write(events)
+    return flaky, calls
+
+# دفعة فشلت كتابتها مرة واحدة تُكتب في المحاولة التالية ولا يضيع منها حدث
+def test_failed_batch_is_retried(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUDIT_ASYNC', False)
+    monkeypatch.setitem(app.config, 'AUDIT_RETRY_DELAY', 0)
+    writer = AuditWriter()
+    writer.init_app(app)
+    flaky, calls = _failing_once(writer)
+    monkeypatch.setattr(writer, '_write', flaky)
+    writer._process([{'username': 'retry', 'action': 'test', 'entity_type': 'AuditRetry'} for _ in range(3)])
+    assert calls == [3, 3]
+    with app.app_context():
+        assert AuditLog.query.filter_by(entity_type='AuditRetry').count() == 3
+
+# ما بقي بعد كل المحاولات يُحفظ في ملف ويُدخل عند التشغيل التالي
+def test_unwritten_events_spill_to_file(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'AUDIT_ASYNC', False)
+    monkeypatch.setitem(app.config, 'AUDIT_RETRY_DELAY', 0)
+    monkeypatch.setitem(app.config, 'AUDIT_SPILL_PATH', str(tmp_path / 'audit_spill.jsonl'))
+    writer = AuditWriter()
+    writer.init_app(app)
+
+    def broken(events):
+        raise RuntimeError('disk I/O error')
+
+    monkeypatch.setattr(writer, '_write', broken)
+    writer.log({'username': 'spill', 'action': 'test', 'entity_type': 'AuditSpill'})
+    assert (tmp_path / 'audit_spill.jsonl').exists()
+    monkeypatch.undo()
+    assert writer.recover_spill() == 1
+    assert not (tmp_path / 'audit_spill.jsonl').exists()
+    with app.app_context():
+        assert AuditLog.query.filter_by(entity_type='AuditSpill').count() == 1
@@ -0,0 +1,56 @@
+import io
+import os
+from file_store import file_store
+from models import db, Car, CarFile, StoredFile
+
+# المحتوى المكرر يُخزن مرة واحدة و ref_count يتبع سجلات الملفات، و collect_garbage يحذف فقط المحتوى
+# الذي حذف صفه فعلاً
+def _attach(car, content):
+    content_hash = file_store.save(io.BytesIO(content))
+    record = CarFile(filename='scan.pdf', filepath=file_store.path(content_hash), file_type='pdf',
+                     car_id=car.id, content_hash=content_hash)
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+def test_duplicate_uploads_share_content(app):
+    with app.app_context():
+        car = Car.query.first()
+        first, second = _attach(car, b'same scan'), _attach(car, b'same scan')
+        content_hash = first.content_hash
+        assert second.content_hash == content_hash
+        assert StoredFile.query.filter_by(content_hash=content_hash).count() == 1
+        assert db.session.get(StoredFile, content_hash).ref_count == 2
+        with open(file_store.path(content_hash), 'rb') as stored:
+            assert stored.read() == b'same scan'
+
+        db.session.delete(first)
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(StoredFile, content_hash).ref_count == 1
+        file_store.collect_garbage(grace_seconds=0)
+        assert os.path.exists(file_store.path(content_hash))
+
+        db.session.delete(second)
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(StoredFile, content_hash).ref_count == 0
+        assert file_store.collect_garbage(grace_seconds=0) >= 1
+        assert db.session.get(StoredFile, content_hash) is None
+        assert not os.path.exists(file_store.path(content_hash))
+
+def test_garbage_collection_keeps_content_inside_grace_period(app):
+    with app.app_context():
+        record = _attach(Car.query.first(), b'recent scan')
+        content_hash = record.content_hash
+        db.session.delete(record)
+        db.session.commit()
+        file_store.collect_garbage()
+        db.session.expire_all()
+        assert db.session.get(StoredFile, content_hash) is not None
+        assert os.path.exists(file_store.path(content_hash))
+        # إعادة رفع نفس المحتوى بعد انتهاء ref_count يعيد استخدام الصف والملف
+        again = _attach(Car.query.first(), b'recent scan')
+        assert again.content_hash == content_hash
+        file_store.collect_garbage(grace_seconds=0)
+        assert os.path.exists(file_store.path(content_hash))
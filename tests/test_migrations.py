@@ -0,0 +1,84 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+from conftest import ROOT
+
+# ترقية قاعدة البيانات المرفقة مع المستودع (instance/archive2.db، قبل أي ترحيل) بتشغيل التطبيق عليها:
+# كل الترحيلات تُنفذ بالترتيب وتنتهي كل فهارس النماذج موجودة
+UPGRADE_SCRIPT = '''
+import sys
+sys.path.insert(0, {root!r})
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + {database!r}
+config.Config.UPLOAD_FOLDER = {uploads!r}
+config.Config.BACKUP_FOLDER = {backups!r}
+config.Config.AUDIT_ASYNC = False
+from sqlalchemy import inspect
+from app import app, db
+from bootstrap import MIGRATIONS, current_schema_version
+with app.app_context():
+    assert current_schema_version() == MIGRATIONS[-1][0], current_schema_version()
+    inspector = inspect(db.engine)
+    existing = {{index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}}
+    missing = sorted(index.name for table in db.metadata.sorted_tables for index in table.indexes if index.name not in existing)
+    assert not missing, missing
+'''
+
+def test_upgrade_from_baseline_database(tmp_path):
+    database = str(tmp_path / 'archive2.db')
+    shutil.copy(os.path.join(ROOT, 'instance', 'archive2.db'), database)
+    script = UPGRADE_SCRIPT.format(root=ROOT, database=database, uploads=str(tmp_path / 'uploads'), backups=str(tmp_path / 'backups'))
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-4000:]
+
+# التكرار في الحضور لا يُحذف: الترحيل يتوقف ويعرض (الموظف، اليوم) والسجلات
+def test_attendance_duplicates_stop_upgrade(tmp_path):
+    database = str(tmp_path / 'archive2.db')
+    shutil.copy(os.path.join(ROOT, 'instance', 'archive2.db'), database)
+    with sqlite3.connect(database) as connection:
+        employee_id, day = connection.execute('SELECT employee_id, date FROM attendance_record').fetchone()
+        connection.execute("INSERT INTO attendance_record (employee_id, date, status, week_number, year) "
+                           "SELECT employee_id, date, 'absent', week_number, year FROM attendance_record")
+    script = UPGRADE_SCRIPT.format(root=ROOT, database=database, uploads=str(tmp_path / 'uploads'), backups=str(tmp_path / 'backups'))
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, capture_output=True, text=True, timeout=300)
+    assert result.returncode != 0
+    assert f'الموظف {employee_id} بتاريخ {day}' in result.stderr
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM attendance_record').fetchone()[0] == 2
+
+# قاعدة بيانات جديدة تبدأ من المخطط الأول المجمد (schema_baseline) وتنتهي بعد الترحيلات بكل جداول النماذج
+# وأعمدتها وفهارسها
+def test_fresh_database_has_model_schema(app):
+    from sqlalchemy import inspect
+    from app import db
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            assert inspector.has_table(table.name), table.name
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            assert set(table.c.keys()) <= columns, (table.name, set(table.c.keys()) - columns)
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            assert {index.name for index in table.indexes} <= indexes, table.name
+
+# عملية أخرى أضافت العمود بين الفحص و ALTER: الخطأ لا يوقف الترحيل ما دام العمود موجوداً
+def test_add_column_tolerates_concurrent_add(app, monkeypatch):
+    import bootstrap
+    from app import db
+    with app.app_context():
+        db.session.execute(db.text('CREATE TABLE add_column_race (id INTEGER PRIMARY KEY, flag INTEGER)'))
+        db.session.commit()
+        existing_columns = bootstrap._existing_columns
+        checks = []
+
+        def stale_first_check(table_name):
+            checks.append(table_name)
+            return set() if len(checks) == 1 else existing_columns(table_name)
+
+        monkeypatch.setattr(bootstrap, '_existing_columns', stale_first_check)
+        bootstrap.add_column('add_column_race', 'flag INTEGER')
+        assert len(checks) == 2
+        monkeypatch.undo()
+        db.session.execute(db.text('DROP TABLE add_column_race'))
+        db.session.commit()
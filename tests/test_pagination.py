@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from models import db, AuditLog
+from pagination import keyset_paginate
+
+# المرور على كل الصفحات للأمام ثم للخلف بمفتاح ترتيب فيه قيم فارغة (NULL) وقيم مكررة:
+# كل صف يظهر مرة واحدة وبنفس ترتيب الاستعلام الكامل
+ROWS = 23
+PER_PAGE = 4
+
+def _insert_logs():
+    start = datetime(2024, 1, 1)
+    # كل ثالث صف بلا وقت، والباقي أوقات تتكرر كل صفين
+    db.session.execute(AuditLog.__table__.insert(), [
+        {'username': 'pagination', 'action': 'test', 'entity_type': 'KeysetPage',
+         'timestamp': None if i % 3 == 0 else start + timedelta(hours=i // 2)}
+        for i in range(ROWS)
+    ])
+    db.session.commit()
+
+def _walk(query, keys):
+    pages, page = [], keyset_paginate(query, keys, per_page=PER_PAGE)
+    pages.append(page)
+    while page.has_next:
+        page = keyset_paginate(query, keys, after=page.next_cursor, per_page=PER_PAGE)
+        pages.append(page)
+    forward = [log.id for page in pages for log in page]
+    backward = []
+    while page.has_prev:
+        page = keyset_paginate(query, keys, before=page.prev_cursor, per_page=PER_PAGE)
+        backward = [log.id for log in page] + backward
+    return forward, backward + [log.id for log in pages[-1]]
+
+def _expected(descending):
+    logs = AuditLog.query.filter_by(entity_type='KeysetPage').all()
+    # NULL أصغر من كل القيم
+    logs.sort(key=lambda log: (log.timestamp is not None, log.timestamp or datetime.min, log.id), reverse=descending)
+    return [log.id for log in logs]
+
+def test_keyset_pages_with_null_sort_values(app):
+    with app.app_context():
+        _insert_logs()
+        query = AuditLog.query.filter_by(entity_type='KeysetPage')
+        for descending in (False, True):
+            keys = [(AuditLog.timestamp, descending), (AuditLog.id, descending)]
+            forward, backward = _walk(query, keys)
+            expected = _expected(descending)
+            assert len(expected) == ROWS
+            assert forward == expected
+            assert backward == expected
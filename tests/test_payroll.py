@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+import pytest
+from benchmarks.bench_payroll import legacy_payroll
+from models import (db, Employee, EmployeeSalary, SalarySettings, AttendanceRecord, OvertimeRecord, AdvancePayment,
+                    PayrollRecord)
+from payroll import run_weekly_payroll, PAYROLL_COLUMNS
+
+# المحرك المجمع يعطي نفس سجلات الرواتب التي تعطيها الحلقة القديمة لكل موظف (benchmarks/bench_payroll.py)،
+# في الإدخال ثم في التحديث بعد تعديل الحضور، مع كل حالات معلومات الراتب
+WEEK_START = date(2025, 9, 8)
+WEEK_NUMBER, YEAR = WEEK_START.isocalendar()[1], WEEK_START.year
+
+# (الراتب الأساسي، الأجر اليومي) لكل موظف، و None بدون معلومات راتب
+SALARIES = [(0, 110.0), (3120.0, None), (2600.0, 95.5), (0, None), None, [(0, 80.0), (2600.0, None)]]
+STATUSES = ['present', 'present', 'absent', 'half_day', 'present', 'half_day']
+
+def _seed_week():
+    employees = [Employee(national_id=f'7700{i:07d}', full_name=f'موظف الرواتب {i}', status='active') for i in range(len(SALARIES))]
+    inactive = Employee(national_id='77009999999', full_name='موظف غير نشط', status='inactive')
+    db.session.add_all(employees + [inactive])
+    db.session.flush()
+    for index, (employee, salary) in enumerate(zip(employees + [inactive], SALARIES + [(0, 100.0)])):
+        for base_salary, daily_wage in (salary if isinstance(salary, list) else [salary] if salary else []):
+            db.session.add(EmployeeSalary(employee_id=employee.id, base_salary=base_salary, daily_wage=daily_wage))
+        for day, status in enumerate(STATUSES[index % 3:]):
+            db.session.add(AttendanceRecord(employee_id=employee.id, date=WEEK_START + timedelta(days=day), status=status,
+                                            week_number=WEEK_NUMBER, year=YEAR))
+        db.session.add_all([
+            OvertimeRecord(employee_id=employee.id, date=WEEK_START, overtime_type='daily', quantity=0.5 * index,
+                           week_number=WEEK_NUMBER, year=YEAR),
+            OvertimeRecord(employee_id=employee.id, date=WEEK_START, overtime_type='hourly', quantity=1.5,
+                           week_number=WEEK_NUMBER, year=YEAR),
+            AdvancePayment(employee_id=employee.id, amount=25.0 * index, payment_date=WEEK_START, is_paid=False),
+            AdvancePayment(employee_id=employee.id, amount=999.0, payment_date=WEEK_START, is_paid=True),
+        ])
+    db.session.commit()
+    return employees
+
+def _week_rows():
+    rows = db.session.query(PayrollRecord.employee_id, *[getattr(PayrollRecord, c) for c in PAYROLL_COLUMNS]).filter(
+        PayrollRecord.week_number == WEEK_NUMBER, PayrollRecord.year == YEAR).order_by(PayrollRecord.employee_id).all()
+    return [tuple(row) for row in rows]
+
+def _clear_week():
+    PayrollRecord.query.filter_by(week_number=WEEK_NUMBER, year=YEAR).delete()
+    db.session.commit()
+
+def _assert_same(rows, expected):
+    assert [row[0] for row in rows] == [row[0] for row in expected]
+    for row, legacy in zip(rows, expected):
+        assert row == pytest.approx(legacy)
+
+def test_engine_matches_legacy_loop(app):
+    with app.app_context():
+        if SalarySettings.query.first() is None:
+            db.session.add(SalarySettings())
+            db.session.commit()
+        salary_settings = SalarySettings.query.first()
+        employees = _seed_week()
+
+        legacy_payroll(WEEK_NUMBER, YEAR, salary_settings)
+        expected = _week_rows()
+        _clear_week()
+        inserted, updated, skipped = run_weekly_payroll(WEEK_NUMBER, YEAR, salary_settings)
+        db.session.commit()
+        assert updated == 0 and inserted == len(expected)
+        assert 'موظف الرواتب 4' in skipped
+        _assert_same(_week_rows(), expected)
+
+        # مسار التحديث: تعديل الحضور ثم إعادة الحساب على سجلات الأسبوع الموجودة
+        AttendanceRecord.query.filter_by(employee_id=employees[0].id, week_number=WEEK_NUMBER, year=YEAR).update({'status': 'absent'})
+        db.session.commit()
+        legacy_payroll(WEEK_NUMBER, YEAR, salary_settings)
+        expected = _week_rows()
+        inserted, updated, _ = run_weekly_payroll(WEEK_NUMBER, YEAR, salary_settings)
+        db.session.commit()
+        assert inserted == 0 and updated == len(expected)
+        _assert_same(_week_rows(), expected)
+        _clear_week()
+        # سجل الراتب الثاني يخص هذا الاختبار فقط (صفحة الرواتب تتوقع سجلاً واحداً لكل موظف)
+        EmployeeSalary.query.filter_by(employee_id=employees[-1].id, daily_wage=None).delete()
+        db.session.commit()
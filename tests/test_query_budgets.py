@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import event
+from pdf_service import pdf_service
+
+# عدد عبارات SQL لكل صفحة على قاعدة البيانات المبذورة (عدة سجلات تابعة لكل سجل). تجاوز الحد يعني تحميلاً
+# كسولاً لكل صف (N+1). الحد بعد تسخين ذاكرة الإعدادات والإشعارات، ويشمل تحميل المستخدم مع عبارة احتياطية واحدة.
+BUDGETS = {
+    '/': 5,
+    '/cars': 3,
+    '/employees': 3,
+    '/documents': 4,
+    '/equipment': 3,
+    '/audit': 3,
+    '/cars/1': 5,
+    '/cars/1/pdf': 4,
+    '/employees/1': 4,
+    '/documents/1': 4,
+    '/equipment/1': 6,
+    '/salary/employees': 3,
+    '/salary/payroll': 3,
+    '/salary/payroll/1': 3,
+    '/inventory/material/1': 4,
+}
+
+@pytest.fixture
+def statements(app, client, monkeypatch):
+    from app import db
+    # wkhtmltopdf قد لا يكون مثبتاً: عدد العبارات لا يتأثر بتوليد الملف نفسه
+    monkeypatch.setattr(pdf_service, '_render', lambda html, options: b'%PDF-1.4')
+    client.get('/')
+    with app.app_context():
+        engine = db.engine
+    executed = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', capture)
+
+@pytest.mark.parametrize('path', list(BUDGETS))
+def test_query_budget(client, statements, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert len(statements) <= BUDGETS[path], [' '.join(statement.split())[:150] for statement in statements]
@@ -0,0 +1,22 @@
+import pytest
+from query_plans import HOT_PATHS, check_query_plans, is_full_scan
+
+def test_full_scan_detection():
+    assert is_full_scan('SCAN employee_salary')
+    assert not is_full_scan('SCAN audit_log USING INDEX ix_audit_log_timestamp')
+    assert not is_full_scan('SEARCH car USING INTEGER PRIMARY KEY (rowid=?)')
+    assert not is_full_scan('SCAN company_settings')
+    assert not is_full_scan('SCAN employee', full_reads=('employee',))
+
+@pytest.fixture(scope='module')
+def plans(app):
+    with app.app_context():
+        return check_query_plans(app)
+
+# كل استعلام ينفذه المسار يستخدم فهرساً (خطته بلا SCAN على جدول كامل)
+@pytest.mark.parametrize('name', list(HOT_PATHS))
+def test_hot_path_uses_indexes(plans, name):
+    status, statements, scans = plans[name]
+    assert status == 200
+    assert statements
+    assert not scans, [(' '.join(statement.split())[:150], plan) for statement, plan in statements]
@@ -0,0 +1,51 @@
+from models import db, Car, Document, Employee
+from search import apply_search
+
+# البحث النصي: مطابقة من وسط المعرفات، توحيد الكتابة العربية، ترتيب الصلة، وتحديث الفهرس مع كل تعديل
+def _search(model, text):
+    query, rank = apply_search(model.query, model, text)
+    if rank is not None:
+        query = query.order_by(rank, model.id)
+    return [record.id for record in query]
+
+def test_substring_of_identifier_matches(app):
+    with app.app_context():
+        car = Car(chassis_number='JTFQX7ZK5512', plate_number='4471839', brand='نيسان', model='باترول')
+        employee = Employee(national_id='29803150112233', full_name='سالم يوسف', phone='0599123456')
+        db.session.add_all([car, employee])
+        db.session.commit()
+        assert car.id in _search(Car, 'x7zk55')
+        assert car.id in _search(Car, '71839')
+        assert car.id in _search(Car, car.unique_id.split('-')[-1])
+        assert employee.id in _search(Employee, '91234')
+        # أقصر من 3 أحرف: بادئة الكلمات فقط
+        assert car.id in _search(Car, 'با')
+        assert car.id not in _search(Car, '7z')
+
+def test_arabic_normalization_and_ranking(app):
+    with app.app_context():
+        in_title = Document(title='عقد إيجار المستودع', notes='')
+        in_notes = Document(title='مراسلة', notes='مرفق عقد ايجار المحل')
+        db.session.add_all([in_notes, in_title])
+        db.session.commit()
+        results = _search(Document, 'ايجار')
+        assert results.index(in_title.id) < results.index(in_notes.id)
+        assert in_title.id in _search(Document, 'إيجَار')
+
+def test_index_follows_updates_and_deletes(app):
+    with app.app_context():
+        car = Car(chassis_number='QWE-UPKEEP-1', brand='مازدا', model='بونجو')
+        db.session.add(car)
+        db.session.commit()
+        assert car.id in _search(Car, 'مازدا')
+        car.brand = 'ميتسوبيشي'
+        car.chassis_number = 'ZXC-UPKEEP-2'
+        db.session.commit()
+        assert car.id not in _search(Car, 'مازدا')
+        assert car.id not in _search(Car, 'QWE-UPKEEP')
+        assert car.id in _search(Car, 'ميتسوبيشي')
+        assert car.id in _search(Car, 'C-UPKEEP-2')
+        db.session.delete(car)
+        db.session.commit()
+        assert car.id not in _search(Car, 'ميتسوبيشي')
+        assert car.id not in _search(Car, 'C-UPKEEP-2')
@@ -0,0 +1,52 @@
+import threading
+from models import db, Car, IdCounter, reserve_sequential_numbers
+
+# عدة خيوط تحجز أرقاماً في نفس الوقت (مفردة ودفعات، ومن عداد غير موجود بعد): لا يتكرر رقم ولا تبقى فجوة
+THREADS = 4
+RESERVATIONS = 15
+FUTURE_YEAR = 2099  # سنة بلا عداد حتى تتسابق الخيوط على إنشاء الصف الأول
+
+def _reserve(app, thread_index, reserved, errors):
+    try:
+        with app.app_context():
+            for i in range(RESERVATIONS):
+                count = 1 + (thread_index + i) % 3
+                first = reserve_sequential_numbers(db.session.connection(), 'CAR', count, FUTURE_YEAR)
+                db.session.commit()
+                reserved.extend(range(first, first + count))
+    except Exception as e:
+        errors.append(e)
+
+def _insert_cars(app, thread_index, unique_ids, errors):
+    try:
+        with app.app_context():
+            for i in range(RESERVATIONS):
+                car = Car(chassis_number=f'SEQ-{thread_index}-{i}', brand='هيونداي', model='اتش 100')
+                db.session.add(car)
+                db.session.commit()
+                unique_ids.append(car.unique_id)
+    except Exception as e:
+        errors.append(e)
+
+def _run(target, app, results, errors):
+    threads = [threading.Thread(target=target, args=(app, i, results, errors)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+def test_concurrent_reservations_are_unique_and_contiguous(app):
+    reserved, errors = [], []
+    _run(_reserve, app, reserved, errors)
+    assert sorted(reserved) == list(range(1, len(reserved) + 1))
+    with app.app_context():
+        assert db.session.get(IdCounter, ('CAR', FUTURE_YEAR)).last_value == len(reserved)
+
+def test_concurrent_inserts_get_distinct_ids(app):
+    unique_ids, errors = [], []
+    _run(_insert_cars, app, unique_ids, errors)
+    assert len(unique_ids) == THREADS * RESERVATIONS
+    assert len(set(unique_ids)) == len(unique_ids)
+    numbers = sorted(int(unique_id.split('-')[-1]) for unique_id in unique_ids)
+    assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
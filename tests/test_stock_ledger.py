@@ -0,0 +1,107 @@
+import random
+import threading
+from sqlalchemy import func, select
+from stock_ledger import post_voucher
+
+# عدة خيوط ترسل قسائم في نفس الوقت على نفس المواد (الطلب الكلي أكبر من المتوفر)، ثم:
+# لا رصيد سالب، ولا تعديل ضائع (الرصيد = مجموع الحركات المسجلة)، وآخر balance_after يساوي الرصيد
+THREADS = 4
+VOUCHERS = 20
+INITIAL_STOCK = 50
+
+def _post_vouchers(app, seed_value, warehouse_ids, material_ids, counts, errors):
+    rng = random.Random(seed_value)
+    try:
+        with app.app_context():
+            for _ in range(VOUCHERS):
+                # قسيمة من 1-4 أسطر: صرف في الغالب وبعض الإضافات
+                lines = [{'warehouse_id': rng.choice(warehouse_ids), 'material_id': rng.choice(material_ids),
+                          'transaction_type': 'out' if rng.random() < 0.8 else 'in', 'quantity': rng.randint(1, 5)}
+                         for _ in range(rng.randint(1, 4))]
+                ok, _ = post_voucher(lines)
+                counts[ok] += 1
+    except Exception as e:
+        errors.append(e)
+
+def test_concurrent_vouchers_lose_no_updates(app):
+    from app import db, Warehouse, Material, StockItem, StockTransaction
+    with app.app_context():
+        warehouses = [Warehouse(name=f'مستودع التزامن {i}') for i in range(2)]
+        materials = [Material(name=f'مادة التزامن {i}', unit='طن', min_stock_level=10) for i in range(2)]
+        db.session.add_all(warehouses + materials)
+        db.session.commit()
+        warehouse_ids, material_ids = [w.id for w in warehouses], [m.id for m in materials]
+        ok, _ = post_voucher([
+            {'warehouse_id': w, 'material_id': m, 'transaction_type': 'in', 'quantity': INITIAL_STOCK}
+            for w in warehouse_ids for m in material_ids
+        ])
+        assert ok
+
+    counts, errors = {True: 0, False: 0}, []
+    threads = [threading.Thread(target=_post_vouchers, args=(app, i, warehouse_ids, material_ids, counts, errors))
+               for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert counts[True] + counts[False] == THREADS * VOUCHERS
+    assert counts[True] and counts[False]
+
+    with app.app_context():
+        items = StockItem.query.filter(StockItem.warehouse_id.in_(warehouse_ids), StockItem.material_id.in_(material_ids)).all()
+        assert len(items) == len(warehouse_ids) * len(material_ids)
+        for item in items:
+            key = (StockTransaction.warehouse_id == item.warehouse_id, StockTransaction.material_id == item.material_id)
+            totals = dict(db.session.execute(
+                select(StockTransaction.transaction_type, func.sum(StockTransaction.quantity)).where(*key)
+                .group_by(StockTransaction.transaction_type)
+            ).all())
+            last = StockTransaction.query.filter(*key).order_by(StockTransaction.id.desc()).first()
+            assert item.quantity >= 0
+            assert item.quantity == totals.get('in', 0) - totals.get('out', 0)
+            assert last.balance_after == item.quantity
+
+# حركة بعد أخذ لقطة اليوم (كما يحدث عندما يسبق توقيت الخادم UTC ويكون نهاية اليوم في المستقبل) تظهر في
+# رصيد ذلك اليوم وما بعده
+def test_movement_after_snapshot_counted_in_balances(app):
+    from datetime import datetime, timedelta
+    from app import db, Warehouse, Material
+    from stock_ledger import take_stock_snapshot, stock_balances
+    with app.app_context():
+        warehouse = Warehouse(name='مستودع اللقطة')
+        material = Material(name='مادة اللقطة', unit='طن', min_stock_level=1)
+        db.session.add_all([warehouse, material])
+        db.session.commit()
+        key = (warehouse.id, material.id)
+        line = {'warehouse_id': warehouse.id, 'material_id': material.id, 'transaction_type': 'in', 'quantity': 10}
+        assert post_voucher([line])[0]
+        today = datetime.utcnow().date()
+        take_stock_snapshot(today)
+        assert post_voucher([dict(line, quantity=5)])[0]
+
+        def balance(as_of):
+            return {(b['warehouse_id'], b['material_id']): b['quantity'] for b in stock_balances(as_of)}[key]
+
+        assert balance(today) == 15
+        assert balance(today + timedelta(days=1)) == 15
+        assert balance(None) == 15
+
+# مؤشر المواد منخفضة المخزون يُعدَّل بفرق القسيمة: صف جديد، وعبور الحد الأدنى صعوداً ونزولاً، وقسيمة مرفوضة
+def test_low_stock_metric_follows_vouchers(app):
+    from app import db, Warehouse, Material
+    from dashboard_metrics import get_metrics, recompute_metrics
+    with app.app_context():
+        recompute_metrics()
+        start = get_metrics()['low_stock_items']
+        warehouse = Warehouse(name='مستودع المؤشر')
+        material = Material(name='مادة المؤشر', unit='طن', min_stock_level=10)
+        db.session.add_all([warehouse, material])
+        db.session.commit()
+        line = {'warehouse_id': warehouse.id, 'material_id': material.id, 'transaction_type': 'in', 'quantity': 5}
+        steps = [(line, 1), (dict(line, quantity=20), 0), (dict(line, transaction_type='out', quantity=15), 1),
+                 (dict(line, transaction_type='out', quantity=100), 1), (dict(line, quantity=1), 0)]
+        for voucher_line, low in steps:
+            post_voucher([voucher_line])
+            assert get_metrics()['low_stock_items'] == start + low
+        assert recompute_metrics() == {}
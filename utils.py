@@ -1,30 +1,30 @@
-import os
 from werkzeug.utils import secure_filename
-from datetime import datetime
 from flask import url_for
 
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
-def save_file(file, upload_dir, prefix=""):
+def save_file(file):
+    # يُخزن المحتوى مرة واحدة في مخزن الملفات (file_store.py)؛ يعيد (اسم العرض، المسار، sha256)
     if file and allowed_file(file.filename, {'png', 'jpg', 'jpeg', 'pdf'}):
+        from file_store import file_store
+        content_hash = file_store.save(file.stream)
+        extension = file.filename.rsplit('.', 1)[1].lower()
         filename = secure_filename(file.filename)
-        unique_filename = f"{prefix}_{int(datetime.now().timestamp())}_{filename}"
-        filepath = os.path.join(upload_dir, unique_filename)
-        os.makedirs(upload_dir, exist_ok=True)
-        file.save(filepath)
-        return unique_filename, filepath
-    return None, None
+        if not filename.lower().endswith('.' + extension):
+            # secure_filename يحذف الحروف العربية فلا يبقى إلا الامتداد
+            filename = f"{content_hash[:12]}.{extension}"
+        return filename, file_store.path(content_hash), content_hash
+    return None, None, None
 
 def log_activity(user, action, entity_type, entity_id=None, details=""):
-    from models import AuditLog, db
-    log = AuditLog(
+    # يُكتب لاحقاً على دفعات من خيط في الخلفية (audit.py) بدلاً من commit منفصل لكل حدث
+    from audit import audit_writer
+    audit_writer.log(dict(
         user_id=user.id if user else None,
         username=user.username if user else "system",
         action=action,
         entity_type=entity_type,
         entity_id=entity_id,
         details=details
-    )
-    db.session.add(log)
-    db.session.commit()
\ No newline at end of file
+    ))
\ No newline at end of file